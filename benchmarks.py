@@ -0,0 +1,382 @@
+"""Headless benchmarks for the speed typing test.
+
+Run all benchmarks, or name the ones you want:
+
+    python benchmarks.py
+    python benchmarks.py replay --sessions 500
+    python benchmarks.py startup --runs 20
+    python benchmarks.py database --rows 1000000
+
+Results are printed as JSON, one object per benchmark. Save a run with
+--output and pass it back as --baseline to a later run to list the metrics
+that got slower (or faster) by more than --tolerance; any regression makes
+the exit status 1.
+
+The database benchmarks run against a local SQLite database seeded with
+--rows results. The seeded file is kept in --db-dir and reused by later
+runs of the same size.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+try:
+    import typing_test_mysql as app
+except ImportError as e:
+    # the benchmarks are headless and run on any platform; say which dependency is missing
+    sys.exit(f"benchmarks.py cannot load the typing test: {e}")
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+class NullStream:
+    """Terminal stand-in for the renderer: swallows frames, counting what was written."""
+    def __init__(self):
+        self.chars = 0
+    def write(self, data):
+        self.chars += len(data)
+    def flush(self):
+        pass
+
+def measure(func, iterations):
+    """Call func() `iterations` times and summarize the per-call latency in microseconds."""
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(iterations):
+        start = clock()
+        func()
+        samples.append(clock() - start)
+    samples.sort()
+    return {
+        'calls': iterations,
+        'mean_us': round(sum(samples) / len(samples) / 1000, 2),
+        'p50_us': round(samples[len(samples) // 2] / 1000, 2),
+        'p99_us': round(samples[min(len(samples) - 1, len(samples) * 99 // 100)] / 1000, 2),
+        'max_us': round(samples[-1] / 1000, 2),
+    }
+
+def make_game():
+    """A TypingTest that draws into a NullStream and stays silent."""
+    game = app.TypingTest()
+    game.renderer = app.FrameRenderer(NullStream())
+    game.audio = app.AudioFeedback(sink=app.NullSink())
+    return game
+
+def synthetic_text(length, seed=0):
+    """About `length` characters of corpus words in lines of up to 60, like a text_*.txt paragraph."""
+    rng = random.Random(seed)
+    words = [w for d in ('easy', 'medium', 'hard', 'extreme') for p in load_paragraphs(d) for w in p.split()]
+    lines = [[]]
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        if sum(map(len, lines[-1])) + len(lines[-1]) + len(word) > 60:
+            lines.append([])
+        lines[-1].append(word)
+        size += len(word) + 1
+    return '\n'.join(' '.join(line) for line in lines)
+
+def load_paragraphs(difficulty):
+    """The difficulty's paragraphs as the game has them typed (line breaks dropped)."""
+    corpus = app.CorpusIndex()
+    return [corpus.text(p).replace('\n', '') for p in corpus.paragraphs(difficulty)]
+
+@benchmark('replay')
+def bench_replay(args):
+    """Replay synthetic keystroke streams through TypingSession."""
+    paragraphs = load_paragraphs(args.difficulty)
+    streams = [
+        (text, list(app.synthetic_keystrokes(text, wpm=args.wpm, error_rate=args.error_rate, seed=i)))
+        for i, text in enumerate(paragraphs)
+    ]
+    keystrokes = 0
+    start = time.perf_counter()
+    for n in range(args.sessions):
+        text, events = streams[n % len(streams)]
+        app.replay_session(text, events)
+        keystrokes += len(events)
+    elapsed = time.perf_counter() - start
+    return {
+        'sessions': args.sessions,
+        'keystrokes': keystrokes,
+        'seconds': round(elapsed, 6),
+        'sessions_per_second': round(args.sessions / elapsed, 1),
+        'ns_per_keystroke': round(elapsed * 1e9 / keystrokes, 1),
+    }
+
+@benchmark('render')
+def bench_render(args):
+    """display_typing_interface frames: a full redraw and the incremental frame after one keystroke."""
+    results = {}
+    for length in args.lengths:
+        game = make_game()
+        text = synthetic_text(length)
+        layout = game.get_layout(text, width=100)
+        session = app.TypingSession(text.replace('\n', ''))
+        stream = game.renderer.stream
+        def full_frame():
+            game.renderer.invalidate()
+            game.display_typing_interface(layout, session, 60)
+        position = 0
+        def keystroke_frame():
+            nonlocal position
+            if position + 1 >= len(layout):
+                layout.reset()
+                position = 0
+            layout.set_state(position, app.ParagraphLayout.CORRECT)
+            layout.set_state(position + 1, app.ParagraphLayout.CURSOR)
+            position += 1
+            game.display_typing_interface(layout, session, 60)
+        game.renderer.invalidate()
+        full = measure(full_frame, args.frames)
+        full['chars_per_frame'] = stream.chars // args.frames
+        stream.chars = 0
+        incremental = measure(keystroke_frame, args.frames)
+        incremental['chars_per_frame'] = stream.chars // args.frames
+        results[str(length)] = {'rows': len(layout.rows), 'full_frame': full, 'keystroke_frame': incremental}
+    return results
+
+@benchmark('text')
+def bench_text(args):
+    """wrap_text over paragraphs of each length, get_layout for a new paragraph, and load_text."""
+    game = make_game()
+    results = {}
+    for length in args.lengths:
+        text = synthetic_text(length).replace('\n', ' ')
+        results[f"wrap_text_{length}"] = measure(lambda: game.wrap_text(text, 100), args.frames)
+        texts = [synthetic_text(length, seed) for seed in range(args.frames)]
+        results[f"get_layout_{length}"] = measure(lambda: game.get_layout(texts.pop(), 100), args.frames)
+    game.load_text(args.difficulty)     # the first call parses the file
+    results['load_text'] = measure(lambda: game.load_text(args.difficulty), args.frames * 10)
+    return results
+
+@benchmark('wpm')
+def bench_wpm(args):
+    """calculate_wpm over a synthetic spread of inputs."""
+    rng = random.Random(1)
+    inputs = [(rng.randint(50, 2000), rng.uniform(5, 300), rng.randint(0, 40)) for _ in range(1000)]
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        for chars, seconds, errors in inputs:
+            app.calculate_wpm(chars, seconds, errors)
+        calls += len(inputs)
+    elapsed = time.perf_counter() - start
+    return {'calls': calls, 'seconds': round(elapsed, 6), 'ns_per_call': round(elapsed * 1e9 / calls, 1)}
+
+def seed_database(path, rows, seed=1):
+    """Fill a new SQLite database at `path` with `rows` random results from rows // 100 users."""
+    config = app.load_db_config()
+    config.update(backend='sqlite', sqlite_path=path)
+    db = app.open_database(config)
+    if not db.connect() or not db.create_tables():
+        raise RuntimeError(f"cannot create {path}")
+    rng = random.Random(seed)
+    users = max(10, rows // 100)
+    db._run(lambda cursor: cursor.executemany(
+        "INSERT INTO users (username) VALUES (%s)", [(f"user{n:07d}",) for n in range(users)]), commit=True)
+    difficulties = ['easy', 'medium', 'hard', 'extreme']
+    paragraphs = [p.id for d in difficulties for p in app.CorpusIndex().paragraphs(d)]
+    epoch = datetime(2024, 1, 1)
+    chunk = 50000
+    for start in range(0, rows, chunk):
+        batch = []
+        for _ in range(min(chunk, rows - start)):
+            wpm = round(min(200.0, max(5.0, rng.gauss(55, 18))), 2)
+            batch.append((
+                rng.randint(1, users), wpm, round(rng.uniform(75, 100), 2), round(wpm * rng.uniform(1, 1.2), 2),
+                rng.randint(0, 20), rng.choice(difficulties), rng.randint(15, 240),
+                epoch + timedelta(seconds=rng.randint(0, 2 * 365 * 86400)), f"{rng.getrandbits(128):032x}",
+                rng.choice(paragraphs),
+            ))
+        db._run(lambda cursor: cursor.executemany("""
+            INSERT INTO test_results (user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken, test_date,
+                                      result_key, paragraph_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, batch), commit=True)
+        print(f"\rseeding {path}: {start + len(batch)}/{rows} rows", end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    db.rebuild_user_best()
+    db.check_user_stats(repair=True)
+    db.close()
+    return users
+
+@benchmark('database')
+def bench_database(args):
+    """Leaderboard, rank, stats and CSV export on a seeded SQLite database of --rows results."""
+    path = os.path.join(args.db_dir, f"typing_bench_{args.rows}.db")
+    if not os.path.exists(path):
+        seed_database(path + '.tmp', args.rows)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + '.tmp' + suffix):
+                os.replace(path + '.tmp' + suffix, path + suffix)
+    config = app.load_db_config()
+    config.update(backend='sqlite', sqlite_path=path)
+    db = app.open_database(config)
+    db.connect()
+    users = db._run(lambda cursor: cursor.execute("SELECT COUNT(*) FROM users") or cursor.fetchone())[0]
+    rng = random.Random(2)
+    def cold_leaderboard():
+        db.leaderboard_cache.invalidate()
+        db.get_leaderboard(args.difficulty, 10)
+    deep = {'page': None}
+    def next_page():
+        page = db.get_leaderboard_page(None, 20, deep['page'][-1] if deep['page'] else None)
+        deep['page'] = page or None
+    results = {
+        'rows': args.rows,
+        'users': users,
+        'get_leaderboard_cold': measure(cold_leaderboard, args.queries),
+        'get_leaderboard_cached': measure(lambda: db.get_leaderboard(args.difficulty, 10), args.queries),
+        'get_leaderboard_page_walk': measure(next_page, args.queries),
+        'get_user_rank': measure(lambda: db.get_user_rank(rng.randint(1, users), rng.choice([None, args.difficulty])),
+                                 args.queries),
+        'get_user_stats': measure(lambda: db.get_user_stats(rng.randint(1, users)), args.queries),
+    }
+    out = os.path.join(args.db_dir, "typing_bench_export.csv")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):    # keep stdout pure JSON
+        written = db.export_results_to_csv(out, progress=False)
+    elapsed = time.perf_counter() - start
+    os.remove(out)
+    results['export_results_to_csv'] = {
+        'rows': written, 'seconds': round(elapsed, 3), 'rows_per_second': round(written / elapsed, 1),
+    }
+    db.close()
+    return results
+
+# Run in a fresh interpreter: import the game, build it and draw the first
+# main-menu frame (to a buffer), timing each step from the first import.
+STARTUP_PROBE = """
+import io, json, sys, time
+start = time.perf_counter()
+import typing_test_mysql as app
+imported = time.perf_counter()
+game = app.TypingTest()
+game.renderer = app.FrameRenderer(io.StringIO())
+labels = [label for label, _ in game.MAIN_MENU]
+game.renderer.render(game.menu_frame(labels, 0, title="SPEED TYPING TEST", show_cancel=False))
+drawn = time.perf_counter()
+json.dump({
+    'import': imported - start,
+    'first_frame': drawn - start,
+    'modules': len(sys.modules),
+    'deferred': [m for m in ('mysql.connector', 'winsound', 'colorama', 'sqlite3', 'mmap', 'gzip', 'wave',
+                             'subprocess', 'http.server', 'uuid') if m not in sys.modules],
+}, sys.stdout)
+"""
+
+@benchmark('startup')
+def bench_startup(args):
+    """Import cost and time to the first main-menu frame, medians over fresh processes."""
+    runs = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        run = json.loads(out)
+        run['process'] = time.perf_counter() - start
+        runs.append(run)
+    def median_ms(key):
+        return round(statistics.median(run[key] for run in runs) * 1000, 2)
+    return {
+        'runs': len(runs),
+        'import_ms': median_ms('import'),
+        'first_frame_ms': median_ms('first_frame'),
+        'process_ms': median_ms('process'),
+        'modules_loaded': runs[-1]['modules'],
+        'deferred_imports': runs[-1]['deferred'],
+    }
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+def compare(baseline, results, tolerance):
+    """Metrics that moved more than `tolerance` (a fraction) against the baseline run.
+
+    Times (*_us, *_ms, seconds, ns_per_*) should go down and rates
+    (*_per_second) up; counts, sizes and the too-noisy max_us aren't compared.
+    """
+    old = dict(flatten({k: v for k, v in baseline.items() if k in results}))
+    regressions = []
+    improvements = []
+    for metric, value in flatten(results):
+        name = metric.rsplit('.', 1)[-1]
+        if metric not in old or not old[metric] or name == 'max_us':
+            continue
+        if name.endswith(('_us', '_ms')) or name == 'seconds' or name.startswith('ns_per_'):
+            change = value / old[metric] - 1
+        elif name.endswith('_per_second'):
+            change = old[metric] / value - 1 if value else float('inf')
+        else:
+            continue
+        entry = {'metric': metric, 'baseline': old[metric], 'current': value, 'slower_by': round(change, 3)}
+        if change > tolerance:
+            regressions.append(entry)
+        elif change < -tolerance:
+            improvements.append(entry)
+    return {'tolerance': tolerance, 'regressions': regressions, 'improvements': improvements}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Speed typing test benchmarks")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument('--sessions', type=int, default=200, help="typing sessions to replay")
+    parser.add_argument('--difficulty', default='medium', choices=['easy', 'medium', 'hard', 'extreme'])
+    parser.add_argument('--wpm', type=float, default=80)
+    parser.add_argument('--error-rate', type=float, default=0.03)
+    parser.add_argument('--runs', type=int, default=10, help="fresh processes to time for startup")
+    parser.add_argument('--lengths', type=int, nargs='+', default=[100, 400, 1600, 6400],
+                        help="paragraph lengths (characters) for the render and text benchmarks")
+    parser.add_argument('--frames', type=int, default=300, help="calls timed per render/text case")
+    parser.add_argument('--rows', type=int, default=10 ** 4, help="results in the seeded database (10^4 to 10^7)")
+    parser.add_argument('--queries', type=int, default=200, help="calls timed per database query")
+    parser.add_argument('--db-dir', default=tempfile.gettempdir(), help="where seeded databases are kept")
+    parser.add_argument('--output', metavar='PATH', help="also write the results to this JSON file")
+    parser.add_argument('--baseline', metavar='PATH', help="compare against results saved with --output")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="relative change reported by --baseline")
+    args = parser.parse_args(argv)
+    names = args.names or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    results = {}
+    for name in names:
+        results[name] = BENCHMARKS[name](args)
+    results['meta'] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        results['comparison'] = compare(baseline, {k: v for k, v in results.items() if k != 'meta'}, args.tolerance)
+        status = 1 if results['comparison']['regressions'] else 0
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
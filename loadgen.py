@@ -0,0 +1,311 @@
+"""Synthetic load generator for the speed typing test.
+
+Runs N simulated typists at once, each in its own thread with its own
+TypingTest, against one shared database, corpus and result writer, the way
+typing_server hosts its players. A typist takes test after test: keys
+arrive at about --wpm with human-like jitter, mistakes are corrected with
+backspace, some tests are abandoned with ESC, and after a test some
+typists look at the leaderboard and their rank.
+
+    python loadgen.py --typists 10 50 200 --duration 60
+    python loadgen.py --typists 500 --speedup 10 --seed-rows 1000000
+
+Each --typists level runs for --duration seconds and is reported as one
+JSON object: tests and keystrokes per unit of time, latency percentiles
+for each operation and the SQL statements the database ran. Typists run
+the live test's TypingLoop, frame cap (--max-fps) included; a keystroke
+sample is one read's keys plus the frame that shows them, if one is due.
+--speedup compresses the time between keys without changing the WPM the
+results are scored at.
+
+By default the load goes to a fresh local SQLite database; --seed-rows
+first copies in a database of that many results (seeded and cached in
+--db-dir as benchmarks.py does), and --db loads an existing one in place
+instead. --backend mysql uses the configured MySQL
+database instead, and writes real results to it.
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import typing_test_mysql as app
+from benchmarks import NullStream, seed_database
+
+DIFFICULTIES = ['easy', 'medium', 'hard', 'extreme']
+
+class Recorder:
+    """Latency samples per operation and event counts, shared by every typist thread."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(list)
+        self.counts = collections.Counter()
+    def add(self, op, ns):
+        with self.lock:
+            self.samples[op].append(ns)
+    def count(self, event, n=1):
+        with self.lock:
+            self.counts[event] += n
+    def timed(self, op, func, *args):
+        start = time.perf_counter_ns()
+        try:
+            return func(*args)
+        finally:
+            self.add(op, time.perf_counter_ns() - start)
+    def summary(self):
+        ops = {}
+        with self.lock:
+            for op, samples in sorted(self.samples.items()):
+                samples = sorted(samples)
+                n = len(samples)
+                ops[op] = {
+                    'count': n,
+                    'p50_ms': round(samples[n // 2] / 1e6, 3),
+                    'p95_ms': round(samples[min(n - 1, int(n * 0.95))] / 1e6, 3),
+                    'p99_ms': round(samples[min(n - 1, int(n * 0.99))] / 1e6, 3),
+                    'max_ms': round(samples[-1] / 1e6, 3),
+                }
+        return ops
+
+class CountingCursor:
+    """Cursor proxy that counts the statements run through it by their leading keyword."""
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+    def execute(self, query, *args, **kwargs):
+        self.counter.count(query)
+        return self.cursor.execute(query, *args, **kwargs)
+    def executemany(self, query, *args, **kwargs):
+        self.counter.count(query)
+        return self.cursor.executemany(query, *args, **kwargs)
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class QueryCounter:
+    """Counts the transactions and statements a database runs, by wrapping its _transaction."""
+    def __init__(self, db):
+        self.lock = threading.Lock()
+        self.transactions = 0
+        self.statements = collections.Counter()
+        transaction = db._transaction
+        def counted(work, commit=False, **cursor_args):
+            with self.lock:
+                self.transactions += 1
+            return transaction(lambda cursor: work(CountingCursor(cursor, self)), commit, **cursor_args)
+        db._transaction = counted
+    def count(self, query):
+        words = query.split(None, 1)
+        with self.lock:
+            self.statements[words[0].upper() if words else '?'] += 1
+    def reset(self):
+        with self.lock:
+            self.transactions = 0
+            self.statements.clear()
+
+class Typist(threading.Thread):
+    """One simulated player taking tests until the level's deadline."""
+    def __init__(self, index, ctx):
+        super().__init__(name=f"typist-{index}", daemon=True)
+        self.index = index
+        self.ctx = ctx
+        self.rng = random.Random(ctx.args.seed * 100003 + index)
+    def run(self):
+        ctx = self.ctx
+        try:
+            game = app.TypingTest(db=ctx.db, corpus=ctx.corpus, writer=ctx.writer, journal=ctx.journal)
+            game.renderer = app.FrameRenderer(NullStream())
+            game.audio = app.AudioFeedback(sink=app.NullSink())
+            game.username = f"loadgen{self.index:05d}"
+            game.current_user_id = ctx.recorder.timed('get_or_create_user', ctx.db.get_or_create_user, game.username)
+            while time.monotonic() < ctx.deadline:
+                self.take_test(game)
+        except Exception as e:
+            ctx.recorder.count('typist_errors')
+            print(f"{self.name}: {e!r}", file=sys.stderr)
+    def take_test(self, game):
+        ctx, args, rng = self.ctx, self.ctx.args, self.rng
+        difficulty = rng.choice(args.difficulties)
+        paragraph = game.pick_paragraph(difficulty)
+        if paragraph is None:
+            raise RuntimeError(f"no paragraphs for {difficulty}")
+        text = paragraph.text
+        expected = text.replace('\n', '')
+        session = app.TypingSession(expected, log=app.KeystrokeLog())
+        layout = game.get_layout(text, 120)
+        wpm = max(10.0, rng.gauss(args.wpm, args.wpm_spread))
+        events = list(app.synthetic_keystrokes(expected, wpm, args.error_rate, rng.random(), args.jitter))
+        if rng.random() < args.cancel_rate:
+            cut = rng.randrange(len(events))
+            events = events[:cut] + [(events[cut][0], app.Keys.ESCAPE)]
+        game.audio.start()
+        game.renderer.invalidate()
+        # The same loop as the live test, fed by a simulated reader: it wakes when the next
+        # key is due or the loop's timeout runs out and hands over every key due by then.
+        # Keys are timed on the simulated clock so scoring sees the intended WPM; the wall
+        # clock between them is divided by --speedup.
+        loop = app.TypingLoop(game, layout, session, args.max_fps)
+        loop.start()
+        start_ns = time.monotonic_ns()
+        keystrokes = 0
+        i = 0
+        while not loop.done and i < len(events):
+            wake_ns = start_ns + events[i][0] / args.speedup
+            timeout = loop.timeout()
+            if timeout is not None:
+                wake_ns = min(wake_ns, time.monotonic_ns() + timeout * 1e9)
+            delay = (wake_ns - time.monotonic_ns()) / 1e9
+            if delay > 0:
+                time.sleep(delay)
+            if time.monotonic() >= ctx.deadline:
+                ctx.recorder.count('keystrokes', keystrokes)
+                return  # unfinished at the deadline: not counted either way
+            now_ns = time.monotonic_ns()
+            keys = []
+            while i < len(events) and start_ns + events[i][0] / args.speedup <= now_ns:
+                keys.append(events[i][1])
+                i += 1
+            sim_ns = start_ns + (events[i - 1][0] if keys else int((now_ns - start_ns) * args.speedup))
+            t0 = time.perf_counter_ns()
+            loop.step(keys, now_ns=sim_ns)
+            if keys:
+                # one read: its keys plus the frame that shows them, when one is due
+                ctx.recorder.add('keystroke', time.perf_counter_ns() - t0)
+                keystrokes += len(keys)
+        ctx.recorder.count('keystrokes', keystrokes)
+        if session.cancelled:
+            ctx.recorder.count('tests_cancelled')
+            return
+        record = game.result_record(session.metrics(), difficulty, paragraph, session.log)
+        ctx.recorder.timed('save_result', game.save_result, record)
+        ctx.recorder.count('tests_completed')
+        if rng.random() < args.leaderboard_rate:
+            ctx.recorder.timed('get_leaderboard', ctx.db.get_leaderboard, difficulty)
+            ctx.recorder.timed('get_user_rank', ctx.db.get_user_rank, game.current_user_id, difficulty)
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think) / args.speedup)
+
+class LoadContext:
+    """The services every typist shares, plus the level's recorder and deadline."""
+    def __init__(self, args, db):
+        self.args = args
+        self.db = db
+        self.corpus = app.CorpusIndex()
+        self.journal = app.ResultJournal(os.path.join(tempfile.gettempdir(), 'loadgen.journal'))
+        self.writer = app.ResultWriter(db, journal=self.journal)
+        self.recorder = None
+        self.deadline = 0
+
+def open_load_database(args):
+    config = app.load_db_config()
+    if args.backend == 'sqlite':
+        path = args.db or os.path.join(tempfile.mkdtemp(prefix='loadgen-'), 'typing_load.db')
+        if args.seed_rows:
+            seeded = os.path.join(args.db_dir, f"typing_bench_{args.seed_rows}.db")
+            if not os.path.exists(seeded):
+                seed_database(seeded, args.seed_rows)
+            shutil.copyfile(seeded, path)
+        config.update(backend='sqlite', sqlite_path=path)
+    else:
+        config.update(backend=args.backend)
+    db = app.open_database(config)
+    if not db.connect() or not db.create_tables():
+        raise SystemExit(f"cannot open the {args.backend} database")
+    return db
+
+def run_level(ctx, counter, typists):
+    """Run `typists` players for --duration seconds and report what they did."""
+    args = ctx.args
+    ctx.recorder = Recorder()
+    db = ctx.db
+    # wrap the backend calls that the write-behind thread makes, to time them too
+    db.save_results = lambda results, save=type(db).save_results: ctx.recorder.timed('save_results_batch', save, db, results)
+    counter.reset()
+    hits, misses = db.leaderboard_cache.hits, db.leaderboard_cache.misses
+    start = time.monotonic()
+    ctx.deadline = start + args.duration
+    threads = [Typist(i, ctx) for i in range(typists)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    ctx.recorder.timed('drain_writer', ctx.writer.flush)
+    del db.save_results
+    counts = ctx.recorder.counts
+    completed = counts['tests_completed']
+    return {
+        'typists': typists,
+        'duration_s': round(elapsed, 2),
+        'tests_completed': completed,
+        'tests_cancelled': counts['tests_cancelled'],
+        'tests_per_min': round(completed * 60 / elapsed, 1),
+        'keystrokes_per_s': round(counts['keystrokes'] / elapsed, 1),
+        'typist_errors': counts['typist_errors'],
+        'write_failures': len(ctx.writer.failed),
+        'operations': ctx.recorder.summary(),
+        'queries': {
+            'transactions': counter.transactions,
+            'statements': dict(counter.statements),
+            'statements_per_test': round(sum(counter.statements.values()) / completed, 2) if completed else None,
+        },
+        'leaderboard_cache': {
+            'hits': db.leaderboard_cache.hits - hits,
+            'misses': db.leaderboard_cache.misses - misses,
+        },
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Speed typing test load generator")
+    parser.add_argument('--typists', type=int, nargs='+', default=[10, 50, 200],
+                        help="concurrent typists; each value is run as its own level")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds per level")
+    parser.add_argument('--wpm', type=float, default=60.0, help="mean typing speed")
+    parser.add_argument('--wpm-spread', type=float, default=15.0, help="standard deviation of the typists' speeds")
+    parser.add_argument('--jitter', type=float, default=0.35, help="log-normal sigma of the gaps between keys")
+    parser.add_argument('--error-rate', type=float, default=0.03, help="share of keys mistyped and corrected")
+    parser.add_argument('--cancel-rate', type=float, default=0.05, help="share of tests abandoned with ESC")
+    parser.add_argument('--leaderboard-rate', type=float, default=0.5,
+                        help="share of tests followed by a leaderboard and rank lookup")
+    parser.add_argument('--think', type=float, default=2.0, help="mean seconds between a typist's tests")
+    parser.add_argument('--speedup', type=float, default=1.0, help="run the typists' clocks this many times faster")
+    parser.add_argument('--max-fps', type=float, default=app.RenderScheduler.DEFAULT_FPS,
+                        help="most typing-test frames drawn per second, as the game's --max-fps")
+    parser.add_argument('--difficulties', nargs='+', default=DIFFICULTIES, choices=DIFFICULTIES)
+    parser.add_argument('--backend', default='sqlite', choices=sorted(app.BACKENDS))
+    parser.add_argument('--db', metavar='PATH', help="SQLite database to load (default: a fresh temporary one)")
+    parser.add_argument('--seed-rows', type=int, default=0, help="start from a database holding this many results")
+    parser.add_argument('--db-dir', default=tempfile.gettempdir(), help="where seeded databases are kept")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', metavar='PATH', help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+    if args.db and args.seed_rows:
+        # seeding copies a cached database over the target, which would destroy the one given
+        parser.error("--seed-rows starts from a fresh copy of a seeded database; it cannot be combined with --db")
+    db = open_load_database(args)
+    counter = QueryCounter(db)
+    ctx = LoadContext(args, db)
+    levels = []
+    try:
+        for typists in args.typists:
+            print(f"running {typists} typists for {args.duration:g}s", file=sys.stderr)
+            levels.append(run_level(ctx, counter, typists))
+            print(json.dumps(levels[-1]), flush=True)
+    finally:
+        ctx.writer.close()
+        ctx.journal.close()
+        db.close()
+        if args.backend == 'sqlite' and not args.db:
+            shutil.rmtree(os.path.dirname(db.config['sqlite_path']), ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'levels': levels}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""AudioFeedback: loading the click and dropping clicks that would sound late."""
+import struct
+import time
+import wave
+
+import typing_test_mysql as app
+
+
+def write_wav(path, framerate, frames, channels=1):
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(framerate)
+        w.writeframes(struct.pack(f'<{len(frames)}h', *frames))
+    return str(path)
+
+
+def test_the_silent_tail_is_trimmed(tmp_path):
+    path = write_wav(tmp_path / 'click.wav', 1000, [8000] * 100 + [0] * 400)
+    assert app.AudioFeedback.sound_length(app.AudioFeedback.load_sound(path)) == 0.1
+
+
+def test_a_low_sample_rate_still_loads(tmp_path):
+    path = write_wav(tmp_path / 'click.wav', 50, [8000] * 10 + [0] * 10)
+    assert app.AudioFeedback.sound_length(app.AudioFeedback.load_sound(path)) == 0.2
+
+
+def test_a_bad_file_loads_as_no_sound(tmp_path):
+    path = tmp_path / 'click.wav'
+    path.write_bytes(b'RIFF\0\0')
+    assert app.AudioFeedback.load_sound(str(path)) is None
+
+
+def test_errors_during_a_click_are_dropped(tmp_path):
+    path = write_wav(tmp_path / 'click.wav', 1000, [8000] * 300)
+    sink = app.NullSink()
+    audio = app.AudioFeedback(sink=sink, sound_file=path, min_interval=0.0)
+    audio.start()
+    try:
+        time.sleep(0.1)     # let the worker load the sound
+        for _ in range(5):
+            audio.error()
+            time.sleep(0.02)
+        time.sleep(0.4)
+        assert sink.played == 1
+        audio.error()
+        time.sleep(0.1)
+        assert sink.played == 2
+    finally:
+        audio.close()
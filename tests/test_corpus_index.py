@@ -0,0 +1,66 @@
+"""CorpusIndex: paragraph tables, stable ids, decks and reloads."""
+import os
+import random
+
+import pytest
+
+import typing_test_mysql as app
+
+
+def write_corpus(tmp_path, *paragraphs, difficulty='easy'):
+    path = tmp_path / f"text_{difficulty}.txt"
+    path.write_bytes(b'\n###PARA\n'.join(p.encode('utf-8') for p in paragraphs))
+    return str(path)
+
+
+def corpus_in(tmp_path, **kwargs):
+    corpus = app.CorpusIndex(**kwargs)
+    corpus.SEARCH_PATH = (str(tmp_path),)
+    return corpus
+
+
+@pytest.mark.parametrize('mmap_threshold', [0, 1 << 20])
+def test_paragraphs_are_normalized_and_read_back(tmp_path, mmap_threshold):
+    write_corpus(tmp_path, "  First line  \r\nsecond line\n", "Ünïcode paragraph.", "   ")
+    corpus = corpus_in(tmp_path, mmap_threshold=mmap_threshold)
+    paragraphs = corpus.paragraphs('easy')
+    assert [corpus.text(p) for p in paragraphs] == ["First line\nsecond line", "Ünïcode paragraph."]
+    assert [p.chars for p in paragraphs] == [22, 18]
+
+
+def test_ids_survive_edits_elsewhere_in_the_file(tmp_path):
+    path = write_corpus(tmp_path, "Alpha text.", "Beta text.")
+    corpus = corpus_in(tmp_path)
+    before = {corpus.text(p): p.id for p in corpus.paragraphs('easy')}
+    write_corpus(tmp_path, "A new paragraph first.", "Alpha text.", "Beta text, edited.")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+    after = {corpus.text(p): p.id for p in corpus.paragraphs('easy')}
+    assert after["Alpha text."] == before["Alpha text."]
+    assert "Beta text." not in after and len(set(after.values())) == 3
+
+
+def test_a_changed_file_is_parsed_again(tmp_path):
+    path = write_corpus(tmp_path, "One.", "Two.")
+    corpus = corpus_in(tmp_path)
+    table = corpus.paragraphs('easy')
+    assert corpus.paragraphs('easy') is table
+    write_corpus(tmp_path, "One.", "Two.", "Three.")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert [p.text for p in corpus.paragraphs('easy')] == ["One.", "Two.", "Three."]
+
+
+def test_a_deck_deals_every_paragraph_before_repeating(tmp_path):
+    texts = [f"Paragraph number {i}." for i in range(7)]
+    write_corpus(tmp_path, *texts)
+    corpus = corpus_in(tmp_path)
+    rng = random.Random(3)
+    first = [corpus.pick('easy', deck='amy', rng=rng).text for _ in texts]
+    second = [corpus.pick('easy', deck='amy', rng=rng).text for _ in texts]
+    assert sorted(first) == sorted(second) == sorted(texts)
+    # another deck is dealt on its own
+    assert corpus.pick('easy', deck='bob', rng=rng).text in texts
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        corpus_in(tmp_path).paragraphs('hard')
@@ -0,0 +1,51 @@
+"""KeyDecoder: raw terminal bytes, in arbitrary chunks, to key events."""
+import typing_test_mysql as app
+
+Keys = app.Keys
+
+
+def feed_bytes(decoder, data):
+    """Feed `data` one byte at a time, as the slowest terminal would."""
+    keys = []
+    for i in range(len(data)):
+        keys += decoder.feed(data[i:i + 1])
+    return keys
+
+
+def test_utf8_split_across_reads():
+    decoder = app.KeyDecoder()
+    assert feed_bytes(decoder, "né€😀".encode('utf-8')) == ["n", "é", "€", "😀"]
+
+
+def test_arrow_sequences_whole_and_split():
+    decoder = app.KeyDecoder()
+    assert decoder.feed(b'\x1b[A\x1b[Bx\x1bOC') == [Keys.UP, Keys.DOWN, "x", Keys.RIGHT]
+    assert feed_bytes(decoder, b'\x1b[D') == [Keys.LEFT]
+    assert not decoder.pending_escape()
+
+
+def test_unknown_csi_sequences_are_dropped():
+    decoder = app.KeyDecoder()
+    assert decoder.feed(b'\x1b[1;5Ca') == ["a"]
+
+
+def test_cr_lf_is_one_enter():
+    decoder = app.KeyDecoder()
+    assert decoder.feed(b'a\r\nb\r') == ["a", Keys.ENTER, "b", Keys.ENTER]
+    assert decoder.feed(b'\n') == []
+    assert decoder.feed(b'\n\n') == [Keys.ENTER, Keys.ENTER]
+
+
+def test_bare_escape_waits_for_the_timeout():
+    decoder = app.KeyDecoder()
+    assert decoder.feed(b'a\x1b') == ["a"]
+    assert decoder.pending_escape()
+    assert decoder.flush() == [Keys.ESCAPE]
+    assert not decoder.pending_escape() and decoder.flush() == []
+    # ESC followed by anything but '[' or 'O' is a bare ESC straight away
+    assert decoder.feed(b'\x1bq') == [Keys.ESCAPE, "q"]
+
+
+def test_backspace_and_interrupt():
+    decoder = app.KeyDecoder()
+    assert decoder.feed(b'\x7f\x08\x03') == [Keys.BACKSPACE, Keys.BACKSPACE, Keys.INTERRUPT]
@@ -0,0 +1,27 @@
+"""KeystrokeLog: the compact event log and its blob format."""
+import zlib
+
+import pytest
+
+import typing_test_mysql as app
+
+
+def test_blob_round_trip():
+    log = app.KeystrokeLog()
+    events = [(1_000, 0, "T", True), (1_250_000_000, 1, "x", False), (1_400_000_000, 1, app.Keys.BACKSPACE, False),
+              (1_500_000_000, 1, "h", True), (2 ** 40, 2, "😀", False)]
+    for event in events:
+        log.record(*event)
+    restored = app.KeystrokeLog.from_blob(log.to_blob())
+    assert len(restored) == len(log) == 5
+    assert list(restored.events()) == [(t - 1_000, i, ch, ok) for t, i, ch, ok in events]
+    assert list(restored.keys()) == list(log.keys())
+
+
+def test_empty_log_round_trip():
+    assert len(app.KeystrokeLog.from_blob(app.KeystrokeLog().to_blob())) == 0
+
+
+def test_foreign_blob_is_refused():
+    with pytest.raises(ValueError):
+        app.KeystrokeLog.from_blob(zlib.compress(b'NOPE' + bytes(4)))
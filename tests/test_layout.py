@@ -0,0 +1,26 @@
+"""Breaking paragraph lines into screen rows for ParagraphLayout."""
+import pytest
+
+import typing_test_mysql as app
+
+break_line = app.TypingTest.break_line
+
+
+def test_breaks_after_the_last_space_that_fits():
+    assert break_line("hello world foo", 6) == ["hello ", "world ", "foo"]
+    assert break_line("short", 20) == ["short"]
+
+
+def test_a_word_longer_than_the_width_is_broken_at_the_edge():
+    assert break_line("x" * 13 + " ab", 5) == ["xxxxx", "xxxxx", "xxx ", "ab"]
+
+
+@pytest.mark.parametrize('difficulty', ['easy', 'medium', 'hard', 'extreme'])
+def test_rows_fit_and_keep_every_character(difficulty):
+    corpus = app.CorpusIndex()
+    for paragraph in corpus.paragraphs(difficulty)[:20]:
+        for line in corpus.text(paragraph).split('\n'):
+            for width in (7, 20, 33, 79, 119):
+                rows = break_line(line, width)
+                assert ''.join(rows) == line
+                assert all(len(row) <= width for row in rows)
@@ -0,0 +1,18 @@
+"""The leaderboard cache against the rows the database returns for the same results."""
+import typing_test_mysql as app
+
+
+def test_cached_board_matches_stored_rows(tmp_path):
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'board.db'))
+    db = app.open_database(config)
+    assert db.connect() and db.create_tables()
+    try:
+        user_id = db.get_or_create_user('amy')
+        assert db.get_leaderboard_page(None, 10, None) == []
+        db.save_result(user_id, 55.12345, 97.6666, 60.004999, 2, 'easy', 30)
+        cached = db.get_leaderboard_page(None, 10, None)
+        db.leaderboard_cache.invalidate()
+        assert cached == db.get_leaderboard_page(None, 10, None)
+        assert cached[0][1:3] == (55.12, 97.67)
+    finally:
+        db.close()
@@ -0,0 +1,34 @@
+"""MetricsRegistry: the Prometheus text format, and the metrics port setting."""
+import pytest
+
+import typing_test_mysql as app
+
+
+def test_label_values_are_escaped():
+    registry = app.MetricsRegistry()
+    registry.counter('errors_total', "Errors", ('method',)).labels('a\\b"c\nd').inc()
+    assert 'errors_total{method="a\\\\b\\"c\\nd"} 1\n' in registry.render()
+
+
+def test_float_samples_keep_every_digit():
+    registry = app.MetricsRegistry()
+    histogram = registry.histogram('query_seconds', "Query time", buckets=(0.5,))
+    histogram.observe(0.1234567)
+    histogram.observe(123456.7)
+    gauge = registry.gauge('ratio', "Ratio")
+    gauge.set(float('inf'))
+    text = registry.render()
+    assert f'query_seconds_sum {0.1234567 + 123456.7!r}\n' in text
+    assert 'query_seconds_bucket{le="+Inf"} 2\n' in text
+    assert 'ratio +Inf\n' in text
+
+
+def test_a_bad_metrics_port_is_a_usage_error(monkeypatch, capsys):
+    monkeypatch.setenv('TYPING_METRICS_PORT', 'nine')
+    with pytest.raises(SystemExit) as exit:
+        app.main([])
+    assert exit.value.code == 2
+    assert "invalid int value: 'nine'" in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        app.main(['--metrics-port', '70000'])
+    assert '--metrics-port must be between 0 and 65535' in capsys.readouterr().err
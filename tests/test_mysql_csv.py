@@ -0,0 +1,90 @@
+"""CSV export/import through the MySQL backend's SQL, against a scripted cursor.
+
+The cursor passes statements through the way mysql-connector does: only
+%s placeholders are substituted, so anything else in the SQL (such as a
+doubled %%) reaches the server unchanged.
+"""
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal
+
+import typing_test_mysql as app
+
+RE_PY_PARAM = re.compile(rb'(%s)')
+
+class ScriptedCursor:
+    """Answers SELECTs from `tables` and records every statement as the server would see it."""
+    def __init__(self, server):
+        self.server = server
+        self.rows = []
+    def _substitute(self, query, params):
+        params = iter(params or ())
+        sql = RE_PY_PARAM.sub(lambda m: repr(next(params)).encode(), query.encode()).decode()
+        assert '%%' not in sql, f"doubled % reaches MySQL: {sql}"
+        self.server.statements.append(sql)
+        return sql
+    def execute(self, query, params=()):
+        sql = self._substitute(query, params)
+        self.rows = list(self.server.answer(sql, list(params or ())))
+    def executemany(self, query, seq_params):
+        self.rowcount = 0
+        for params in seq_params:
+            sql = self._substitute(query, params)
+            self.rowcount += self.server.insert(sql, params)
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+class ScriptedMySQL(app.Database):
+    """The MySQL backend with its pool replaced by ScriptedCursor."""
+    def __init__(self, results):
+        super().__init__(dict(app.DB_DEFAULTS))
+        self.statements = []
+        self.users = {'alice': 1}
+        self.results = results      # (user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken, test_date)
+    @property
+    def connected(self):
+        return True
+    def _transaction(self, work, commit=False, **cursor_args):
+        return work(ScriptedCursor(self))
+    def answer(self, sql, params):
+        if 'FROM test_results t JOIN users u' in sql:
+            names = {v: k for k, v in self.users.items()}
+            return [(names[r[0]],) + tuple(r[1:]) + (n,) for n, r in enumerate(self.results, 1)]
+        if sql.startswith('SELECT username, id FROM users'):
+            return [(name, uid) for name, uid in self.users.items() if repr(name) in sql]
+        if 'FROM test_results' in sql:
+            return [tuple(r) for r in self.results]
+        return []
+    def insert(self, sql, params):
+        if 'INTO test_results' in sql:
+            self.results.append(tuple(params[:8]))
+            return 1
+        return 0
+
+def stored():
+    return [(1, Decimal('61.50'), Decimal('97.25'), Decimal('64.00'), 2, 'easy', 42, datetime(2024, 3, 5, 14, 7, 9))]
+
+def test_export_writes_real_dates(tmp_path):
+    db = ScriptedMySQL(stored())
+    path = tmp_path / 'out.csv'
+    assert db.export_results_to_csv(str(path), progress=False) == 1
+    with open(path, newline='', encoding='utf-8') as f:
+        row = next(csv.DictReader(f))
+    assert row['test_date'] == '2024-03-05 14:07:09'
+    assert row['wpm'] == '61.50'
+
+def test_import_of_an_export_skips_every_row(tmp_path):
+    db = ScriptedMySQL(stored())
+    path = tmp_path / 'out.csv'
+    db.export_results_to_csv(str(path), progress=False)
+    db.rebuild_user_best = lambda: 0
+    db.check_user_stats = lambda repair=False: 0
+    assert db.import_results_from_csv(str(path), progress=False) == (0, 1)
+    assert len(db.results) == 1
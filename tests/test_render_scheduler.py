@@ -0,0 +1,81 @@
+"""RenderScheduler and TypingLoop: frame pacing of the typing screen."""
+import math
+import time
+
+import typing_test_mysql as app
+
+
+def test_scheduler_caps_the_frame_rate():
+    frames = app.RenderScheduler(max_fps=10)
+    assert frames.wait(0.0) is None and not frames.due(0.0)
+    frames.mark()
+    assert frames.due(0.0)
+    frames.drawn(0.0)
+    frames.mark()
+    frames.mark()
+    assert not frames.due(0.05)
+    assert math.isclose(frames.wait(0.05), 0.05)
+    assert frames.due(0.1)
+    frames.drawn(0.1)
+    assert not frames.dirty and frames.frames == 2
+
+
+def test_no_cap_draws_every_change():
+    frames = app.RenderScheduler(max_fps=0)
+    frames.drawn(0.0)
+    frames.mark()
+    assert frames.due(0.0) and frames.wait(0.0) == 0.0
+
+
+class Screen:
+    """Stands in for TypingTest: applies keys to the session and records the frames drawn."""
+    def __init__(self):
+        self.frames = []
+    def apply_key(self, layout, session, key, now_ns):
+        return session.feed(key, now_ns)
+    def display_typing_interface(self, layout, session, current_wpm):
+        self.frames.append(session.typed_text)
+
+
+def test_a_burst_of_keys_shares_one_held_frame():
+    screen = Screen()
+    loop = app.TypingLoop(screen, None, app.TypingSession("abcdef"), max_fps=2)
+    loop.start()
+    loop.step(["a"])
+    loop.step(["b", "c"])
+    assert screen.frames == [""]
+    held = loop.timeout()
+    assert 0 < held <= 0.5
+    time.sleep(held)
+    loop.step([])
+    assert screen.frames == ["", "abc"]
+
+
+def test_the_final_frame_is_drawn_straight_away():
+    screen = Screen()
+    loop = app.TypingLoop(screen, None, app.TypingSession("abc"), max_fps=2)
+    loop.start()
+    loop.step(["a", "b"])
+    loop.step(["c"])
+    assert loop.done
+    assert screen.frames == ["", "abc"]
+
+
+def test_cancelling_draws_no_frame():
+    screen = Screen()
+    loop = app.TypingLoop(screen, None, app.TypingSession("abc"), max_fps=0)
+    loop.start()
+    loop.step(["a", app.Keys.ESCAPE])
+    assert loop.done and screen.frames == [""]
+
+
+def test_the_wpm_ticks_once_a_second_without_keys():
+    screen = Screen()
+    loop = app.TypingLoop(screen, None, app.TypingSession("abcdef"), max_fps=0)
+    loop.start()
+    assert loop.timeout() is None     # nothing to wait for before the first key
+    loop.step(["a"], now_ns=0)
+    assert 0.9 < loop.timeout() <= 1.0
+    loop.last_update -= 1.0
+    loop.step([], now_ns=12_000_000_000)
+    assert loop.current_wpm == 1.0 and len(screen.frames) == 3
@@ -0,0 +1,75 @@
+"""ResultJournal: crash-safe appends, idempotent sync and compaction."""
+import os
+import shutil
+
+import typing_test_mysql as app
+
+
+def open_db(tmp_path):
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'journal.db'))
+    db = app.open_database(config)
+    assert db.connect() and db.create_tables()
+    return db
+
+
+def result(username, wpm):
+    return {'username': username, 'wpm': wpm, 'accuracy': 98.0, 'raw_wpm': wpm, 'errors': 1,
+            'difficulty': 'easy', 'time_taken': 30}
+
+
+def stored_wpms(db):
+    return sorted(row[1] for row in db.get_leaderboard_page(None, 100, None))
+
+
+def test_a_torn_tail_is_cut_off(tmp_path):
+    path = str(tmp_path / 'results.journal')
+    journal = app.ResultJournal(path)
+    assert journal.append([result('amy', 50), result('bob', 60)]) == 2
+    journal.close()
+    intact = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(app.ResultJournal.HEADER.pack(100, 0) + b'{"username": "half')    # crashed mid-write
+    journal = app.ResultJournal(path)
+    assert journal.pending() == 2
+    assert os.path.getsize(path) == intact
+    journal.append([result('cat', 70)])
+    assert journal.pending() == 3
+    journal.close()
+
+
+def test_sync_is_idempotent(tmp_path):
+    db = open_db(tmp_path)
+    path = str(tmp_path / 'results.journal')
+    journal = app.ResultJournal(path)
+    try:
+        journal.append([result('amy', 50), result('bob', 60)])
+        journal.close()
+        shutil.copyfile(path, path + '.before')
+        assert journal.sync(db) == (2, 0)
+        assert not os.path.exists(path)
+        assert journal.sync(db) == (0, 0)
+        # a sync that stored everything but crashed before compacting runs again
+        shutil.copyfile(path + '.before', path)
+        assert journal.sync(db) == (2, 0)
+        assert stored_wpms(db) == [50, 60]
+    finally:
+        journal.close()
+        db.close()
+
+
+def test_a_stopped_sync_compacts_what_it_stored(tmp_path):
+    db = open_db(tmp_path)
+    journal = app.ResultJournal(str(tmp_path / 'results.journal'))
+    try:
+        journal.append([result('amy', 50), result('amy', 55), result('bob', 60), result('cat', 70)])
+        lookup = db.get_or_create_user
+        db.get_or_create_user = lambda username: None if username == 'bob' else lookup(username)
+        assert journal.sync(db, batch_size=2) == (2, 2)
+        assert journal.pending() == 2
+        del db.get_or_create_user
+        assert journal.sync(db, batch_size=2) == (2, 0)
+        assert journal.pending() == 0
+        assert stored_wpms(db) == [50, 55, 60, 70]
+    finally:
+        journal.close()
+        db.close()
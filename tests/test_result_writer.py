@@ -0,0 +1,53 @@
+"""ResultWriter batches against a SQLite database that refuses some of their results."""
+import typing_test_mysql as app
+
+
+def open_db(tmp_path):
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'writer.db'))
+    db = app.open_database(config)
+    assert db.connect() and db.create_tables()
+    return db
+
+
+def result(user_id, wpm):
+    return {'user_id': user_id, 'username': 'amy', 'wpm': wpm, 'accuracy': 99.0, 'raw_wpm': wpm, 'errors': 0,
+            'difficulty': 'easy', 'time_taken': 30}
+
+
+def test_a_rejected_result_only_sets_itself_aside(tmp_path):
+    db = open_db(tmp_path)
+    writer = app.ResultWriter(db, flush_interval=0.05)
+    try:
+        user_id = db.get_or_create_user('amy')
+        for r in (result(user_id, 50), result(user_id + 100, 60), result(user_id, 70)):    # no such user
+            assert writer.submit(r)
+        writer.flush()
+        assert [row[1] for row in db.get_leaderboard_page(None, 10, None)] == [70, 50]
+        assert [r['wpm'] for r in writer.failed] == [60]
+        assert writer.take_failures() == 1
+        assert writer.take_failures() == 0
+    finally:
+        writer.close()
+        db.close()
+
+
+def test_refused_results_are_journaled_and_dont_block_a_sync(tmp_path):
+    db = open_db(tmp_path)
+    journal = app.ResultJournal(str(tmp_path / 'results.journal'))
+    writer = app.ResultWriter(db, flush_interval=0.05, journal=journal)
+    try:
+        user_id = db.get_or_create_user('amy')
+        for r in (result(user_id, 50), result(user_id + 100, 60)):
+            assert writer.submit(r)
+        writer.flush()
+        assert writer.failed == [] and journal.pending() == 1
+        # journaled under the username, so the sync can store it; one the schema refuses stays behind
+        journal.append([dict(result(None, 70), difficulty='insane')])
+        journal.append([result(None, 90)])
+        assert journal.sync(db) == (2, 1)
+        assert journal.pending() == 1 and journal.sync(db) == (0, 1)
+        assert sorted(row[1] for row in db.get_leaderboard_page(None, 10, None)) == [50, 60, 90]
+    finally:
+        writer.close()
+        journal.close()
+        db.close()
@@ -0,0 +1,40 @@
+"""CSV export/import round trips through the SQLite backend."""
+import typing_test_mysql as app
+
+
+def test_rows_the_conflict_clause_drops_are_not_counted(tmp_path):
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'csv.db'))
+    db = app.open_database(config)
+    assert db.connect() and db.create_tables()
+    try:
+        path = str(tmp_path / 'results.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("username,wpm,accuracy,raw_wpm,errors,difficulty,time_taken,test_date\n"
+                    "amy,61.50,97.25,64.00,2,easy,42,2024-03-05 14:07:09\n")
+        assert db.import_results_from_csv(path, progress=False) == (1, 0)
+        # the stored row no longer matches the CSV, but it still holds the row's result_key
+        db._transaction(lambda cursor: cursor.execute("UPDATE test_results SET wpm = 70"), commit=True)
+        assert db.import_results_from_csv(path, progress=False) == (0, 1)
+    finally:
+        db.close()
+
+
+def test_incremental_exports_keep_a_mark_per_filter(tmp_path):
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'csv.db'))
+    db = app.open_database(config)
+    db.EXPORT_STATE_FILE = str(tmp_path / 'export_state.json')
+    assert db.connect() and db.create_tables()
+    try:
+        amy, bob = db.get_or_create_user('amy'), db.get_or_create_user('bob')
+        db.save_result(bob, 40, 90.0, 41, 3, 'easy', 30)
+        db.save_result(amy, 50, 95.0, 51, 1, 'easy', 30)
+        path = str(tmp_path / 'out.csv')
+        assert db.export_results_to_csv(path, username='amy', incremental=True, progress=False) == 1
+        assert db.export_results_to_csv(path, username='amy', incremental=True, progress=False) == 0
+        # bob's older row was never exported, whatever amy's mark says
+        assert db.export_results_to_csv(path, incremental=True, progress=False) == 2
+        db.save_result(amy, 60, 97.0, 61, 1, 'easy', 30)
+        assert db.export_results_to_csv(path, username='amy', incremental=True, progress=False) == 1
+        assert db.export_results_to_csv(path, incremental=True, progress=False) == 1
+    finally:
+        db.close()
@@ -0,0 +1,30 @@
+"""StorageBackend: the interface every backend implements, and SQLite's dates."""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import typing_test_mysql as app
+
+
+def test_a_backend_missing_a_method_fails_when_created():
+    class NoSchema(app.SQLiteDatabase):
+        _create_schema = app.StorageBackend._create_schema
+    with pytest.raises(TypeError, match='_create_schema'):
+        NoSchema(dict(app.DB_DEFAULTS, backend='sqlite'))
+
+
+def test_sqlite_dates_round_trip_without_global_adapters(tmp_path):
+    adapters, converters = dict(sqlite3.adapters), dict(sqlite3.converters)
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'dates.db'))
+    db = app.open_database(config)
+    assert db.connect() and db.create_tables()
+    try:
+        user_id = db.get_or_create_user('amy')
+        when = datetime(2024, 2, 29, 13, 45, 7)
+        db.save_result(user_id, 55.0, 98.0, 56.0, 1, 'easy', 30, test_date=when)
+        db.leaderboard_cache.invalidate()
+        assert db.get_leaderboard_page(None, 10, None)[0][3] == when
+    finally:
+        db.close()
+    assert (sqlite3.adapters, sqlite3.converters) == (adapters, converters)
@@ -0,0 +1,67 @@
+"""TypingSession: the headless typing state, its scoring and keystroke replay."""
+import typing_test_mysql as app
+
+SECOND = 1_000_000_000
+
+
+def feed(session, keys, start_ns=0, gap_ns=SECOND // 10):
+    return [session.feed(key, start_ns + i * gap_ns) for i, key in enumerate(keys)]
+
+
+def test_finishes_on_the_last_character_and_times_it():
+    session = app.TypingSession("abc")
+    assert feed(session, "abc", gap_ns=SECOND) == [app.TypingSession.CORRECT] * 3
+    assert session.finished and not session.cancelled
+    assert session.feed("x", 9 * SECOND) == app.TypingSession.IGNORED
+    metrics = session.metrics()
+    assert metrics['time_taken'] == 2.0
+    assert metrics['errors'] == 0 and metrics['accuracy'] == 100
+
+
+def test_escape_cancels_and_ignores_what_follows():
+    session = app.TypingSession("abc")
+    assert feed(session, ["a", app.Keys.ESCAPE, "b"]) == [
+        app.TypingSession.CORRECT, app.TypingSession.CANCELLED, app.TypingSession.IGNORED]
+    assert session.finished and session.cancelled
+    assert session.typed_text == "a"
+
+
+def test_the_clock_starts_at_the_first_typed_character():
+    session = app.TypingSession("ab")
+    assert session.feed(app.Keys.UP, 0) == app.TypingSession.IGNORED
+    assert session.feed(app.Keys.BACKSPACE, 0) == app.TypingSession.IGNORED
+    assert session.start_ns is None and session.elapsed(5 * SECOND) == 0
+    session.feed("a", 5 * SECOND)
+    assert session.elapsed(6 * SECOND) == 1.0
+
+
+def test_replaying_the_log_scores_like_the_live_session():
+    text = "The quick brown fox jumps over the lazy dog."
+    events = list(app.synthetic_keystrokes(text, wpm=70, error_rate=0.1, seed=7, jitter=0.3))
+    live = app.TypingSession(text, log=app.KeystrokeLog())
+    for t_ns, key in events:
+        live.feed(key, 10 * SECOND + t_ns)
+    assert live.finished and live.mistakes
+    replayed = app.replay_session(text, live.log.keys())
+    assert replayed.metrics() == live.metrics()
+    assert replayed.typed_text == text
+
+
+def test_backspace_keeps_the_counters_in_step():
+    session = app.TypingSession("abcd")
+    results = feed(session, ["a", "x", "y", app.Keys.BACKSPACE, app.Keys.BACKSPACE, "b", "q"])
+    assert results[3:5] == [app.TypingSession.BACKSPACE] * 2
+    assert session.typed_text == "abq"
+    assert (session.correct, session.errors, session.mistakes, session.corrected) == (2, 1, 3, 2)
+    assert session.accuracy() == 2 / 3 * 100
+    # backspacing over a right character takes it off `correct`, not `corrected`
+    session.feed(app.Keys.BACKSPACE, SECOND)
+    session.feed(app.Keys.BACKSPACE, SECOND)
+    assert session.typed_text == "a"
+    assert (session.correct, session.errors, session.corrected) == (1, 0, 3)
+
+
+def test_enter_types_a_space():
+    session = app.TypingSession("a b")
+    assert feed(session, ["a", app.Keys.ENTER, "b"]) == [app.TypingSession.CORRECT] * 3
+    assert session.typed_text == "a b"
@@ -0,0 +1,39 @@
+"""check_user_stats against a SQLite database whose rollups have drifted."""
+import sqlite3
+
+import typing_test_mysql as app
+
+
+def test_check_finds_and_repairs_drift_once_per_row(tmp_path):
+    config = dict(app.DB_DEFAULTS, backend='sqlite', sqlite_path=str(tmp_path / 'stats.db'), retries=2)
+    db = app.open_database(config)
+    assert db.connect() and db.create_tables()
+    try:
+        users = [db.get_or_create_user(f"user{i}") for i in range(5)]
+        for n, user_id in enumerate(users):
+            for wpm in range(40, 40 + n + 1):
+                db.save_result(user_id, wpm, 95.0, wpm, 1, 'easy' if wpm % 2 else 'hard', 30)
+        assert db.check_user_stats(batch_users=2) == 0
+        def drift(cursor):
+            cursor.execute("UPDATE user_stats SET test_count = test_count + 1 WHERE user_id = %s AND difficulty = 'all'",
+                           (users[3],))
+            cursor.execute("DELETE FROM user_stats WHERE user_id = %s", (users[4],))
+        db._transaction(drift, commit=True)
+        # each batch fails once after reading everything, the way a lost connection would
+        transaction, failed = db._transaction, set()
+        def flaky(work, commit=False, **cursor_args):
+            def attempt(cursor):
+                result = work(cursor)
+                if result not in failed:
+                    failed.add(result)
+                    raise sqlite3.OperationalError("database is locked")
+                return result
+            return transaction(attempt, commit, **cursor_args)
+        db._transaction = flaky
+        # user4's rollups for 'all', 'easy' and 'hard' are missing, user3's 'all' is wrong
+        assert db.check_user_stats(batch_users=2) == 4
+        db._transaction = transaction
+        assert db.check_user_stats(repair=True, batch_users=2) == 4
+        assert db.check_user_stats(batch_users=2) == 0
+    finally:
+        db.close()
@@ -0,0 +1,415 @@
+"""Network server mode for the speed typing test.
+
+Serves the typing test, its menus and the leaderboard to many players at
+once over plain TCP, for telnet (or any client that shows ANSI output):
+
+    python typing_server.py --port 2323
+    telnet localhost 2323
+
+Every connection gets its own TypingTest for screen state, but all of them
+share one database connection pool, one corpus index, one leaderboard
+cache and one result writer. Everything that can wait on the database
+(logins, leaderboard pages, saving results) runs on a thread pool no
+larger than the connection pool, so the event loop only ever decodes
+keys and draws frames.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import sys
+
+import typing_test_mysql as app
+from typing_test_mysql import Colors, Keys
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA, NAWS = 1, 3, 31
+
+class Disconnected(Exception):
+    """The client closed the connection, pressed Ctrl+C or went idle."""
+
+class TelnetFilter:
+    """Strips telnet commands from the client's byte stream.
+
+    Commands split across reads are held back until complete. The window
+    size the client reports (NAWS) is kept in `columns`.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.columns = None
+    def feed(self, data):
+        """Add `data` and return the bytes that are keyboard input."""
+        self.buffer += data
+        buf = self.buffer
+        out = bytearray()
+        pos = 0
+        while pos < len(buf):
+            iac = buf.find(IAC, pos)
+            if iac < 0:
+                out += buf[pos:]
+                pos = len(buf)
+                break
+            out += buf[pos:iac]
+            pos = iac
+            if pos + 1 >= len(buf):
+                break
+            cmd = buf[pos + 1]
+            if cmd == IAC:
+                out.append(IAC)
+                pos += 2
+            elif cmd in (WILL, WONT, DO, DONT):
+                if pos + 2 >= len(buf):
+                    break
+                pos += 3
+            elif cmd == SB:
+                end = buf.find(bytes((IAC, SE)), pos + 2)
+                if end < 0:
+                    break
+                self._subnegotiation(bytes(buf[pos + 2:end]))
+                pos = end + 2
+            else:
+                pos += 2
+        del buf[:pos]
+        return bytes(out)
+    def _subnegotiation(self, data):
+        data = data.replace(bytes((IAC, IAC)), bytes((IAC,)))
+        if len(data) >= 5 and data[0] == NAWS:
+            self.columns = (data[1] << 8 | data[2]) or None
+
+class ClientStream:
+    """File-like view of a client socket for FrameRenderer and the session's print()."""
+    def __init__(self, writer):
+        self.writer = writer
+    def write(self, text):
+        self.writer.write(text.replace('\n', '\r\n').encode('utf-8'))
+    def flush(self):
+        pass    # the session awaits drain() after each frame
+
+class ClientBell:
+    """Stands in for AudioFeedback: a wrong key rings the client's terminal bell."""
+    def __init__(self, stream):
+        self.stream = stream
+    def start(self):
+        pass
+    def error(self):
+        self.stream.write('\a')
+    def close(self):
+        pass
+
+class ClientSession:
+    """One connected player: the menus, the typing test and the leaderboard."""
+    DIFFICULTIES = [
+        ("🟢 Easy", 'easy'), ("🟡 Medium", 'medium'), ("🟣 Hard", 'hard'), ("🔴 Extreme", 'extreme'),
+    ]
+    LEADERBOARDS = [
+        ("Global (All Difficulties)", None), ("Easy", 'easy'), ("Medium", 'medium'),
+        ("Hard", 'hard'), ("Extreme", 'extreme'),
+    ]
+    PAGE_SIZE = 20
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.telnet = TelnetFilter()
+        self.decoder = app.KeyDecoder()
+        self.stream = ClientStream(writer)
+        game = app.TypingTest(db=server.db, corpus=server.corpus, writer=server.writer, journal=server.journal)
+        game.renderer = app.FrameRenderer(self.stream)
+        game.audio = ClientBell(self.stream)
+        game.columns = 121      # until the client reports its size, not the server's terminal
+        self.game = game
+    @property
+    def width(self):
+        return self.game.screen_width()
+    async def blocking(self, func, *args):
+        """Run a call that may wait on the database on the server's thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.server.executor, func, *args)
+    def print(self, *lines):
+        for line in lines:
+            self.stream.write(line + '\n')
+    async def drain(self):
+        await self.writer.drain()
+    async def _read(self, timeout):
+        try:
+            data = await asyncio.wait_for(self.reader.read(app.TerminalSession.READ_SIZE), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if not data:
+            raise Disconnected()
+        data = self.telnet.feed(data)
+        if self.telnet.columns:
+            self.game.columns = self.telnet.columns
+        return data
+    async def read_keys(self, timeout=None):
+        """Like TerminalSession.read_keys: the keys that arrive within `timeout` seconds.
+
+        Waiting forever is capped by the server's idle timeout, after which
+        the client is disconnected, as it is on EOF and Ctrl+C.
+        """
+        data = await self._read(timeout if timeout is not None else self.server.idle_timeout)
+        if data is None:
+            if timeout is None:
+                raise Disconnected()
+            return []
+        keys = self.decoder.feed(data)
+        while self.decoder.pending_escape():
+            data = await self._read(app.TerminalSession.ESC_TIMEOUT)
+            keys += self.decoder.feed(data) if data is not None else self.decoder.flush()
+        if Keys.INTERRUPT in keys:
+            raise Disconnected()
+        return keys
+    async def read_line(self, prompt):
+        """Read a line with echo (the server, not the client, echoes keys)."""
+        self.stream.write(prompt)
+        await self.drain()
+        chars = []
+        while True:
+            for key in await self.read_keys():
+                if key == Keys.ENTER:
+                    self.stream.write('\n')
+                    return ''.join(chars).strip()
+                if key == Keys.BACKSPACE:
+                    if chars:
+                        chars.pop()
+                        self.stream.write('\b \b')
+                elif len(key) == 1 and key.isprintable():
+                    chars.append(key)
+                    self.stream.write(key)
+            await self.drain()
+    async def wait_enter(self, prompt):
+        """Show `prompt` and wait for ENTER (True) or ESC (False)."""
+        self.print(prompt)
+        await self.drain()
+        while True:
+            for key in await self.read_keys():
+                if key == Keys.ENTER:
+                    return True
+                if key == Keys.ESCAPE:
+                    return False
+    async def menu(self, labels, title, show_cancel=True):
+        """Arrow-key menu; the selected index, or None on ESC."""
+        current = 0
+        game = self.game
+        game.renderer.invalidate()
+        while True:
+            game.renderer.render(game.menu_frame(labels, current, title, show_cancel=show_cancel))
+            await self.drain()
+            for key in await self.read_keys():
+                if key == Keys.UP:
+                    current = (current - 1) % len(labels)
+                elif key == Keys.DOWN:
+                    current = (current + 1) % len(labels)
+                elif key == Keys.ENTER:
+                    return current
+                elif key == Keys.ESCAPE and show_cancel:
+                    return None
+    async def run(self):
+        self.writer.write(bytes((IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, NAWS)))
+        game = self.game
+        game.clear_screen = lambda: self.stream.write('\033[H\033[J')
+        game.clear_screen()
+        self.print(f"{Colors.CYAN}{Colors.BOLD}Welcome to the Ultimate Speed Typing Test!{Colors.RESET}",
+                   f"{Colors.GRAY}-------------------------------------------{Colors.RESET}", "")
+        await self.login()
+        options = [label for label, _ in game.MAIN_MENU[:2]] + ["🚪 Exit"]
+        while True:
+            sel = await self.menu(options, "SPEED TYPING TEST", show_cancel=False)
+            if sel == 0:
+                sel = await self.menu([label for label, _ in self.DIFFICULTIES] + ["⬅️  Back"], "SELECT DIFFICULTY")
+                if sel is not None and sel < len(self.DIFFICULTIES):
+                    await self.typing_test(self.DIFFICULTIES[sel][1])
+            elif sel == 1:
+                sel = await self.menu([label for label, _ in self.LEADERBOARDS] + ["Back to Main Menu"],
+                                      "Select Leaderboard")
+                if sel is not None and sel < len(self.LEADERBOARDS):
+                    await self.leaderboard(self.LEADERBOARDS[sel][1])
+            else:
+                game.clear_screen()
+                self.print(f"{Colors.GREEN}Thanks for using Speed Typing Test! Goodbye!{Colors.RESET}")
+                await self.drain()
+                return
+    async def login(self):
+        game = self.game
+        while not game.username:
+            game.username = await self.read_line(f"{Colors.YELLOW}Enter your username: {Colors.RESET}") or None
+        if self.server.db.connected:
+            game.current_user_id = await self.blocking(self.server.db.get_or_create_user, game.username)
+        if game.current_user_id:
+            self.print(f"{Colors.GREEN}Welcome, {game.username}!{Colors.RESET}")
+        else:
+            self.print(f"{Colors.YELLOW}Database unavailable: results will be kept on the server and uploaded later.{Colors.RESET}")
+        await self.drain()
+        await asyncio.sleep(1)
+    async def typing_test(self, difficulty):
+        game = self.game
+        try:
+            paragraph = await self.blocking(game.corpus.pick, difficulty,
+                                            game.username if game.NO_REPEAT else None)
+        except Exception as e:
+            paragraph = None
+            self.print(f"{Colors.RED}Error loading text: {e}{Colors.RESET}")
+        if paragraph is None:
+            await self.wait_enter(f"{Colors.RED}No paragraphs available.{Colors.RESET} Press ENTER...")
+            return
+        text = paragraph.text
+        game.clear_screen()
+        self.print(f"{Colors.GREEN}{Colors.BOLD}Get ready to type!{Colors.RESET}",
+                   f"{Colors.CYAN}Difficulty: {difficulty.upper()}{Colors.RESET}", "",
+                   f"{Colors.BOLD}Text preview:{Colors.RESET}", "")
+        self.print(*(f"{Colors.GRAY}{line}{Colors.RESET}" for line in text.split('\n')))
+        if not await self.wait_enter(f"\n{Colors.GREEN}Press ENTER when ready, ESC to go back...{Colors.RESET}"):
+            return
+        session = app.TypingSession(text.replace('\n', ''), log=app.KeystrokeLog())
+        app.TESTS_STARTED.inc()
+        layout = game.get_layout(text, self.width)
+        self.stream.write('\033[?25l')
+        game.renderer.invalidate()
+        try:
+            loop = app.TypingLoop(game, layout, session, self.server.max_fps)
+            loop.start()
+            await self.drain()
+            while not loop.done:
+                loop.step(await self.read_keys(loop.timeout()))
+                await self.drain()
+        finally:
+            self.stream.write('\033[?25h')
+        if session.cancelled:
+            app.TESTS_CANCELLED.inc()
+            self.print("", "", f"{Colors.RED}Test cancelled!{Colors.RESET}")
+            await self.wait_enter(f"{Colors.YELLOW}Press ENTER to continue...{Colors.RESET}")
+            return
+        app.TESTS_COMPLETED.inc()
+        result = session.metrics()
+        game.clear_screen()
+        self.print(*game.results_lines(result['net_wpm'], result['raw_wpm'], result['accuracy'],
+                                       result['errors'], result['time_taken'], difficulty))
+        if session.start_ns is not None:
+            record = game.result_record(result, difficulty, paragraph, session.log)
+            if not (game.current_user_id and await self.blocking(game.writer.submit, record)):
+                try:
+                    await self.blocking(game.journal.append, [record])
+                    app.RESULTS_JOURNALED.inc()
+                    self.print(f"{Colors.YELLOW}Result saved offline; it will be uploaded once the database is reachable.{Colors.RESET}")
+                except OSError as e:
+                    app.RESULTS_FAILED.inc()
+                    self.print(f"{Colors.RED}Your result could not be saved: {e}{Colors.RESET}")
+        await self.wait_enter(f"{Colors.YELLOW}Press ENTER to continue...{Colors.RESET}")
+    async def leaderboard(self, difficulty):
+        game = self.game
+        width = 120
+        title = f"🏆 {'GLOBAL' if not difficulty else difficulty.upper()} LEADERBOARD 🏆"
+        pages = [None]
+        while True:
+            rows = await self.blocking(game.db.get_leaderboard_page, difficulty, self.PAGE_SIZE, pages[-1])
+            game.clear_screen()
+            self.print(f"{Colors.YELLOW}{Colors.BOLD}╔{'═' * (width-2)}╗{Colors.RESET}",
+                       f"{Colors.YELLOW}{Colors.BOLD}║{title.center(width-2)}║{Colors.RESET}",
+                       f"{Colors.YELLOW}{Colors.BOLD}╚{'═' * (width-2)}╝{Colors.RESET}", "")
+            if not rows and len(pages) == 1:
+                await self.wait_enter(f"{Colors.RED}No data available yet. Be the first to take a test!{Colors.RESET}")
+                return
+            self.print(*game.leaderboard_table(rows, (len(pages) - 1) * self.PAGE_SIZE + 1, width))
+            if game.current_user_id:
+                rank = await self.blocking(game.db.get_user_rank, game.current_user_id, difficulty)
+                if rank is not None:
+                    self.print(f"{Colors.YELLOW}Your best ranks #{rank} among players{Colors.RESET}", "")
+            has_next = len(rows) == self.PAGE_SIZE
+            choices = (["N = next page"] if has_next else []) + (["P = previous page"] if len(pages) > 1 else [])
+            self.stream.write(f"{Colors.YELLOW}{' · '.join(choices + ['ENTER to continue'])}{Colors.RESET}")
+            await self.drain()
+            while True:
+                keys = [k.lower() for k in await self.read_keys() if len(k) == 1]
+                if 'n' in keys and has_next:
+                    pages.append(rows[-1])
+                elif 'p' in keys and len(pages) > 1:
+                    pages.pop()
+                elif Keys.ENTER in keys or Keys.ESCAPE in keys:
+                    return
+                else:
+                    continue
+                break
+
+class TypingServer:
+    """Accepts players and holds the services their sessions share."""
+    def __init__(self, host='0.0.0.0', port=2323, max_sessions=500, idle_timeout=600.0,
+                 max_fps=app.RenderScheduler.DEFAULT_FPS):
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_fps = max_fps
+        self.db = app.open_database()
+        self.corpus = app.CorpusIndex()
+        self.journal = app.ResultJournal()
+        self.writer = app.ResultWriter(self.db, journal=self.journal)
+        # the writer thread keeps one pooled connection for itself
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max(1, int(self.db.config.get('pool_size', 5)) - 1), thread_name_prefix="typing-db")
+        self.sessions = set()
+        app.SESSIONS.set_function(lambda: len(self.sessions))
+    async def handle(self, reader, writer):
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(f"{Colors.RED}The server is full, please try again later.{Colors.RESET}\r\n".encode('utf-8'))
+            await writer.drain()
+            writer.close()
+            return
+        session = ClientSession(self, reader, writer)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except (Disconnected, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"{Colors.RED}Session error: {e}{Colors.RESET}", file=sys.stderr)
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+    def prepare(self):
+        """Connect to the database and upload any journaled results; False if running offline."""
+        if not self.db.connect() or not self.db.create_tables():
+            print(f"{Colors.YELLOW}Database unavailable: results will be journaled until it is back.{Colors.RESET}")
+            return False
+        synced, remaining = self.journal.sync(self.db)
+        if synced or remaining:
+            print(f"{Colors.GREEN}Uploaded {synced} journaled result(s), {remaining} left{Colors.RESET}")
+        return True
+    async def serve(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.prepare)
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"{Colors.CYAN}Serving the typing test on "
+              f"{', '.join(str(s.getsockname()[:2]) for s in server.sockets)}{Colors.RESET}")
+        async with server:
+            await server.serve_forever()
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.writer.close()
+        self.journal.close()
+        if self.db.connected:
+            self.db.close()
+
+def main(argv=None):
+    app.enable_ansi_colors()
+    parser = argparse.ArgumentParser(description="Speed typing test server (telnet-style)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=2323)
+    parser.add_argument('--max-sessions', type=int, default=500, help="players connected at once")
+    parser.add_argument('--idle-timeout', type=float, default=600.0,
+                        help="seconds without a key before a player is disconnected")
+    parser.add_argument('--max-fps', type=float, default=app.RenderScheduler.DEFAULT_FPS,
+                        help="most typing-test frames sent to a player per second; 0 sends one per read")
+    parser.add_argument('--metrics-port', type=int, default=0, metavar='PORT',
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args(argv)
+    if args.metrics_port:
+        app.METRICS.serve(args.metrics_port)
+    server = TypingServer(args.host, args.port, args.max_sessions, args.idle_timeout, args.max_fps)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print(f"\n{Colors.RED}Server stopped.{Colors.RESET}")
+    finally:
+        server.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
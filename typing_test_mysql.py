@@ -2,26 +2,62 @@ import time
 import random
 import os
 import sys
-from datetime import datetime
-import mysql.connector
-from mysql.connector import Error
-import winsound
+import re
+import shutil
+from datetime import date, datetime, timedelta
 import csv
-
-try:
-    if os.name == 'nt':
-        import colorama
-        colorama.init()
-except Exception:
-    pass
+import base64
+import hashlib
+import itertools
+import json
+import math
+import collections
+import bisect
+import argparse
+import abc
+import queue
+import atexit
+import threading
+import configparser
+import codecs
+import struct
+import zlib
+import io
+import tempfile
+import importlib
+from array import array
+import select
+import unicodedata
 
 if os.name == 'nt':
     import msvcrt
-    import winsound
 else:
     import tty
     import termios
 
+# Optional and platform-specific modules (the MySQL driver, winsound,
+# colorama) are imported on first use, so starting the game never waits on
+# them and a missing one only disables the feature that needs it. sqlite3
+# goes through here too; the stdlib modules only some features need (gzip,
+# mmap, wave, subprocess, uuid, http.server) are imported where they're used.
+OPTIONAL_MODULES = {}
+
+def optional_import(name):
+    """The named module, imported on first call; None if it isn't available here."""
+    if name not in OPTIONAL_MODULES:
+        try:
+            OPTIONAL_MODULES[name] = importlib.import_module(name)
+        except ImportError:
+            OPTIONAL_MODULES[name] = None
+    return OPTIONAL_MODULES[name]
+
+def enable_ansi_colors():
+    """Let older Windows consoles render the ANSI colour codes (needs colorama)."""
+    if os.name == 'nt':
+        colorama = optional_import('colorama')
+        if colorama is not None:
+            colorama.init()
+
 class Colors:
     RESET = '\033[0m'
     RED = '\033[91m'
@@ -62,194 +98,1481 @@ class Box:
         box = Box.SINGLE if style == 'single' else Box.DOUBLE
         return f"{color}{box['bottom_left']}{box['horizontal'] * (width-2)}{box['bottom_right']}{Colors.RESET}"
 
-class KeyboardInput:
+    _escape = re.compile(r'\033\[[0-9;?]*[A-Za-z]')
+
     @staticmethod
-    def get_char():
-        if os.name == 'nt':
-            if msvcrt.kbhit():
-                char = msvcrt.getch()
-                if char == b'\xe0': 
-                    msvcrt.getch()
-                    return None
-                elif char == b'\r': #Enter 
-                    return '\n'
-                elif char == b'\x08': #Backspace
-                    return '\b'
-                elif char == b'\x1b': #Escape
-                    return '\x1b'
-                try:
-                    return char.decode('utf-8')
-                except:
-                    return None
+    def clip(text, width):
+        """Cut `text` to `width` terminal columns, skipping ANSI codes and counting wide characters twice."""
+        columns = 0
+        pos = 0
+        while pos < len(text):
+            match = Box._escape.match(text, pos)
+            if match:
+                pos = match.end()
+                continue
+            ch = text[pos]
+            if unicodedata.category(ch) in ('Mn', 'Me', 'Cf'):
+                size = 0
+            else:
+                size = 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+            if columns + size > width:
+                return text[:pos] + Colors.RESET
+            columns += size
+            pos += 1
+        return text
+
+class FrameRenderer:
+    """Keeps the last frame on screen and repaints only what changed.
+
+    A frame is a list of rows. A row is either a plain string, rewritten as a
+    whole when it differs, or a list of single-column styled cells, of which
+    only the changed cells are rewritten. Each frame goes out in one write.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.previous = None
+    def invalidate(self):
+        """Forget the previous frame so the next render repaints everything."""
+        self.previous = None
+    def render(self, rows, dirty=None):
+        """Draw `rows`, writing only the difference from the previous frame.
+
+        `dirty`, when given, is the set of cell-row indices that may have
+        changed since the last frame; other cell rows are assumed unchanged
+        and are not compared at all.
+        """
+        out = []
+        previous = self.previous
+        if previous is None:
+            out.append('\033[H\033[J')
+            previous = []
+            dirty = None
+        current = []
+        for y, row in enumerate(rows):
+            old = previous[y] if y < len(previous) else None
+            if isinstance(row, list):
+                if dirty is not None and y not in dirty and old is not None:
+                    current.append(old)
+                    continue
+                current.append(list(row))
+            else:
+                current.append(row)
+            if old == row:
+                continue
+            if isinstance(row, list) and isinstance(old, list) and len(old) == len(row):
+                out.extend(self._diff_cells(y, old, row))
+            else:
+                out.append(f"\033[{y + 1};1H\033[2K")
+                out.append(row if isinstance(row, str) else ''.join(row))
+        for y in range(len(rows), len(previous)):
+            out.append(f"\033[{y + 1};1H\033[2K")
+        self.previous = current
+        if out:
+            out.append(Colors.RESET)
+            self.stream.write(''.join(out))
+            self.stream.flush()
+    @staticmethod
+    def _diff_cells(y, old, new):
+        out = []
+        x = 0
+        width = len(new)
+        while x < width:
+            if old[x] == new[x]:
+                x += 1
+                continue
+            start = x
+            while x < width and old[x] != new[x]:
+                x += 1
+            out.append(f"\033[{y + 1};{start + 1}H")
+            out.extend(new[start:x])
+        return out
+
+class RenderScheduler:
+    """Caps how often a changing screen is redrawn.
+
+    mark() records that the state behind the frame changed. A dirty frame
+    is due() once 1/max_fps seconds have passed since the last one was
+    drawn(); until then wait() says how long to sleep before it is, so the
+    keys of a burst share a frame that still goes out at most one interval
+    after the last of them. max_fps of 0 or None draws every change.
+    """
+    DEFAULT_FPS = 60    # what most displays refresh at; a terminal can't tell us its real rate
+
+    def __init__(self, max_fps=DEFAULT_FPS):
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.dirty = False
+        self.last = -math.inf
+        self.frames = 0
+    def mark(self):
+        self.dirty = True
+    def due(self, now):
+        return self.dirty and now - self.last >= self.interval
+    def wait(self, now):
+        """Seconds until the pending frame is due, or None if nothing is pending."""
+        if not self.dirty:
             return None
+        return max(0.0, self.last + self.interval - now)
+    def drawn(self, now):
+        self.dirty = False
+        self.last = now
+        self.frames += 1
+
+class ParagraphLayout:
+    """Render model for one paragraph, built once per paragraph and width.
+
+    Every typeable character gets its four styled variants encoded up front
+    (pending, cursor, correct, wrong) and a fixed (row, column) on screen.
+    `rows` holds the glyph currently shown in each cell; changing a state
+    swaps one cell and remembers its row as dirty for the next frame.
+    """
+    PENDING, CURSOR, CORRECT, WRONG = range(4)
+    STYLES = (
+        (Colors.GRAY,),
+        (Colors.YELLOW, Colors.UNDERLINE),
+        (Colors.GREEN,),
+        (Colors.RED, Colors.BOLD),
+    )
+    _glyph_cache = {}
+
+    def __init__(self, lines):
+        self.rows = []
+        self.glyphs = []
+        self.positions = []
+        for r, line in enumerate(lines):
+            self.rows.append([])
+            for c, ch in enumerate(line):
+                variants = self._glyph_cache.get(ch)
+                if variants is None:
+                    variants = tuple(f"{''.join(style)}{ch}{Colors.RESET}" for style in self.STYLES)
+                    self._glyph_cache[ch] = variants
+                self.glyphs.append(variants)
+                self.positions.append((r, c))
+                self.rows[r].append(variants[self.PENDING])
+        self.states = bytearray(len(self.glyphs))
+        self.dirty = set()
+        self.reset()
+    def __len__(self):
+        return len(self.glyphs)
+    def reset(self):
+        """Show every character as pending with the cursor on the first one."""
+        for i, variants in enumerate(self.glyphs):
+            r, c = self.positions[i]
+            self.rows[r][c] = variants[self.PENDING]
+        self.states[:] = bytes(len(self.states))
+        self.dirty = set(range(len(self.rows)))
+        self.set_state(0, self.CURSOR)
+    def set_state(self, index, state):
+        if index >= len(self.glyphs) or self.states[index] == state:
+            return
+        self.states[index] = state
+        r, c = self.positions[index]
+        self.rows[r][c] = self.glyphs[index][state]
+        self.dirty.add(r)
+    def take_dirty(self):
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+class Keys:
+    ENTER = '\n'
+    BACKSPACE = '\b'
+    ESCAPE = '\x1b'
+    INTERRUPT = '\x03'
+    UP = 'KEY_UP'
+    DOWN = 'KEY_DOWN'
+    RIGHT = 'KEY_RIGHT'
+    LEFT = 'KEY_LEFT'
+
+class KeyDecoder:
+    """Streaming decoder from raw terminal bytes to key events.
+
+    Bytes can be fed in arbitrary chunks: escape sequences and UTF-8
+    characters split across reads are held back until complete. A bare ESC
+    stays pending until flush() is called, which the terminal session does
+    once no further byte arrives within its ESC timeout.
+    """
+    SEQUENCES = {
+        b'[A': Keys.UP, b'[B': Keys.DOWN, b'[C': Keys.RIGHT, b'[D': Keys.LEFT,
+        b'OA': Keys.UP, b'OB': Keys.DOWN, b'OC': Keys.RIGHT, b'OD': Keys.LEFT,
+    }
+    CONTROLS = {
+        0x0d: Keys.ENTER, 0x0a: Keys.ENTER, 0x7f: Keys.BACKSPACE, 0x08: Keys.BACKSPACE,
+        0x03: Keys.INTERRUPT,
+    }
+    _control = re.compile(rb'[\x00-\x1f\x7f]')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.text = codecs.getincrementaldecoder('utf-8')('replace')
+        self.last_cr = False
+    def feed(self, data):
+        """Add `data` to the stream and return the keys it completes."""
+        self.buffer += data
+        keys = []
+        buf = self.buffer
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            match = self._control.search(buf, pos)
+            stop = match.start() if match else end
+            if stop > pos:
+                keys.extend(self.text.decode(bytes(buf[pos:stop])))
+                self.last_cr = False
+                pos = stop
+                continue
+            byte = buf[pos]
+            if byte == 0x1b:
+                consumed = self._escape(buf, pos, keys)
+                if consumed == 0:
+                    break
+                pos += consumed
+                self.last_cr = False
+                continue
+            if byte == 0x0a and self.last_cr:
+                # CR LF (e.g. in pasted text) is a single Enter
+                self.last_cr = False
+                pos += 1
+                continue
+            self.last_cr = byte == 0x0d
+            key = self.CONTROLS.get(byte)
+            if key:
+                keys.append(key)
+            pos += 1
+        del buf[:pos]
+        return keys
+    def _escape(self, buf, pos, keys):
+        """Decode the escape sequence at `pos`; return bytes consumed, 0 if incomplete."""
+        if pos + 1 >= len(buf):
+            return 0
+        intro = buf[pos + 1]
+        if intro not in (0x5b, 0x4f):  # '[' or 'O'
+            keys.append(Keys.ESCAPE)
+            return 1
+        i = pos + 2
+        if intro == 0x5b:
+            while i < len(buf) and 0x20 <= buf[i] <= 0x3f:
+                i += 1
+        if i >= len(buf):
+            return 0
+        key = self.SEQUENCES.get(bytes(buf[pos + 1:i + 1]))
+        if key:
+            keys.append(key)
+        return i + 1 - pos
+    def pending_escape(self):
+        return bool(self.buffer) and self.buffer[0] == 0x1b
+    def flush(self):
+        """Give up waiting on a partial escape sequence: it was a bare ESC."""
+        if not self.pending_escape():
+            return []
+        del self.buffer[:1]
+        return [Keys.ESCAPE] + self.feed(b'')
+
+class TerminalSession:
+    """Raw-mode terminal session shared by the menus and the typing test.
+
+    Raw mode is entered once for the whole `with` block (output processing
+    stays on, so print() still works). Keys are read in bulk and decoded by
+    a KeyDecoder, so a paste arrives as a single read.
+    """
+    ESC_TIMEOUT = 0.05
+    READ_SIZE = 4096
+
+    def __init__(self):
+        self.decoder = KeyDecoder()
+        self.depth = 0
+        self.saved = None
+        self.profile = None     # a LatencyProfile while a profiled test is running
+        self.woke_ns = 0
+    def __enter__(self):
+        self.depth += 1
+        if self.depth == 1 and os.name != 'nt':
+            fd = sys.stdin.fileno()
+            self.saved = termios.tcgetattr(fd)
+            tty.setraw(fd)
+            mode = termios.tcgetattr(fd)
+            mode[1] |= termios.OPOST
+            termios.tcsetattr(fd, termios.TCSADRAIN, mode)
+        return self
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0 and self.saved is not None:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self.saved)
+            self.saved = None
+        return False
+    def read_keys(self, timeout=None):
+        """Wait up to `timeout` seconds (None waits forever) and return the keys read.
+
+        Returns an empty list on timeout. Ctrl+C raises KeyboardInterrupt.
+        """
+        profile = self.profile
+        if os.name == 'nt':
+            keys = self._read_console(timeout)
+            if profile is not None:
+                self.woke_ns = time.perf_counter_ns()
         else:
             fd = sys.stdin.fileno()
-            old_settings = termios.tcgetattr(fd)
-            try:
-                tty.setraw(fd)
-                import select
-                if select.select([sys.stdin], [], [], 0)[0]:
-                    char = sys.stdin.read(1)
-                    if char == '\x7f':
-                        return '\b'
-                    elif char == '\x1b':
-                        next_chars = sys.stdin.read(2)
-                        return None
-                    return char
-                return None
-            finally:
-                termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+            if not select.select([fd], [], [], timeout)[0]:
+                return []
+            if profile is not None:
+                self.woke_ns = time.perf_counter_ns()
+            keys = self.decoder.feed(os.read(fd, self.READ_SIZE))
+            while self.decoder.pending_escape():
+                if select.select([fd], [], [], self.ESC_TIMEOUT)[0]:
+                    keys += self.decoder.feed(os.read(fd, self.READ_SIZE))
+                else:
+                    keys += self.decoder.flush()
+            if profile is not None:
+                profile.read.record(time.perf_counter_ns() - self.woke_ns)
+        if Keys.INTERRUPT in keys:
+            raise KeyboardInterrupt
+        return keys
+    def read_key(self):
+        """Block until at least one key arrives and return the first one."""
+        keys = []
+        while not keys:
+            keys = self.read_keys()
+        return keys[0]
+    @staticmethod
+    def _read_console(timeout):
+        # The Windows console has no select(); poll kbhit, then drain everything waiting
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not msvcrt.kbhit():
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            time.sleep(0.005)
+        keys = []
+        arrows = {'H': Keys.UP, 'P': Keys.DOWN, 'M': Keys.RIGHT, 'K': Keys.LEFT}
+        while msvcrt.kbhit():
+            char = msvcrt.getwch()
+            if char in ('\x00', '\xe0'):
+                key = arrows.get(msvcrt.getwch())
+                if key:
+                    keys.append(key)
+            elif char == '\r':
+                keys.append(Keys.ENTER)
+            else:
+                keys.append(char)
+        return keys
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram that records without allocating.
+
+    Buckets are spaced four to an octave from 1 µs to about 1 s, plus one
+    overflow bucket; the counts live in a preallocated array. Percentiles
+    are reported as the upper bound of their bucket (within 19%), the
+    maximum exactly.
+    """
+    BOUNDS = [int(1000 * 2 ** (i / 4)) for i in range(81)]
 
-class Database:
     def __init__(self):
-        self.connection = None
+        self.counts = array('q', bytes(8 * (len(self.BOUNDS) + 1)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+    def record(self, ns):
+        self.counts[bisect.bisect_left(self.BOUNDS, ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+    def reset(self):
+        counts = self.counts
+        for i in range(len(counts)):
+            counts[i] = 0
+        self.count = self.total = self.max = 0
+    def percentile(self, q):
+        """Upper bound in ns of the bucket holding the `q` quantile (0 < q <= 1)."""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_us': round(self.total / self.count / 1000, 1) if self.count else 0,
+            'p50_us': round(self.percentile(0.5) / 1000, 1),
+            'p99_us': round(self.percentile(0.99) / 1000, 1),
+            'max_us': round(self.max / 1000, 1),
+        }
+
+class LatencyProfile:
+    """Where the time goes between a key arriving and its frame reaching the terminal.
+
+    Stages, each a LatencyHistogram: `read` decodes the keys of one read
+    after select() wakes up, `update` applies them to the session and
+    layout (including `beep`, the call that queues the error click),
+    `frame` builds and draws the frame (including `write`, the terminal
+    write and flush), and `total` runs from wake-up to the flushed frame.
+    Enabled by --profile or the TYPING_PROFILE environment variable; when
+    it is off the typing loop only tests `profile is not None`.
+    """
+    STAGES = ('read', 'update', 'beep', 'frame', 'write', 'total')
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'typing_profile.json')
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        for stage in self.STAGES:
+            setattr(self, stage, LatencyHistogram())
+    @classmethod
+    def from_env(cls):
+        """A profile if TYPING_PROFILE is set (to 1 or to the JSON path), else None."""
+        value = os.environ.get('TYPING_PROFILE', '').strip()
+        if value.lower() in ('', '0', 'false', 'no', 'off'):
+            return None
+        return cls(None if value.lower() in ('1', 'true', 'yes', 'on') else value)
+    def reset(self):
+        for stage in self.STAGES:
+            getattr(self, stage).reset()
+    def summary(self):
+        return {stage: getattr(self, stage).summary() for stage in self.STAGES}
+    def lines(self):
+        """Rows for the results screen."""
+        lines = [f"{Colors.CYAN}{Colors.BOLD}Latency Profile (µs):{Colors.RESET}",
+                 f"{Colors.CYAN}{'─' * 60}{Colors.RESET}",
+                 f"  {Colors.BOLD}{'Stage':<10}{'Count':>8}{'p50':>10}{'p99':>10}{'Max':>10}{Colors.RESET}"]
+        for stage, s in self.summary().items():
+            lines.append(f"  {stage:<10}{s['count']:>8}{s['p50_us']:>10}{s['p99_us']:>10}{s['max_us']:>10}")
+        return lines
+    def save(self, **info):
+        """Write the summary, with `info` about the test, to the JSON profile file."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(dict(info, stages=self.summary()), f, indent=2)
+
+class ProfiledAudio:
+    """Times each error() call of the audio feedback it wraps into a histogram."""
+    def __init__(self, audio, histogram):
+        self.audio = audio
+        self.histogram = histogram
+    def error(self):
+        start = time.perf_counter_ns()
+        self.audio.error()
+        self.histogram.record(time.perf_counter_ns() - start)
+    def __getattr__(self, name):
+        return getattr(self.audio, name)
+
+class ProfiledStream:
+    """Times each write-and-flush of a frame to the stream it wraps."""
+    def __init__(self, stream, histogram):
+        self.stream = stream
+        self.histogram = histogram
+        self.started = 0
+    def write(self, data):
+        self.started = time.perf_counter_ns()
+        return self.stream.write(data)
+    def flush(self):
+        self.stream.flush()
+        self.histogram.record(time.perf_counter_ns() - self.started)
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class Metric:
+    """A named metric with optional labels; each label combination is a child that holds the values."""
+    TYPE = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.label_names:
+            self.default = self.labels()
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+    def _child(self):
+        raise NotImplementedError
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.label_names, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{self._escape(v)}"' for k, v in pairs) + '}'
+    @staticmethod
+    def _escape(value):
+        # label values are quoted strings: backslash, quote and newline must be escaped
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    def samples(self):
+        """(suffix, label text, value) for every series of this metric."""
+        for values, child in list(self.children.items()):
+            yield '', self._label_text(values), child.get()
+
+class CounterValue:
+    __slots__ = ('value', 'lock')
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+    def get(self):
+        return self.value
+
+class Counter(Metric):
+    TYPE = 'counter'
+    def _child(self):
+        return CounterValue()
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+class GaugeValue(CounterValue):
+    __slots__ = ('func',)
+    def __init__(self):
+        super().__init__()
+        self.func = None
+    def set(self, value):
+        self.value = value
+    def get(self):
+        return self.func() if self.func is not None else self.value
+
+class Gauge(Metric):
+    """A value that goes up and down; set_function() makes it read its value at collection time."""
+    TYPE = 'gauge'
+    def _child(self):
+        return GaugeValue()
+    def set(self, value):
+        self.default.set(value)
+    def inc(self, amount=1):
+        self.default.inc(amount)
+    def set_function(self, func):
+        self.default.func = func
+
+class HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = array('q', bytes(8 * (len(bounds) + 1)))
+        self.sum = 0.0
+        self.lock = threading.Lock()
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+    def get(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram in seconds, as Prometheus expects."""
+    TYPE = 'histogram'
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, name, help, labels=(), buckets=None):
+        self.bounds = list(buckets or self.BUCKETS)
+        super().__init__(name, help, labels)
+    def _child(self):
+        return HistogramValue(self.bounds)
+    def observe(self, value):
+        self.default.observe(value)
+    def samples(self):
+        for values, child in list(self.children.items()):
+            counts, total = child.get()
+            cumulative = 0
+            for bound, n in zip(self.bounds + ['+Inf'], counts):
+                cumulative += n
+                yield '_bucket', self._label_text(values, [('le', bound)]), cumulative
+            yield '_sum', self._label_text(values), total
+            yield '_count', self._label_text(values), cumulative
+
+class MetricsRegistry:
+    """The app's counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Updating a metric takes one small lock, so the database methods and
+    the typing loop can update them on every call. serve() exposes them
+    over HTTP on /metrics; render() gives the same text for a snapshot.
+    """
+    def __init__(self):
+        self.metrics = {}
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+    def histogram(self, name, help, labels=(), buckets=None):
+        return self.register(Histogram(name, help, labels, buckets))
+    def render(self):
+        out = []
+        for metric in self.metrics.values():
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.TYPE}")
+            for suffix, labels, value in metric.samples():
+                out.append(f"{metric.name}{suffix}{labels} {self._format_value(value)}")
+        return '\n'.join(out) + '\n'
+    @staticmethod
+    def _format_value(value):
+        """A sample value as Prometheus reads it: exact for floats, with its spellings of inf and NaN."""
+        if not isinstance(value, float):
+            return str(value)
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    def serve(self, port, host='127.0.0.1'):
+        """Serve /metrics from a daemon thread; returns the HTTP server."""
+        import http.server
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+METRICS = MetricsRegistry()
+TESTS_STARTED = METRICS.counter('typing_tests_started_total', "Typing tests started")
+TESTS_COMPLETED = METRICS.counter('typing_tests_completed_total', "Typing tests finished")
+TESTS_CANCELLED = METRICS.counter('typing_tests_cancelled_total', "Typing tests cancelled with ESC")
+KEYSTROKES = METRICS.counter('typing_keystrokes_total', "Keys fed to typing sessions")
+RESULTS_SAVED = METRICS.counter('typing_results_saved_total', "Results written to the database")
+RESULTS_JOURNALED = METRICS.counter('typing_results_journaled_total', "Results kept in the local journal")
+RESULTS_FAILED = METRICS.counter('typing_results_failed_total', "Results that could be neither written nor journaled")
+WRITER_QUEUE = METRICS.gauge('typing_writer_queue_depth', "Results waiting in the write-behind queue")
+SESSIONS = METRICS.gauge('typing_sessions', "Players connected to the typing server")
+DB_QUERY_SECONDS = METRICS.histogram('typing_db_query_seconds', "Database transaction time by method", ('method',))
+DB_ERRORS = METRICS.counter('typing_db_errors_total', "Database transactions that raised, by method", ('method',))
+CACHE_LOOKUPS = METRICS.counter('typing_leaderboard_cache_total', "Leaderboard cache lookups by outcome", ('result',))
+FRAME_SECONDS = METRICS.histogram('typing_frame_seconds', "Time to build and draw one typing-test frame",
+                                  buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
+
+def calculate_wpm(chars_typed, time_taken, errors):
+    """Return (gross_wpm, net_wpm) for `chars_typed` characters in `time_taken` seconds."""
+    if time_taken <= 0:
+        return 0, 0
+    minutes = time_taken / 60
+    gross_wpm = (chars_typed / 5) / minutes
+    net_wpm = max(0, ((chars_typed / 5) - errors) / minutes)
+    return round(gross_wpm, 2), round(net_wpm, 2)
+
+class KeystrokeLog:
+    """Compact record of every key event in a test, for replay and analysis.
+
+    Events are (offset_ns, index, char, correct): nanoseconds since the
+    first event, the expected-character index the key applied to, the key
+    itself and whether it matched. They are kept in parallel typed arrays,
+    with no Python object per event, and persisted as a single blob.
+    """
+    MAGIC = b'KSL1'
+    HEADER = struct.Struct('<4sI')
+
+    def __init__(self):
+        self.base_ns = None
+        self.offsets = array('q')
+        self.indices = array('i')
+        self.chars = array('I')
+        self.flags = bytearray()
+    def __len__(self):
+        return len(self.flags)
+    def record(self, t_ns, index, char, correct):
+        if self.base_ns is None:
+            self.base_ns = t_ns
+        self.offsets.append(t_ns - self.base_ns)
+        self.indices.append(index)
+        self.chars.append(ord(char))
+        self.flags.append(1 if correct else 0)
+    def events(self):
+        for i in range(len(self.flags)):
+            yield self.offsets[i], self.indices[i], chr(self.chars[i]), bool(self.flags[i])
+    def keys(self):
+        """Yield (offset_ns, key) pairs, ready for replay_session."""
+        for i in range(len(self.flags)):
+            yield self.offsets[i], chr(self.chars[i])
+    def to_blob(self):
+        parts = [self.HEADER.pack(self.MAGIC, len(self.flags))]
+        for arr in (self.offsets, self.indices, self.chars):
+            if sys.byteorder != 'little':
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            parts.append(arr.tobytes())
+        parts.append(bytes(self.flags))
+        return zlib.compress(b''.join(parts))
+    @classmethod
+    def from_blob(cls, blob):
+        data = zlib.decompress(blob)
+        magic, count = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("not a keystroke log")
+        log = cls()
+        log.base_ns = 0
+        pos = cls.HEADER.size
+        for arr in (log.offsets, log.indices, log.chars):
+            size = count * arr.itemsize
+            arr.frombytes(data[pos:pos + size])
+            if sys.byteorder != 'little':
+                arr.byteswap()
+            pos += size
+        log.flags = bytearray(data[pos:pos + count])
+        return log
+
+class TypingSession:
+    """Typing state and scoring for one paragraph, with no terminal I/O.
+
+    Keys are fed in with the time they arrived, as time.monotonic_ns()
+    values (any nanosecond clock works for replays). The clock starts at the
+    first typed character; the test is timed up to the key that completes it.
+
+    Typed characters live in a list preallocated to the paragraph length,
+    with a per-position correctness bitmap and running counters, so a key or
+    a backspace costs O(1) however long the paragraph is:
+    `correct` and `errors` count the characters currently standing right and
+    wrong, `mistakes` every wrong key ever typed, and `corrected` the wrong
+    characters later removed with backspace.
+
+    Pass a KeystrokeLog as `log` to have every applied key recorded in it.
+    """
+    IGNORED, CORRECT, WRONG, BACKSPACE, CANCELLED = range(5)
+
+    def __init__(self, expected_text, log=None):
+        self.expected = expected_text
+        self.log = log
+        self.typed = [''] * len(expected_text)
+        self.correctness = bytearray(len(expected_text))
+        self.typed_count = 0
+        self.correct = 0
+        self.errors = 0
+        self.mistakes = 0
+        self.corrected = 0
+        self.start_ns = None
+        self.end_ns = None
+        self.cancelled = False
+    @property
+    def typed_text(self):
+        return ''.join(self.typed[:self.typed_count])
+    @property
+    def finished(self):
+        return self.cancelled or self.typed_count >= len(self.expected)
+    def accuracy(self):
+        """Share of the characters typed so far that are right, in percent."""
+        return self.correct / self.typed_count * 100 if self.typed_count else 100
+    def feed(self, key, t_ns):
+        """Apply one key pressed at `t_ns` and return what it did (a class constant)."""
+        if self.finished:
+            return self.IGNORED
+        if key == Keys.ESCAPE:
+            self.cancelled = True
+            self.end_ns = t_ns
+            if self.log is not None:
+                self.log.record(t_ns, self.typed_count, key, False)
+            return self.CANCELLED
+        if key == Keys.BACKSPACE or key == '\x7f':
+            if not self.typed_count:
+                return self.IGNORED
+            self.typed_count -= 1
+            if self.correctness[self.typed_count]:
+                self.correct -= 1
+            else:
+                self.errors -= 1
+                self.corrected += 1
+            if self.log is not None:
+                self.log.record(t_ns, self.typed_count, Keys.BACKSPACE, False)
+            return self.BACKSPACE
+        if len(key) != 1:
+            # Arrow keys and other named keys don't type anything
+            return self.IGNORED
+        if key in ('\r', '\n'):
+            key = ' '
+        if self.start_ns is None:
+            self.start_ns = t_ns
+        idx = self.typed_count
+        self.typed[idx] = key
+        self.typed_count += 1
+        if self.typed_count == len(self.expected):
+            self.end_ns = t_ns
+        if key != self.expected[idx]:
+            self.correctness[idx] = 0
+            self.errors += 1
+            self.mistakes += 1
+            if self.log is not None:
+                self.log.record(t_ns, idx, key, False)
+            return self.WRONG
+        self.correctness[idx] = 1
+        self.correct += 1
+        if self.log is not None:
+            self.log.record(t_ns, idx, key, True)
+        return self.CORRECT
+    def elapsed(self, now_ns):
+        """Seconds since the first typed character, as of `now_ns` (0 before it)."""
+        if self.start_ns is None:
+            return 0
+        return ((self.end_ns or now_ns) - self.start_ns) / 1e9
+    def current_wpm(self, now_ns):
+        return calculate_wpm(self.typed_count, self.elapsed(now_ns), self.errors)[1]
+    def metrics(self):
+        """Final scores: net/raw WPM, accuracy %, errors and time taken in seconds.
+
+        The time runs from the first typed character to the last one. Before
+        TypingSession, the live test stopped its clock after the 0.6 s pause
+        that follows the last key. Results saved since then score somewhat
+        higher WPM for the same typing than older rows do, most of all on
+        short paragraphs.
+        """
+        expected_len = len(self.expected)
+        time_taken = self.elapsed(self.end_ns or self.start_ns or 0)
+        raw_wpm, net_wpm = calculate_wpm(expected_len, time_taken, self.errors)
+        accuracy = ((expected_len - self.errors) / expected_len * 100) if expected_len > 0 else 0
+        return {
+            'net_wpm': net_wpm,
+            'raw_wpm': raw_wpm,
+            'accuracy': accuracy,
+            'errors': self.errors,
+            'time_taken': time_taken,
+        }
+
+def replay_session(expected_text, events):
+    """Push (t_ns, key) events through a fresh TypingSession and return it."""
+    session = TypingSession(expected_text)
+    for t_ns, key in events:
+        session.feed(key, t_ns)
+        if session.finished:
+            break
+    return session
+
+def synthetic_keystrokes(expected_text, wpm=60, error_rate=0.02, seed=None, jitter=0.0):
+    """Yield (t_ns, key) events of a typist at about `wpm` words per minute.
+
+    Roughly `error_rate` of the keys are mistyped and then corrected with a
+    backspace, so replays exercise every TypingSession branch. With
+    `jitter` > 0 each gap between keys varies log-normally around the
+    mean with that sigma, as a human's do.
+    """
+    rng = random.Random(seed)
+    interval_ns = 60e9 / (wpm * 5)
+    # scale the log-normal draws so their mean stays at interval_ns
+    scale = interval_ns / math.exp(jitter ** 2 / 2)
+    def gap():
+        return int(scale * rng.lognormvariate(0, jitter)) if jitter else int(interval_ns)
+    t_ns = 0
+    for ch in expected_text:
+        if rng.random() < error_rate:
+            t_ns += gap()
+            yield t_ns, '#' if ch != '#' else '@'
+            t_ns += gap()
+            yield t_ns, Keys.BACKSPACE
+        t_ns += gap()
+        yield t_ns, ch
+
+class TypingLoop:
+    """The keystroke, WPM-tick and frame-pacing loop of one test, minus the reads.
+
+    Whoever owns the key source (the local terminal, a telnet client) waits
+    up to timeout() seconds for keys and hands what arrived, maybe nothing,
+    to step(); frames go to `game`'s renderer. The loop is done once the
+    session is finished or cancelled.
+    """
+    def __init__(self, game, layout, session, max_fps=RenderScheduler.DEFAULT_FPS, profile=None):
+        self.game = game
+        self.layout = layout
+        self.session = session
+        self.profile = profile
+        self.frames = RenderScheduler(max_fps)
+        self.current_wpm = 0
+        self.last_update = 0
+        self.keyed_ns = None    # when the reader woke with the first keys the next frame will show
+    @property
+    def done(self):
+        return self.session.finished
+    def start(self):
+        """Draw the first frame."""
+        self.game.display_typing_interface(self.layout, self.session, self.current_wpm)
+        self.frames.drawn(time.monotonic())
+    def timeout(self):
+        """Seconds to wait for keys: until the next WPM tick or held-back frame, None for no limit."""
+        now = time.monotonic()
+        timeout = max(0, self.last_update + 1.0 - now) if self.session.start_ns is not None else None
+        held = self.frames.wait(now)
+        if held is not None:
+            timeout = held if timeout is None else min(timeout, held)
+        return timeout
+    def step(self, keys, woke_ns=None, now_ns=None):
+        """Apply the keys of one read, woken at perf_counter `woke_ns`, and draw the frame if it is due.
+
+        The keys are timed at monotonic `now_ns` (default: now); loadgen passes its simulated clock.
+        """
+        session, profile, frames = self.session, self.profile, self.frames
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
+        if keys:
+            KEYSTROKES.inc(len(keys))
+            if profile is not None:
+                updating = time.perf_counter_ns()
+                if self.keyed_ns is None:
+                    self.keyed_ns = woke_ns
+            for key in keys:
+                started = session.start_ns is not None
+                self.game.apply_key(self.layout, session, key, now_ns)
+                if not started and session.start_ns is not None:
+                    self.last_update = time.monotonic()
+                if session.finished:
+                    break
+            if profile is not None:
+                profile.update.record(time.perf_counter_ns() - updating)
+            frames.mark()
+        elif session.start_ns is not None and time.monotonic() - self.last_update >= 1.0:
+            self.current_wpm = session.current_wpm(now_ns)
+            self.last_update = time.monotonic()
+            frames.mark()
+        # At most max_fps frames: a burst of keys shares one, drawn once it is due,
+        # and the frame that completes the test is drawn straight away
+        if session.cancelled or not (session.finished and frames.dirty or frames.due(time.monotonic())):
+            return
+        if profile is not None:
+            drawing = time.perf_counter_ns()
+        self.game.display_typing_interface(self.layout, session, self.current_wpm)
+        frames.drawn(time.monotonic())
+        # Only frames that show keys count: a WPM tick has no key to measure from,
+        # and a held-back frame's total includes the time it was held
+        if profile is not None and self.keyed_ns is not None:
+            drawn = time.perf_counter_ns()
+            profile.frame.record(drawn - drawing)
+            profile.total.record(drawn - self.keyed_ns)
+            self.keyed_ns = None
+
+class LeaderboardCache:
+    """In-process top-K leaderboards: one per difficulty, plus the global board under None.
+
+    Rows are (username, wpm, accuracy, test_date, difficulty, id), best
+    first. A board is loaded from the database on first use and reloaded
+    once it is older than `ttl` seconds, which picks up results written by
+    other processes. Results saved through this process are merged in as
+    soon as they are committed, if they make the top `size`.
+    """
+    def __init__(self, size=100, ttl=30.0):
+        self.size = size
+        self.ttl = ttl
+        self.boards = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    @staticmethod
+    def sort_key(row):
+        return (-row[1], -row[2], -row[5])
+    def get(self, difficulty):
+        """The cached board, or None if it is missing or stale."""
+        with self.lock:
+            entry = self.boards.get(difficulty)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                CACHE_LOOKUPS.labels('miss').inc()
+                return None
+            self.hits += 1
+            CACHE_LOOKUPS.labels('hit').inc()
+            return entry[1]
+    def put(self, difficulty, rows):
+        with self.lock:
+            self.boards[difficulty] = (time.monotonic(), list(rows))
+    def add(self, row):
+        """Merge a newly committed result into every board it belongs on."""
+        with self.lock:
+            for key in (row[4], None):
+                entry = self.boards.get(key)
+                if entry is None:
+                    continue
+                rows = entry[1]
+                row_key = self.sort_key(row)
+                # a board shorter than `size` holds every result, so anything qualifies
+                if len(rows) >= self.size and row_key >= self.sort_key(rows[-1]):
+                    continue
+                pos = bisect.bisect_left([self.sort_key(r) for r in rows], row_key)
+                rows.insert(pos, row)
+                del rows[self.size:]
+    def invalidate(self, difficulty=False):
+        """Drop one board, or all of them when called without an argument."""
+        with self.lock:
+            if difficulty is False:
+                self.boards.clear()
+            else:
+                self.boards.pop(difficulty, None)
+
+DB_DEFAULTS = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': 'root',
+    'password': '',                 # set it in typing_test.ini or TYPING_DB_PASSWORD
+    'database': 'typing_test_db',
+    'pool_size': 5,
+    'pool_timeout': 5.0,
+    'retries': 3,
+    'backend': 'mysql',           # or 'sqlite' for the embedded single-file database
+    'sqlite_path': 'typing_test.db',
+    'sqlite_cache_kb': 8192,
+}
+
+def load_db_config(path=None):
+    """Database settings from the defaults, a config file and the environment.
+
+    The config file (typing_test.ini next to this script, or the path in
+    TYPING_DB_CONFIG) may hold a [database] section with any DB_DEFAULTS
+    key; TYPING_DB_<KEY> environment variables override both.
+    """
+    config = dict(DB_DEFAULTS)
+    path = path or os.environ.get('TYPING_DB_CONFIG') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'typing_test.ini')
+    parser = configparser.ConfigParser()
+    if parser.read(path, encoding='utf-8') and parser.has_section('database'):
+        config.update(parser['database'])
+    for key in DB_DEFAULTS:
+        value = os.environ.get(f"TYPING_DB_{key.upper()}")
+        if value is not None:
+            config[key] = value
+    for key, default in DB_DEFAULTS.items():
+        config[key] = type(default)(config[key])
+    return config
+
+class StorageBackend(abc.ABC):
+    """Everything the app stores, independent of the database engine.
+
+    The queries here are shared by every backend and written with %s
+    placeholders. A backend supplies the connection handling (connect,
+    close, connected, _transaction, _is_transient), its schema (_create_schema), the
+    exception class its driver raises (Error) and the few clauses where the
+    SQL dialects differ (INSERT_IGNORE and the *_CONFLICT upsert clauses).
+    A backend that leaves any of these out fails when it is created.
+    """
+    # how many of the latest WPM scores user_stats keeps for progress trends
+    RECENT_TESTS = 10
+    _method_names = {}
+
+    def __init__(self, config=None):
+        self.config = config or load_db_config()
+        self.leaderboard_cache = LeaderboardCache()
+        self.usernames = {}
+    @property
+    @abc.abstractmethod
+    def Error(self):
+        """The exception class the driver raises."""
+    @property
+    @abc.abstractmethod
+    def connected(self):
+        pass
+    @abc.abstractmethod
     def connect(self):
+        pass
+    @abc.abstractmethod
+    def close(self):
+        pass
+    @abc.abstractmethod
+    def _is_transient(self, error):
+        pass
+    def _run(self, work, commit=False, **cursor_args):
+        """Run `work(cursor)` in a transaction and return its result, timed under the calling method."""
+        method = self._method_names.get(work.__code__)
+        if method is None:
+            # 'StorageBackend.get_user_rank.<locals>.work' -> 'get_user_rank'
+            method = self._method_names[work.__code__] = work.__qualname__.split('.<locals>')[0].rsplit('.', 1)[-1]
+        start = time.perf_counter()
         try:
-            self.connection = mysql.connector.connect(
-                host='localhost',
-                user='root',
-                password='gaurojas#702',
-                database='typing_test_db'
-            )
-            if self.connection.is_connected():
-                return True
-        except Error as e:
-            print(f"{Colors.RED}Database connection failed: {e}{Colors.RESET}")
+            return self._transaction(work, commit, **cursor_args)
+        except Exception:
+            DB_ERRORS.labels(method).inc()
+            raise
+        finally:
+            DB_QUERY_SECONDS.labels(method).observe(time.perf_counter() - start)
+    @abc.abstractmethod
+    def _transaction(self, work, commit=False, **cursor_args):
+        """Run `work(cursor)` in a transaction and return its result; see the backends."""
+    @abc.abstractmethod
+    def _create_schema(self, cursor):
+        pass
+    def health_check(self):
+        """Round-trip a trivial query; True if the database answers."""
+        def work(cursor):
+            cursor.execute("SELECT 1")
+            return cursor.fetchone()
+        try:
+            return self._run(work) == (1,)
+        except self.Error:
             return False
     def create_tables(self):
-        try:
-            cursor = self.connection.cursor()   # user and test result table
-            cursor.execute("""               
-                CREATE TABLE IF NOT EXISTS users (  
-                    id INT PRIMARY KEY AUTO_INCREMENT,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+        def work(cursor):
+            self._create_schema(cursor)
+            # backfill the per-user tables for databases that predate them
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS test_results (
-                    id INT PRIMARY KEY AUTO_INCREMENT,
-                    user_id INT,
-                    wpm DECIMAL(6,2),
-                    accuracy DECIMAL(5,2),
-                    raw_wpm DECIMAL(6,2),
-                    errors INT,
-                    difficulty ENUM('easy', 'medium', 'hard', 'extreme'),
-                    time_taken INT,
-                    test_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    INDEX idx_wpm (wpm DESC),
-                    INDEX idx_difficulty (difficulty),
-                    INDEX idx_date (test_date DESC)
-                )
+                SELECT EXISTS(SELECT 1 FROM user_best), EXISTS(SELECT 1 FROM user_stats),
+                       EXISTS(SELECT 1 FROM test_results WHERE user_id IS NOT NULL)
             """)
-            self.connection.commit()
+            has_best, has_stats, has_results = cursor.fetchone()
+            if has_results and not has_best:
+                self._rebuild_user_best(cursor)
+            return has_results and not has_stats
+        try:
+            if self._run(work, commit=True):   # user and test result table
+                self.check_user_stats(repair=True)
             return True
-        except Error as e:
+        except self.Error as e:
             print(f"{Colors.RED}Error creating tables: {e}{Colors.RESET}")
             return False
-    def get_or_create_user(self, username):    
+    def _rebuild_user_best(self, cursor):
+        cursor.execute("DELETE FROM user_best")
+        # best = highest wpm, ties broken by accuracy, per difficulty and overall ('all')
+        cursor.execute("""
+            INSERT INTO user_best (user_id, difficulty, best_wpm, best_accuracy)
+            SELECT t.user_id, t.difficulty, t.wpm, MAX(t.accuracy)
+            FROM test_results t
+            JOIN (
+                SELECT user_id, difficulty, MAX(wpm) AS wpm FROM test_results
+                WHERE user_id IS NOT NULL AND difficulty IS NOT NULL GROUP BY user_id, difficulty
+            ) m ON t.user_id = m.user_id AND t.difficulty = m.difficulty AND t.wpm = m.wpm
+            GROUP BY t.user_id, t.difficulty, t.wpm
+        """)
+        cursor.execute("""
+            INSERT INTO user_best (user_id, difficulty, best_wpm, best_accuracy)
+            SELECT t.user_id, 'all', t.wpm, MAX(t.accuracy)
+            FROM test_results t
+            JOIN (
+                SELECT user_id, MAX(wpm) AS wpm FROM test_results
+                WHERE user_id IS NOT NULL GROUP BY user_id
+            ) m ON t.user_id = m.user_id AND t.wpm = m.wpm
+            GROUP BY t.user_id, t.wpm
+        """)
+    def rebuild_user_best(self):
+        """Recompute the user_best table from test_results. Returns rows written or -1 on error."""
+        def work(cursor):
+            self._rebuild_user_best(cursor)
+            cursor.execute("SELECT COUNT(*) FROM user_best")
+            return cursor.fetchone()[0]
         try:
-            cursor = self.connection.cursor()
+            return self._run(work, commit=True)
+        except self.Error as e:
+            print(f"{Colors.RED}Error rebuilding user bests: {e}{Colors.RESET}")
+            return -1
+    def get_or_create_user(self, username):    
+        def work(cursor):
             cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
             result = cursor.fetchone()
             if result:
                 return result[0]
-            else:
-                cursor.execute("INSERT INTO users (username) VALUES (%s)", (username,))
-                self.connection.commit()
-                return cursor.lastrowid
-        except Error as e:
+            cursor.execute("INSERT INTO users (username) VALUES (%s)", (username,))
+            return cursor.lastrowid
+        try:
+            user_id = self._run(work, commit=True)
+            self.usernames[user_id] = username
+            return user_id
+        except self.Error as e:
             print(f"{Colors.RED}Error with user: {e}{Colors.RESET}")
             return None
-    def save_result(self, user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken):
+    def save_result(self, user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken, keystrokes=None,
+                    result_key=None, test_date=None):
+        """Insert one result, plus its KeystrokeLog if given, in one transaction.
+
+        Returns the new test_results id, or False on error.
+        """
+        result = {
+            'user_id': user_id, 'wpm': wpm, 'accuracy': accuracy, 'raw_wpm': raw_wpm, 'errors': errors,
+            'difficulty': difficulty, 'time_taken': time_taken, 'keystrokes': keystrokes,
+            'result_key': result_key, 'test_date': test_date,
+        }
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                INSERT INTO test_results (user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken))
-            self.connection.commit()
-            return True
-        except Error as e:
+            return self.save_results([result])[0]
+        except self.Error as e:
             print(f"{Colors.RED}Error saving result: {e}{Colors.RESET}")
             return False
+    def save_results(self, results):
+        """Insert a batch of results in one transaction and return their ids.
+
+        Each result is a dict with the save_result arguments as keys. Results
+        are written with one executemany round trip, their keystroke logs and
+        the per-user bests and rollups with one more each. A result whose
+        result_key is already stored is skipped, so a retried batch never
+        duplicates rows or counts twice. Errors are raised, not printed.
+        """
+        for result in results:
+            if not result.get('result_key'):
+                import uuid
+                result['result_key'] = uuid.uuid4().hex
+            # to the scale of the columns (DATETIME, DECIMAL(x,2)), so the leaderboard cache
+            # and every backend hold what MySQL stores
+            result['test_date'] = self._parse_datetime(result.get('test_date') or datetime.now())
+            for key in ('wpm', 'raw_wpm', 'accuracy'):
+                result[key] = round(float(result[key]), 2)
+        keys = [r['result_key'] for r in results]
+        in_keys = f"({', '.join(['%s'] * len(keys))})"
+        def work(cursor):
+            cursor.execute(f"SELECT result_key FROM test_results WHERE result_key IN {in_keys}", keys)
+            existing = {row[0] for row in cursor.fetchall()}
+            new = [r for r in results if r['result_key'] not in existing]
+            if not new:
+                cursor.execute(f"SELECT result_key, id FROM test_results WHERE result_key IN {in_keys}", keys)
+                return dict(cursor.fetchall()), new
+            cursor.executemany(f"""
+                INSERT INTO test_results (user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken, test_date,
+                                          result_key, paragraph_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                {self.RESULT_CONFLICT}
+            """, [(r['user_id'], r['wpm'], r['accuracy'], r['raw_wpm'], r['errors'], r['difficulty'],
+                   r['time_taken'], r['test_date'], r['result_key'], r.get('paragraph_id')) for r in new])
+            cursor.execute(f"SELECT result_key, id FROM test_results WHERE result_key IN {in_keys}", keys)
+            ids = dict(cursor.fetchall())
+            logs = [(ids[r['result_key']], len(r['keystrokes']), r['keystrokes'].to_blob())
+                    for r in new if r.get('keystrokes') is not None and len(r['keystrokes'])]
+            if logs:
+                cursor.executemany(f"""
+                    INSERT INTO keystroke_logs (result_id, event_count, data) VALUES (%s, %s, %s)
+                    {self.LOG_CONFLICT}
+                """, logs)
+            per_user = [(r, diff) for r in new if r['user_id'] is not None for diff in (r['difficulty'], 'all')]
+            if per_user:
+                # keep user_best and the user_stats rollups current
+                cursor.executemany(f"""
+                    INSERT INTO user_best (user_id, difficulty, best_wpm, best_accuracy) VALUES (%s, %s, %s, %s)
+                    {self.USER_BEST_CONFLICT}
+                """, [(r['user_id'], diff, r['wpm'], r['accuracy']) for r, diff in per_user])
+                cursor.executemany(f"""
+                    INSERT INTO user_stats (user_id, difficulty, test_count, wpm_sum, wpm_sq_sum, accuracy_sum,
+                                            best_wpm, best_accuracy, recent_wpm)
+                    VALUES (%s, %s, 1, %s, %s, %s, %s, %s, %s)
+                    {self.USER_STATS_CONFLICT.format(recent=self.RECENT_TESTS)}
+                """, [(r['user_id'], diff, r['wpm'], float(r['wpm']) ** 2, r['accuracy'], r['wpm'], r['accuracy'],
+                       f"{float(r['wpm']):.2f}") for r, diff in per_user])
+            return ids, new
+        if not results:
+            return []
+        ids, new = self._run(work, commit=True)
+        for r in new:
+            username = self.usernames.get(r['user_id'])
+            if username is None:
+                self.leaderboard_cache.invalidate()
+                continue
+            self.leaderboard_cache.add((username, r['wpm'], r['accuracy'], r['test_date'], r['difficulty'], ids[r['result_key']]))
+        return [ids[key] for key in keys]
+    def get_keystroke_log(self, result_id):
+        """Return the KeystrokeLog saved with a result, or None if there is none."""
+        def work(cursor):
+            cursor.execute("SELECT data FROM keystroke_logs WHERE result_id = %s", (result_id,))
+            row = cursor.fetchone()
+            return KeystrokeLog.from_blob(row[0]) if row else None
+        try:
+            return self._run(work)
+        except self.Error as e:
+            print(f"{Colors.RED}Error fetching keystroke log: {e}{Colors.RESET}")
+            return None
     def get_leaderboard(self, difficulty=None, limit=10):
+        return [row[:5] for row in self.get_leaderboard_page(difficulty, limit)]
+    def get_leaderboard_page(self, difficulty=None, limit=20, after=None):
+        """One page of the leaderboard, best first.
+
+        Rows are (username, wpm, accuracy, test_date, difficulty, id). Pass
+        the last row of the previous page as `after` to get the next one:
+        pages are found by seeking past (wpm, accuracy, id) on the index,
+        so a deep page costs the same as the first. Pages inside the cached
+        top rows don't touch the database at all.
+        """
+        cache = self.leaderboard_cache
         try:
-            cursor = self.connection.cursor()
-            if difficulty:
-                query = """
-                    SELECT u.username, t.wpm, t.accuracy, t.test_date, t.difficulty
-                    FROM test_results t
-                    JOIN users u ON t.user_id = u.id
-                    WHERE t.difficulty = %s
-                    ORDER BY t.wpm DESC, t.accuracy DESC
-                    LIMIT %s
-                """
-                cursor.execute(query, (difficulty, limit))
-            else:
-                query = """
-                    SELECT u.username, t.wpm, t.accuracy, t.test_date, t.difficulty
-                    FROM test_results t
-                    JOIN users u ON t.user_id = u.id
-                    ORDER BY t.wpm DESC, t.accuracy DESC
-                    LIMIT %s
-                """
-                cursor.execute(query, (limit,))
-            return cursor.fetchall()
-        except Error as e:
+            board = cache.get(difficulty)
+            if board is None:
+                board = self._fetch_leaderboard(difficulty, cache.size)
+                cache.put(difficulty, board)
+            start = 0
+            if after is not None:
+                start = bisect.bisect_right([cache.sort_key(r) for r in board], cache.sort_key(after))
+            if start + limit <= len(board) or len(board) < cache.size:
+                return board[start:start + limit]
+            return self._fetch_leaderboard(difficulty, limit, after)
+        except self.Error as e:
             print(f"{Colors.RED}Error fetching leaderboard: {e}{Colors.RESET}")
             return []
+    def _fetch_leaderboard(self, difficulty, limit, after=None):
+        where = []
+        params = []
+        if difficulty:
+            where.append("t.difficulty = %s")
+            params.append(difficulty)
+        if after is not None:
+            where.append("(t.wpm < %s OR (t.wpm = %s AND (t.accuracy < %s OR (t.accuracy = %s AND t.id < %s))))")
+            params += [after[1], after[1], after[2], after[2], after[5]]
+        query = f"""
+            SELECT u.username, t.wpm, t.accuracy, t.test_date, t.difficulty, t.id
+            FROM test_results t
+            JOIN users u ON t.user_id = u.id
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY t.wpm DESC, t.accuracy DESC, t.id DESC
+            LIMIT %s
+        """
+        def work(cursor):
+            cursor.execute(query, params + [limit])
+            return cursor.fetchall()
+        return self._run(work)
     def get_user_stats(self, user_id):
-        try:
-            cursor = self.connection.cursor()
+        """(total_tests, avg_wpm, best_wpm, avg_accuracy, best_accuracy) over all the user's tests.
+
+        Served from the user_stats rollup in one primary-key lookup. Returns
+        None if the user has no results.
+        """
+        stats = self.get_user_stats_detail(user_id).get('all')
+        if not stats:
+            return None
+        return (stats['tests'], stats['avg_wpm'], stats['best_wpm'], stats['avg_accuracy'], stats['best_accuracy'])
+    def get_user_stats_detail(self, user_id):
+        """The user's rollups keyed by difficulty, plus 'all'; {} when they have none (or on error).
+
+        Each value has tests, avg_wpm, stddev_wpm, best_wpm, avg_accuracy,
+        best_accuracy, recent_wpm (newest first) and trend: how far the
+        recent average is above the overall one.
+        """
+        def work(cursor):
             cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_tests,
-                    AVG(wpm) as avg_wpm,
-                    MAX(wpm) as best_wpm,
-                    AVG(accuracy) as avg_accuracy,
-                    MAX(accuracy) as best_accuracy
-                FROM test_results
-                WHERE user_id = %s
+                SELECT difficulty, test_count, wpm_sum, wpm_sq_sum, accuracy_sum, best_wpm, best_accuracy, recent_wpm
+                FROM user_stats WHERE user_id = %s
             """, (user_id,))
-            return cursor.fetchone()
-        except Error as e:
+            return cursor.fetchall()
+        try:
+            rows = self._run(work)
+        except self.Error as e:
             print(f"{Colors.RED}Error fetching user stats: {e}{Colors.RESET}")
-            return None
-    def get_user_rank(self, user_id, difficulty=None):
+            return {}
+        stats = {}
+        for difficulty, count, wpm_sum, wpm_sq_sum, accuracy_sum, best_wpm, best_accuracy, recent in rows:
+            if not count:
+                continue
+            avg_wpm = wpm_sum / count
+            recent_wpm = [float(w) for w in recent.split(',') if w]
+            stats[difficulty] = {
+                'tests': count,
+                'avg_wpm': avg_wpm,
+                'stddev_wpm': math.sqrt(max(0.0, wpm_sq_sum / count - avg_wpm ** 2)),
+                'best_wpm': float(best_wpm),
+                'avg_accuracy': accuracy_sum / count,
+                'best_accuracy': float(best_accuracy),
+                'recent_wpm': recent_wpm,
+                'trend': (sum(recent_wpm) / len(recent_wpm) - avg_wpm) if recent_wpm else 0.0,
+            }
+        return stats
+    def check_user_stats(self, repair=False, batch_users=500):
+        """Recompute every user_stats rollup from test_results and compare with the stored ones.
+
+        Users are taken `batch_users` at a time in user_id order. Each batch
+        is one transaction on one connection: its test_results rows are
+        streamed through an unbuffered cursor, so memory stays flat however
+        many rows there are, and its rollups are then checked (or, with
+        `repair`, rewritten) on the same cursor. A batch that is retried
+        starts over from scratch. Returns the number of rollup rows that
+        were missing, wrong or orphaned, or -1 on error.
+        """
+        def check(cursor, after):
+            cursor.execute("""
+                SELECT DISTINCT user_id FROM test_results
+                WHERE user_id > %s ORDER BY user_id LIMIT %s
+            """, (after, batch_users))
+            users = [row[0] for row in cursor.fetchall()]
+            if not users:
+                return None, 0
+            placeholders = ', '.join(['%s'] * len(users))
+            cursor.execute(f"""
+                SELECT user_id, difficulty, wpm, accuracy FROM test_results
+                WHERE user_id IN ({placeholders}) ORDER BY user_id, test_date, id
+            """, users)
+            per_user = {}
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows:
+                    break
+                for user_id, difficulty, wpm, accuracy in rows:
+                    totals = per_user.setdefault(user_id, {})
+                    wpm, accuracy = float(wpm), float(accuracy)
+                    for diff in ((difficulty, 'all') if difficulty else ('all',)):
+                        t = totals.setdefault(diff, [0, 0.0, 0.0, 0.0, wpm, accuracy, collections.deque(maxlen=self.RECENT_TESTS)])
+                        t[0] += 1
+                        t[1] += wpm
+                        t[2] += wpm * wpm
+                        t[3] += accuracy
+                        t[4] = max(t[4], wpm)
+                        t[5] = max(t[5], accuracy)
+                        t[6].appendleft(wpm)
+            computed = {(user_id, diff): agg for user_id, totals in per_user.items()
+                        for diff, agg in self._finish_rollups(totals).items()}
+            cursor.execute(f"""
+                SELECT user_id, difficulty, test_count, wpm_sum, wpm_sq_sum, accuracy_sum,
+                       best_wpm, best_accuracy, recent_wpm
+                FROM user_stats WHERE user_id IN ({placeholders})
+            """, users)
+            stored = {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+            bad = sum(1 for key in stored if key not in computed)
+            for key, agg in computed.items():
+                row = stored.get(key)
+                if row is None or row[0] != agg[0] or row[6] != agg[6] or any(
+                        abs(float(a) - float(b)) > 1e-6 * max(1.0, abs(float(b))) for a, b in zip(row[1:6], agg[1:6])):
+                    bad += 1
+            if repair and bad:
+                cursor.execute(f"DELETE FROM user_stats WHERE user_id IN ({placeholders})", users)
+                cursor.executemany("""
+                    INSERT INTO user_stats (user_id, difficulty, test_count, wpm_sum, wpm_sq_sum, accuracy_sum,
+                                            best_wpm, best_accuracy, recent_wpm)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, [key + agg for key, agg in computed.items()])
+            return users[-1], bad
+        def orphans(cursor):
+            where = "WHERE user_id NOT IN (SELECT user_id FROM test_results WHERE user_id IS NOT NULL)"
+            cursor.execute(f"SELECT COUNT(*) FROM user_stats {where}")
+            count = cursor.fetchone()[0]
+            if repair and count:
+                cursor.execute(f"DELETE FROM user_stats {where}")
+            return count
         try:
-            cursor = self.connection.cursor()
-            if difficulty:
-                query = """
-                    SELECT COUNT(*) + 1 AS `user_rank`
-                    FROM test_results t1
-                    WHERE t1.difficulty = %s
-                    AND (t1.wpm > (
-                        SELECT MAX(wpm) FROM test_results WHERE user_id = %s AND difficulty = %s
-                    ) OR (t1.wpm = (
-                        SELECT MAX(wpm) FROM test_results WHERE user_id = %s AND difficulty = %s
-                    ) AND t1.accuracy > (
-                        SELECT MAX(accuracy) FROM test_results WHERE user_id = %s AND difficulty = %s
-                    )))
-                """
-                cursor.execute(query, (difficulty, user_id, difficulty, user_id, difficulty, user_id, difficulty))
-            else:
-                query = """
-                    SELECT COUNT(*) + 1 AS `user_rank`
-                    FROM test_results t1
-                    WHERE (t1.wpm > (
-                        SELECT MAX(wpm) FROM test_results WHERE user_id = %s
-                    ) OR (t1.wpm = (
-                        SELECT MAX(wpm) FROM test_results WHERE user_id = %s
-                    ) AND t1.accuracy > (
-                        SELECT MAX(accuracy) FROM test_results WHERE user_id = %s
-                    )))
-                """
-                cursor.execute(query, (user_id, user_id, user_id))
+            mismatched = 0
+            after = 0
+            while after is not None:
+                after, bad = self._run(lambda cursor: check(cursor, after), commit=repair, buffered=False)
+                mismatched += bad
+            mismatched += self._run(orphans, commit=repair)
+            return mismatched
+        except self.Error as e:
+            print(f"{Colors.RED}Error checking user stats: {e}{Colors.RESET}")
+            return -1
+    @staticmethod
+    def _finish_rollups(totals):
+        return {
+            diff: (count, wpm_sum, wpm_sq_sum, accuracy_sum, best_wpm, best_accuracy,
+                   ','.join(f"{w:.2f}" for w in recent))
+            for diff, (count, wpm_sum, wpm_sq_sum, accuracy_sum, best_wpm, best_accuracy, recent) in totals.items()
+        }
+    def get_user_rank(self, user_id, difficulty=None):
+        """Rank of the user's best result among all users' bests (1 = top).
+
+        Returns None when the user has no result at that difficulty. Both
+        queries are index lookups on user_best.
+        """
+        def work(cursor):
+            key = difficulty or 'all'
+            cursor.execute(
+                "SELECT best_wpm, best_accuracy FROM user_best WHERE user_id = %s AND difficulty = %s",
+                (user_id, key)
+            )
+            best = cursor.fetchone()
+            if not best:
+                return None
+            best_wpm, best_accuracy = best
+            cursor.execute("""
+                SELECT COUNT(*) + 1 AS `user_rank`
+                FROM user_best
+                WHERE difficulty = %s
+                AND (best_wpm > %s OR (best_wpm = %s AND best_accuracy > %s))
+            """, (key, best_wpm, best_wpm, best_accuracy))
             result = cursor.fetchone()
             return result[0] if result else None
-        except Error as e:
+        try:
+            return self._run(work)
+        except self.Error as e:
             print(f"{Colors.RED}Error fetching rank: {e}{Colors.RESET}")
             return None
     def delete_user_results(self, user_id):
@@ -257,81 +1580,1369 @@ class Database:
 
         Returns the number of deleted rows, or -1 on error.
         """
-        try:
-            cursor = self.connection.cursor()
+        def work(cursor):
             cursor.execute("DELETE FROM test_results WHERE user_id = %s", (user_id,))
             deleted = cursor.rowcount
-            self.connection.commit()
+            cursor.execute("DELETE FROM user_best WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM user_stats WHERE user_id = %s", (user_id,))
+            return deleted
+        try:
+            deleted = self._run(work, commit=True)
+            self.leaderboard_cache.invalidate()
             return deleted
-        except Error as e:
+        except self.Error as e:
             print(f"{Colors.RED}Error deleting user results: {e}{Colors.RESET}")
             return -1
-    def close(self):
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
 
     # CSV support ---------------------------------------------------------
-    def export_results_to_csv(self, filepath, difficulty=None, limit=None):
-        """Export results to a CSV file. Returns number of rows written or -1 on error."""
+    CSV_COLUMNS = ['username','wpm','accuracy','raw_wpm','errors','difficulty','time_taken','test_date']
+    EXPORT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'export_state.json')
+
+    def export_results_to_csv(self, filepath, difficulty=None, limit=None, username=None, since=None, until=None,
+                              incremental=False, compress=None, progress=True, batch_size=5000):
+        """Export results to a CSV file. Returns number of rows written or -1 on error.
+
+        Rows are streamed from an unbuffered cursor in `batch_size` batches
+        and written through a buffered writer, so memory stays flat however
+        big the table is. `username`, `since` and `until` (dates or
+        'YYYY-MM-DD'; `until` is inclusive) filter the rows; `incremental`
+        exports only results added since the last incremental export to the
+        same path with the same filters. `compress` gzips the output (default: when the path ends
+        in .gz). `progress` prints a running row count.
+        """
         try:
-            if not self.connection:
+            if not self.connected:
                 if not self.connect():
                     print(f"{Colors.RED}Unable to connect to database for export.{Colors.RESET}")
                     return -1
-            cursor = self.connection.cursor()
+            where = []
+            params = []
             if difficulty:
-                query = (
-                    "SELECT u.username, t.wpm, t.accuracy, t.raw_wpm, t.errors, t.difficulty, t.time_taken, t.test_date "
-                    "FROM test_results t JOIN users u ON t.user_id = u.id WHERE t.difficulty = %s "
-                    "ORDER BY t.test_date DESC"
-                )
-                params = (difficulty,)
-            else:
-                query = (
-                    "SELECT u.username, t.wpm, t.accuracy, t.raw_wpm, t.errors, t.difficulty, t.time_taken, t.test_date "
-                    "FROM test_results t JOIN users u ON t.user_id = u.id ORDER BY t.test_date DESC"
-                )
-                params = ()
+                where.append("t.difficulty = %s")
+                params.append(difficulty)
+            if username:
+                where.append("u.username = %s")
+                params.append(username)
+            if since:
+                where.append("t.test_date >= %s")
+                params.append(self._parse_date(since))
+            if until:
+                where.append("t.test_date < %s")
+                params.append(self._parse_date(until) + timedelta(days=1))
+            # the high-water mark only holds for the rows the same filters select
+            filters = [f"{name}={value}" for name, value in (
+                ('difficulty', difficulty), ('username', username),
+                ('since', since and self._parse_date(since)), ('until', until and self._parse_date(until)),
+            ) if value]
+            state_key = ' '.join([os.path.abspath(filepath)] + filters)
+            state = {}
+            if incremental:
+                if os.path.exists(self.EXPORT_STATE_FILE):
+                    with open(self.EXPORT_STATE_FILE, 'r', encoding='utf-8') as f:
+                        state = json.load(f)
+                where.append("t.id > %s")
+                params.append(state.get(state_key, 0))
+            # incremental exports walk the id order so the high-water mark is exact
+            order = "t.id" if incremental else "t.test_date DESC"
+            query = (
+                "SELECT u.username, t.wpm, t.accuracy, t.raw_wpm, t.errors, t.difficulty, t.time_taken, "
+                "t.test_date, t.id "
+                "FROM test_results t JOIN users u ON t.user_id = u.id "
+                f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order}"
+            )
             if limit:
                 query += " LIMIT %s"
-                params = params + (limit,)
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            if not rows:
+                params.append(limit)
+            if compress is None:
+                compress = filepath.endswith('.gz')
+            def work(cursor):
+                cursor.execute(query, params)
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return 0, None
+                written = 0
+                last_id = None
+                if compress:
+                    import gzip
+                    out = gzip.open(filepath, 'wt', newline='', encoding='utf-8')
+                else:
+                    out = open(filepath, 'w', newline='', encoding='utf-8', buffering=1 << 20)
+                with out as csvfile:
+                    writer = csv.writer(csvfile)
+                    writer.writerow(self.CSV_COLUMNS)
+                    while rows:
+                        # the trailing id column only feeds the incremental high-water mark;
+                        # dates are formatted here, since MySQL's DATE_FORMAT needs a %s of its own
+                        writer.writerows(row[:7] + (self._format_date(row[7]),) for row in rows)
+                        written += len(rows)
+                        last_id = rows[-1][8] if incremental else None
+                        if progress:
+                            print(f"\r{Colors.CYAN}Exported {written} rows...{Colors.RESET}", end='', flush=True)
+                        rows = cursor.fetchmany(batch_size)
+                if progress:
+                    print()
+                return written, last_id
+            written, last_id = self._run(work, buffered=False)
+            if not written:
                 print(f"{Colors.YELLOW}No results to export.{Colors.RESET}")
                 return 0
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['username','wpm','accuracy','raw_wpm','errors','difficulty','time_taken','test_date'])
-                for r in rows:
-                    # ensure datetime is string
-                    row = list(r)
-                    if isinstance(row[-1], datetime):
-                        row[-1] = row[-1].strftime('%Y-%m-%d %H:%M:%S')
-                    writer.writerow(row)
-            print(f"{Colors.GREEN}Exported {len(rows)} rows to {filepath}{Colors.RESET}")
-            return len(rows)
+            if incremental and last_id is not None:
+                state[state_key] = last_id
+                with open(self.EXPORT_STATE_FILE, 'w', encoding='utf-8') as f:
+                    json.dump(state, f, indent=2)
+            print(f"{Colors.GREEN}Exported {written} rows to {filepath}{Colors.RESET}")
+            return written
         except Exception as e:
             print(f"{Colors.RED}Error exporting CSV: {e}{Colors.RESET}")
             return -1
+    def import_results_from_csv(self, filepath, batch_size=5000, progress=True):
+        """Bulk-load a CSV in the export_results_to_csv format (optionally .gz).
+
+        The file is streamed in `batch_size` chunks, each inserted with one
+        executemany inside its own transaction. Usernames are resolved to
+        ids a chunk at a time through a local cache, creating missing users
+        in bulk. Rows already in the database (same user, difficulty, scores,
+        time taken and date) are skipped, so re-running an import is safe.
+        The per-user bests, rollups and leaderboard cache are rebuilt once at
+        the end. Returns (imported, skipped), or None on error.
+        """
+        user_ids = {}
+        imported = skipped = 0
+        def resolve(cursor, names):
+            missing = [n for n in names if n not in user_ids]
+            if not missing:
+                return
+            placeholders = ', '.join(['%s'] * len(missing))
+            cursor.executemany(f"{self.INSERT_IGNORE} INTO users (username) VALUES (%s)", [(n,) for n in missing])
+            cursor.execute(f"SELECT username, id FROM users WHERE username IN ({placeholders})", missing)
+            user_ids.update(cursor.fetchall())
+        def load(chunk):
+            def work(cursor):
+                resolve(cursor, {row['username'] for row in chunk})
+                rows = []
+                for row in chunk:
+                    test_date = self._parse_datetime(row.get('test_date') or datetime.now())
+                    rows.append((
+                        user_ids[row['username']], f"{float(row['wpm']):.2f}", f"{float(row['accuracy']):.2f}",
+                        f"{float(row['raw_wpm']):.2f}", int(row['errors']), row['difficulty'],
+                        int(float(row['time_taken'])), test_date,
+                    ))
+                # duplicate detection on the natural key, scoped to this chunk's users and dates
+                users = sorted({r[0] for r in rows})
+                cursor.execute(f"""
+                    SELECT user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken, test_date
+                    FROM test_results
+                    WHERE user_id IN ({', '.join(['%s'] * len(users))}) AND test_date BETWEEN %s AND %s
+                """, users + [min(r[7] for r in rows), max(r[7] for r in rows)])
+                # compared as datetimes: the CSV and each driver spell dates their own way
+                seen = {(u, f"{float(w):.2f}", f"{float(a):.2f}", f"{float(rw):.2f}", e, d, t, self._parse_datetime(td))
+                        for u, w, a, rw, e, d, t, td in cursor.fetchall()}
+                fresh = []
+                for r in rows:
+                    if r not in seen:
+                        seen.add(r)
+                        fresh.append(r + (hashlib.sha1('|'.join(map(str, r)).encode('utf-8')).hexdigest()[:32],))
+                if fresh:
+                    cursor.executemany(f"""
+                        INSERT INTO test_results (user_id, wpm, accuracy, raw_wpm, errors, difficulty, time_taken, test_date, result_key)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        {self.RESULT_CONFLICT}
+                    """, fresh)
+                    # rows the conflict clause dropped (a result_key already stored) weren't imported
+                    return max(cursor.rowcount, 0)
+                return 0
+            return self._run(work, commit=True)
+        try:
+            if filepath.endswith('.gz'):
+                import gzip
+                opener = gzip.open
+            else:
+                opener = open
+            with opener(filepath, 'rt', newline='', encoding='utf-8') as csvfile:
+                reader = csv.DictReader(csvfile)
+                missing = [c for c in self.CSV_COLUMNS if c not in (reader.fieldnames or [])]
+                if missing:
+                    print(f"{Colors.RED}Not a results CSV, missing columns: {', '.join(missing)}{Colors.RESET}")
+                    return None
+                for chunk in iter(lambda: list(itertools.islice(reader, batch_size)), []):
+                    inserted = load(chunk)
+                    imported += inserted
+                    skipped += len(chunk) - inserted
+                    if progress:
+                        print(f"\r{Colors.CYAN}Imported {imported} rows, skipped {skipped}...{Colors.RESET}", end='', flush=True)
+            if progress:
+                print()
+            if imported:
+                self.rebuild_user_best()
+                self.check_user_stats(repair=True)
+                self.leaderboard_cache.invalidate()
+            print(f"{Colors.GREEN}Imported {imported} rows from {filepath} ({skipped} duplicates skipped){Colors.RESET}")
+            return imported, skipped
+        except Exception as e:
+            print(f"\n{Colors.RED}Error importing CSV: {e}{Colors.RESET}")
+            return None
+    @staticmethod
+    def _format_date(value):
+        """A test_date as the CSV holds it: 'YYYY-MM-DD HH:MM:SS'."""
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        return str(value)[:19]
+    @staticmethod
+    def _parse_datetime(value):
+        """A test_date from a CSV cell or a driver, as a datetime to the second."""
+        if not isinstance(value, datetime):
+            value = datetime.fromisoformat(str(value))
+        return value.replace(microsecond=0)
+    @staticmethod
+    def _parse_date(value):
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        return datetime.strptime(value, '%Y-%m-%d')
 
+class Database(StorageBackend):
+    """MySQL backend: a pool of up to pool_size connections to the server in the config.
 
+    The mysql-connector driver is only imported by connect() (or when an
+    error has to be matched), not when the backend is created. Connections
+    are opened as they are needed, kept in `connections` and idle ones in
+    `idle`, so close() can close every one it owns.
+    """
+    # MySQL error numbers worth retrying: server gone away, lost connection,
+    # lock wait timeout, deadlock
+    TRANSIENT_ERRNOS = {2006, 2013, 2055, 1205, 1213}
+    INSERT_IGNORE = "INSERT IGNORE"
+    RESULT_CONFLICT = "ON DUPLICATE KEY UPDATE id = id"
+    LOG_CONFLICT = "ON DUPLICATE KEY UPDATE result_id = result_id"
+    # assignments run left to right, so accuracy goes first
+    USER_BEST_CONFLICT = """
+        ON DUPLICATE KEY UPDATE
+            best_accuracy = IF(VALUES(best_wpm) > best_wpm
+                               OR (VALUES(best_wpm) = best_wpm AND VALUES(best_accuracy) > best_accuracy),
+                               VALUES(best_accuracy), best_accuracy),
+            best_wpm = GREATEST(best_wpm, VALUES(best_wpm))
+    """
+    USER_STATS_CONFLICT = """
+        ON DUPLICATE KEY UPDATE
+            test_count = test_count + 1,
+            wpm_sum = wpm_sum + VALUES(wpm_sum),
+            wpm_sq_sum = wpm_sq_sum + VALUES(wpm_sq_sum),
+            accuracy_sum = accuracy_sum + VALUES(accuracy_sum),
+            best_wpm = GREATEST(best_wpm, VALUES(best_wpm)),
+            best_accuracy = GREATEST(best_accuracy, VALUES(best_accuracy)),
+            recent_wpm = SUBSTRING_INDEX(CONCAT_WS(',', VALUES(recent_wpm), NULLIF(recent_wpm, '')), ',', {recent})
+    """
 
-class TypingTest:
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.idle = None
+        self.connections = []
+        self.lock = threading.Lock()
+    @property
+    def driver(self):
+        return optional_import('mysql.connector')
+    @property
+    def Error(self):
+        driver = self.driver
+        return driver.Error if driver is not None else ConnectionError
+    @property
+    def connected(self):
+        return self.idle is not None
+    def connect(self):
+        if self.driver is None:
+            print(f"{Colors.RED}The MySQL driver is not installed (pip install mysql-connector-python); "
+                  f"set backend = sqlite to use a local database instead.{Colors.RESET}")
+            return False
+        self.idle = queue.LifoQueue()
+        try:
+            with self.lock:
+                self.idle.put(self._open())
+            return self.health_check()
+        except self.Error as e:
+            self.close()
+            print(f"{Colors.RED}Database connection failed: {e}{Colors.RESET}")
+            return False
+    def _open(self):
+        """Open a connection and count it against pool_size; the caller holds the lock."""
+        cfg = self.config
+        connection = self.driver.connect(
+            host=cfg['host'],
+            port=cfg['port'],
+            user=cfg['user'],
+            password=cfg['password'],
+            database=cfg['database']
+        )
+        self.connections.append(connection)
+        return connection
+    def _checkout(self):
+        """Take an idle connection, open one while under pool_size, or wait up to pool_timeout for one."""
+        with self.lock:
+            if self.idle is None:
+                raise self.Error("Not connected to the database")
+            idle = self.idle
+            if idle.empty() and len(self.connections) < self.config['pool_size']:
+                return self._open()
+        try:
+            connection = idle.get(timeout=self.config['pool_timeout'])
+        except queue.Empty:
+            raise self.driver.errors.PoolError("No database connection free within pool_timeout") from None
+        try:
+            # reconnect a connection the server dropped while it sat idle
+            connection.ping(reconnect=True, attempts=1)
+        except self.Error:
+            self._checkin(connection)
+            raise
+        return connection
+    def _checkin(self, connection):
+        """Hand a connection back, ending its transaction; close it if the pool was closed or it broke."""
+        try:
+            connection.rollback()
+        except self.Error:
+            with self.lock:
+                if connection in self.connections:
+                    self.connections.remove(connection)
+            try:
+                connection.close()
+            except self.Error:
+                pass
+            return
+        with self.lock:
+            if connection in self.connections:
+                self.idle.put(connection)
+                return
+        connection.close()
+    def _is_transient(self, error):
+        if self.driver is None:
+            return False
+        errs = self.driver.errors
+        if isinstance(error, (errs.OperationalError, errs.InterfaceError)) and not isinstance(error, errs.PoolError):
+            return True
+        return getattr(error, 'errno', None) in self.TRANSIENT_ERRNOS
+    def _transaction(self, work, commit=False, **cursor_args):
+        """Run `work(cursor)` on a pooled connection and return its result.
+
+        The cursor is always closed and the connection handed back to the
+        pool. Transient failures (lost connection, deadlock, ...) are retried
+        up to `retries` times with backoff; other errors, and transient ones
+        that outlast the retries, are raised to the caller.
+        """
+        attempt = 0
+        while True:
+            connection = None
+            try:
+                connection = self._checkout()
+                cursor = connection.cursor(**cursor_args)
+                try:
+                    result = work(cursor)
+                    if commit:
+                        connection.commit()
+                    return result
+                finally:
+                    cursor.close()
+            except self.Error as e:
+                if connection is not None and commit:
+                    try:
+                        connection.rollback()
+                    except self.Error:
+                        pass
+                if attempt >= self.config['retries'] or not self._is_transient(e):
+                    raise
+                attempt += 1
+                time.sleep(0.05 * 2 ** attempt)
+            finally:
+                if connection is not None:
+                    self._checkin(connection)
+    def _create_schema(self, cursor):
+        cursor.execute("""               
+            CREATE TABLE IF NOT EXISTS users (  
+                id INT PRIMARY KEY AUTO_INCREMENT,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS test_results (
+                id INT PRIMARY KEY AUTO_INCREMENT,
+                user_id INT,
+                wpm DECIMAL(6,2),
+                accuracy DECIMAL(5,2),
+                raw_wpm DECIMAL(6,2),
+                errors INT,
+                difficulty ENUM('easy', 'medium', 'hard', 'extreme'),
+                time_taken INT,
+                test_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+                result_key CHAR(32),
+                paragraph_id CHAR(16),
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                INDEX idx_wpm (wpm DESC),
+                INDEX idx_difficulty (difficulty),
+                INDEX idx_date (test_date DESC),
+                UNIQUE INDEX idx_result_key (result_key),
+                INDEX idx_user_best (user_id, difficulty, wpm, accuracy),
+                INDEX idx_board (difficulty, wpm, accuracy),
+                INDEX idx_board_all (wpm, accuracy),
+                INDEX idx_paragraph (paragraph_id, wpm)
+            )
+        """)
+        self._migrate(cursor)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_best (
+                user_id INT NOT NULL,
+                difficulty VARCHAR(10) NOT NULL,
+                best_wpm DECIMAL(6,2) NOT NULL,
+                best_accuracy DECIMAL(5,2) NOT NULL,
+                PRIMARY KEY (user_id, difficulty),
+                INDEX idx_rank (difficulty, best_wpm, best_accuracy),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INT NOT NULL,
+                difficulty VARCHAR(10) NOT NULL,
+                test_count INT NOT NULL,
+                wpm_sum DOUBLE NOT NULL,
+                wpm_sq_sum DOUBLE NOT NULL,
+                accuracy_sum DOUBLE NOT NULL,
+                best_wpm DECIMAL(6,2) NOT NULL,
+                best_accuracy DECIMAL(5,2) NOT NULL,
+                recent_wpm VARCHAR(255) NOT NULL DEFAULT '',
+                PRIMARY KEY (user_id, difficulty),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS keystroke_logs (
+                result_id INT PRIMARY KEY,
+                event_count INT NOT NULL,
+                data MEDIUMBLOB NOT NULL,
+                FOREIGN KEY (result_id) REFERENCES test_results(id) ON DELETE CASCADE
+            )
+        """)
+    def _migrate(self, cursor):
+        """Bring a test_results table created by an older version up to date."""
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'test_results'
+        """)
+        columns = {row[0] for row in cursor.fetchall()}
+        if 'result_key' not in columns:
+            cursor.execute("ALTER TABLE test_results ADD COLUMN result_key CHAR(32), ADD UNIQUE INDEX idx_result_key (result_key)")
+        if 'paragraph_id' not in columns:
+            cursor.execute("ALTER TABLE test_results ADD COLUMN paragraph_id CHAR(16), ADD INDEX idx_paragraph (paragraph_id, wpm)")
+        cursor.execute("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'test_results'
+        """)
+        indexes = {row[0] for row in cursor.fetchall()}
+        if 'idx_user_best' not in indexes:
+            cursor.execute("ALTER TABLE test_results ADD INDEX idx_user_best (user_id, difficulty, wpm, accuracy)")
+        if 'idx_board' not in indexes:
+            cursor.execute("ALTER TABLE test_results ADD INDEX idx_board (difficulty, wpm, accuracy)")
+        if 'idx_board_all' not in indexes:
+            cursor.execute("ALTER TABLE test_results ADD INDEX idx_board_all (wpm, accuracy)")
+    def close(self):
+        # close the idle connections; checked-out ones close when they are handed back
+        with self.lock:
+            idle, self.idle = self.idle, None
+            self.connections = []
+        while idle is not None and not idle.empty():
+            idle.get_nowait().close()
+
+class SQLiteCursor:
+    """Cursor wrapper that runs the shared %s-style queries on sqlite3.
+
+    Each query is translated to the ? paramstyle once and remembered, so the
+    same string keeps hitting sqlite3's per-connection prepared statement cache.
+    SQLite stores DATETIME columns as text, so datetime parameters are
+    written as 'YYYY-MM-DD HH:MM:SS' and the DATETIME_COLUMNS read back as
+    datetimes here, rather than through sqlite3's process-wide adapters.
+    """
+    translated = {}
+    DATETIME_COLUMNS = frozenset(('test_date', 'created_at'))
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.dates = ()
+    @classmethod
+    def translate(cls, query):
+        sql = cls.translated.get(query)
+        if sql is None:
+            if len(cls.translated) >= 1024:
+                cls.translated.clear()
+            sql = cls.translated[query] = re.sub(r"%([%s])", lambda m: '?' if m.group(1) == 's' else '%', query)
+        return sql
+    @staticmethod
+    def adapt(params):
+        return [p.strftime('%Y-%m-%d %H:%M:%S') if isinstance(p, datetime) else p for p in params]
+    def execute(self, query, params=()):
+        self.cursor.execute(self.translate(query), self.adapt(params))
+        self.dates = [i for i, column in enumerate(self.cursor.description or ())
+                      if column[0] in self.DATETIME_COLUMNS]
+    def executemany(self, query, seq_params):
+        self.cursor.executemany(self.translate(query), map(self.adapt, seq_params))
+        self.dates = ()
+    def convert(self, row):
+        if row is None or not self.dates:
+            return row
+        row = list(row)
+        for i in self.dates:
+            if isinstance(row[i], str):
+                row[i] = datetime.fromisoformat(row[i])
+        return tuple(row)
+    def fetchone(self):
+        return self.convert(self.cursor.fetchone())
+    def fetchmany(self, size=None):
+        rows = self.cursor.fetchmany(self.cursor.arraysize if size is None else size)
+        return [self.convert(row) for row in rows] if self.dates else rows
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        return [self.convert(row) for row in rows] if self.dates else rows
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class SQLiteDatabase(StorageBackend):
+    """Embedded backend: a single SQLite file in WAL mode, for kiosks and CI.
+
+    Every thread gets its own connection, and WAL lets the result writer
+    commit while the UI thread reads. Each connection keeps up to
+    STATEMENT_CACHE prepared statements and a page cache capped at
+    `sqlite_cache_kb`.
+    """
+    STATEMENT_CACHE = 256
+    INSERT_IGNORE = "INSERT OR IGNORE"
+    RESULT_CONFLICT = "ON CONFLICT (result_key) DO NOTHING"
+    LOG_CONFLICT = "ON CONFLICT (result_id) DO NOTHING"
+    # unlike MySQL, every assignment sees the old row
+    USER_BEST_CONFLICT = """
+        ON CONFLICT (user_id, difficulty) DO UPDATE SET
+            best_accuracy = CASE WHEN excluded.best_wpm > best_wpm
+                                      OR (excluded.best_wpm = best_wpm AND excluded.best_accuracy > best_accuracy)
+                                 THEN excluded.best_accuracy ELSE best_accuracy END,
+            best_wpm = MAX(best_wpm, excluded.best_wpm)
+    """
+    USER_STATS_CONFLICT = """
+        ON CONFLICT (user_id, difficulty) DO UPDATE SET
+            test_count = test_count + 1,
+            wpm_sum = wpm_sum + excluded.wpm_sum,
+            wpm_sq_sum = wpm_sq_sum + excluded.wpm_sq_sum,
+            accuracy_sum = accuracy_sum + excluded.accuracy_sum,
+            best_wpm = MAX(best_wpm, excluded.best_wpm),
+            best_accuracy = MAX(best_accuracy, excluded.best_accuracy),
+            recent_wpm = push_recent(excluded.recent_wpm, recent_wpm, {recent})
+    """
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        path = self.config['sqlite_path']
+        self.path = path if os.path.isabs(path) else os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        self.local = None
+        self.connections = []
+        self.lock = threading.Lock()
+    @property
+    def driver(self):
+        return optional_import('sqlite3')
+    @property
+    def Error(self):
+        driver = self.driver
+        return driver.Error if driver is not None else ConnectionError
+    @property
+    def connected(self):
+        return self.local is not None
+    def connect(self):
+        if self.driver is None:
+            print(f"{Colors.RED}This Python was built without sqlite3; "
+                  f"set backend = mysql to use a MySQL server instead.{Colors.RESET}")
+            return False
+        self.local = threading.local()
+        if self.health_check():
+            return True
+        self.close()
+        print(f"{Colors.RED}Database connection failed: unable to open {self.path}{Colors.RESET}")
+        return False
+    def _connection(self):
+        if self.local is None:
+            raise self.driver.ProgrammingError("Not connected to the database")
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.driver.connect(
+                self.path,
+                timeout=self.config['pool_timeout'],
+                cached_statements=self.STATEMENT_CACHE,
+                check_same_thread=False,    # only close() touches another thread's connection
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute(f"PRAGMA cache_size = -{int(self.config['sqlite_cache_kb'])}")
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.create_function('push_recent', 3, self._push_recent, deterministic=True)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+    @staticmethod
+    def _push_recent(wpm, recent, keep):
+        return ','.join(([wpm] + recent.split(',') if recent else [wpm])[:keep])
+    def _is_transient(self, error):
+        # another connection holding the write lock past the busy timeout
+        return isinstance(error, self.driver.OperationalError) and 'locked' in str(error)
+    def _transaction(self, work, commit=False, **cursor_args):
+        """Run `work(cursor)` on this thread's connection and return its result.
+
+        Takes the same arguments as Database._transaction; cursor options are
+        ignored, since SQLite cursors always step through rows lazily.
+        A locked database is retried up to `retries` times with backoff.
+        """
+        attempt = 0
+        while True:
+            connection = self._connection()
+            cursor = SQLiteCursor(connection.cursor())
+            try:
+                result = work(cursor)
+                if commit:
+                    connection.commit()
+                return result
+            except BaseException as e:
+                # whatever went wrong, don't leave this thread's connection holding the write lock
+                if connection.in_transaction:
+                    connection.rollback()
+                if not isinstance(e, self.Error) or attempt >= self.config['retries'] or not self._is_transient(e):
+                    raise
+                attempt += 1
+                time.sleep(0.05 * 2 ** attempt)
+            finally:
+                cursor.close()
+    def _create_schema(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                created_at DATETIME DEFAULT (datetime('now', 'localtime'))
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS test_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INT REFERENCES users(id),
+                wpm DECIMAL(6,2),
+                accuracy DECIMAL(5,2),
+                raw_wpm DECIMAL(6,2),
+                errors INT,
+                difficulty VARCHAR(10) CHECK (difficulty IN ('easy', 'medium', 'hard', 'extreme')),
+                time_taken INT,
+                test_date DATETIME DEFAULT (datetime('now', 'localtime')),
+                result_key CHAR(32),
+                paragraph_id CHAR(16)
+            )
+        """)
+        cursor.execute("PRAGMA table_info(test_results)")
+        if 'paragraph_id' not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE test_results ADD COLUMN paragraph_id CHAR(16)")
+        for index in (
+            "idx_wpm ON test_results (wpm DESC)",
+            "idx_difficulty ON test_results (difficulty)",
+            "idx_date ON test_results (test_date DESC)",
+            "idx_user_best ON test_results (user_id, difficulty, wpm, accuracy)",
+            "idx_board ON test_results (difficulty, wpm, accuracy)",
+            "idx_board_all ON test_results (wpm, accuracy)",
+            "idx_paragraph ON test_results (paragraph_id, wpm)",
+        ):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_result_key ON test_results (result_key)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_best (
+                user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                difficulty VARCHAR(10) NOT NULL,
+                best_wpm DECIMAL(6,2) NOT NULL,
+                best_accuracy DECIMAL(5,2) NOT NULL,
+                PRIMARY KEY (user_id, difficulty)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rank ON user_best (difficulty, best_wpm, best_accuracy)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                difficulty VARCHAR(10) NOT NULL,
+                test_count INT NOT NULL,
+                wpm_sum DOUBLE NOT NULL,
+                wpm_sq_sum DOUBLE NOT NULL,
+                accuracy_sum DOUBLE NOT NULL,
+                best_wpm DECIMAL(6,2) NOT NULL,
+                best_accuracy DECIMAL(5,2) NOT NULL,
+                recent_wpm VARCHAR(255) NOT NULL DEFAULT '',
+                PRIMARY KEY (user_id, difficulty)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS keystroke_logs (
+                result_id INTEGER PRIMARY KEY REFERENCES test_results(id) ON DELETE CASCADE,
+                event_count INT NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        self.local = None
+        for connection in connections:
+            connection.close()
+
+BACKENDS = {'mysql': Database, 'sqlite': SQLiteDatabase}
+
+def open_database(config=None):
+    """A storage backend of the kind named by the `backend` setting (see load_db_config)."""
+    config = config or load_db_config()
+    backend = BACKENDS.get(config['backend'].lower())
+    if backend is None:
+        raise ValueError(f"Unknown database backend '{config['backend']}' (expected one of: {', '.join(BACKENDS)})")
+    return backend(config)
+
+class ResultJournal:
+    """Append-only local file of results waiting to reach the database.
+
+    Results go here whenever they can't reach the database: tests taken in
+    offline mode, and results the ResultWriter had to give up on, whether
+    the database was unreachable or refused them. A record
+    is a '<II' header (payload length, CRC32) followed by the result as
+    JSON. Each append() call writes all its records and fsyncs once. A
+    record torn by a crash fails its check and is cut off the next time
+    the journal is opened.
+
+    Records name the user rather than holding a user id, which may not
+    exist yet, and carry a result_key. sync() replays them in bulk through
+    save_results, which skips keys it already has, so a sync interrupted
+    half way never stores a result twice. Synced records are then
+    compacted out of the file; records the database refuses are moved to
+    its end, so they don't hold up the rest and are tried again next time.
+    """
+    HEADER = struct.Struct('<II')
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.journal')
+
+    def __init__(self, path=None, keystrokes=True):
+        self.path = path or self.DEFAULT_PATH
+        self.keystrokes = keystrokes    # also journal each result's KeystrokeLog
+        self.lock = threading.Lock()
+        self.file = None
+        self.checked = False
+    def append(self, results):
+        """Journal result dicts (save_results keys plus 'username'). Returns how many were written."""
+        records = []
+        for r in results:
+            if not r.get('result_key'):
+                import uuid
+                r['result_key'] = uuid.uuid4().hex
+            record = {
+                'username': r['username'],
+                'wpm': float(r['wpm']),
+                'accuracy': float(r['accuracy']),
+                'raw_wpm': float(r['raw_wpm']),
+                'errors': r['errors'],
+                'difficulty': r['difficulty'],
+                'time_taken': r['time_taken'],
+                'paragraph_id': r.get('paragraph_id'),
+                'test_date': (r.get('test_date') or datetime.now()).isoformat(sep=' ', timespec='seconds'),
+                'result_key': r['result_key'],
+            }
+            log = r.get('keystrokes')
+            if self.keystrokes and log is not None and len(log):
+                record['keystrokes'] = base64.b64encode(log.to_blob()).decode('ascii')
+            records.append(record)
+        return self._write_records(records)
+    def _write_records(self, records):
+        chunks = []
+        for record in records:
+            payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+            chunks.append(self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        with self.lock:
+            self._check()
+            if self.file is None:
+                self.file = open(self.path, 'ab')
+            self.file.write(b''.join(chunks))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        return len(chunks)
+    def pending(self):
+        """Number of results waiting to be synced."""
+        with self.lock:
+            self._check()
+            return sum(1 for _ in self._scan())
+    def sync(self, db, batch_size=200):
+        """Replay the journal into `db` and compact away what got stored.
+
+        Results are saved `batch_size` at a time. A batch the database
+        refuses is saved one result at a time and the refused ones stay
+        journaled; any other failure stops the sync, and that batch and
+        everything after it stay journaled. Returns (synced, remaining).
+        """
+        with self.lock:
+            self._check()
+            records = list(self._scan())
+        if not records:
+            return 0, 0
+        user_ids = {}
+        synced = done = keep_from = 0
+        refused = []
+        try:
+            for start in range(0, len(records), batch_size):
+                batch = records[start:start + batch_size]
+                results = []
+                for _, record in batch:
+                    username = record['username']
+                    if username not in user_ids:
+                        user_ids[username] = db.get_or_create_user(username)
+                        if not user_ids[username]:
+                            raise ConnectionError(f"could not look up user '{username}'")
+                    blob = record.get('keystrokes')
+                    results.append(dict(
+                        record,
+                        user_id=user_ids[username],
+                        test_date=datetime.fromisoformat(record['test_date']),
+                        keystrokes=KeystrokeLog.from_blob(base64.b64decode(blob)) if blob else None,
+                    ))
+                try:
+                    db.save_results(results)
+                    stored = len(batch)
+                except db.Error as e:
+                    if db._is_transient(e):
+                        raise
+                    stored = 0
+                    for (_, record), result in zip(batch, results):
+                        try:
+                            db.save_results([result])
+                            stored += 1
+                        except db.Error as e:
+                            if db._is_transient(e):
+                                raise
+                            refused.append(record)
+                RESULTS_SAVED.inc(stored)
+                synced += stored
+                done += len(batch)
+                keep_from = batch[-1][0]
+        except Exception as e:
+            print(f"{Colors.RED}Journal sync stopped: {e}{Colors.RESET}")
+        if refused:
+            # re-journal them before compacting, so a crash in between can only duplicate them
+            print(f"{Colors.RED}The database refused {len(refused)} journaled result(s); they stay journaled.{Colors.RESET}")
+            self._write_records(refused)
+        if keep_from:
+            self._compact(keep_from)
+        return synced, len(records) - done + len(refused)
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+    def _scan(self):
+        """Yield (end_offset, record) for each intact record, stopping at the first bad one."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            offset = 0
+            while True:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return
+                length, crc = self.HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                offset += self.HEADER.size + length
+                yield offset, json.loads(payload)
+    def _check(self):
+        """Once per run, truncate a record left half written by a crash."""
+        if self.checked:
+            return
+        self.checked = True
+        if not os.path.exists(self.path):
+            return
+        end = 0
+        for end, _ in self._scan():
+            pass
+        size = os.path.getsize(self.path)
+        if end < size:
+            print(f"{Colors.YELLOW}Dropping {size - end} bytes of a damaged record from {self.path}{Colors.RESET}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+                os.fsync(f.fileno())
+    def _compact(self, keep_from):
+        """Rewrite the journal without its first `keep_from` bytes, atomically."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if keep_from >= os.path.getsize(self.path):
+                os.remove(self.path)
+                return
+            tmp = self.path + '.tmp'
+            with open(self.path, 'rb') as src, open(tmp, 'wb') as out:
+                src.seek(keep_from)
+                shutil.copyfileobj(src, out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, self.path)
+
+class ResultWriter:
+    """Write-behind queue that saves finished results off the UI thread.
+
+    submit() only enqueues, so finishing a test never waits on the database.
+    A worker thread flushes when `batch_size` results are waiting or
+    `flush_interval` seconds after the oldest one arrived, one
+    Database.save_results round trip per batch. The queue is bounded: when
+    it is full, submit() blocks for up to `put_timeout` seconds and then
+    gives up. Batches that fail on a transient error are retried with
+    backoff. A batch the database rejects is retried one result at a time,
+    so only the results it actually refuses are set aside. Whatever can't
+    be written, because the database stays unreachable or refuses it, is
+    appended to `journal` (a ResultJournal, when given) for a later sync.
+    Results that can't be journaled either end up in `failed`; take_failures() counts the ones nobody
+    has been told about yet. close() (also run at exit) flushes whatever is
+    queued and reports any failures left.
+    """
+    def __init__(self, db, batch_size=50, flush_interval=1.0, max_pending=1000, retries=5, put_timeout=2.0,
+                 journal=None):
+        self.db = db
+        self.journal = journal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.failed = []
+        self.reported = 0       # how many of `failed` take_failures() has already counted
+        self.last_error = None
+        self.thread = None
+        self.lock = threading.Lock()
+        WRITER_QUEUE.set_function(self.queue.qsize)
+    def submit(self, result):
+        """Queue a result dict (see Database.save_results). False if the queue stayed full."""
+        self._ensure_started()
+        try:
+            self.queue.put(result, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            return False
+    def pending(self):
+        return self.queue.qsize()
+    def flush(self):
+        """Block until every submitted result has been written or given up on."""
+        if self.thread is not None:
+            self.queue.join()
+    def take_failures(self):
+        """How many results have failed since the last call."""
+        with self.lock:
+            count = len(self.failed) - self.reported
+            self.reported = len(self.failed)
+        return count
+    def close(self):
+        if self.thread is None:
+            return
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        count = self.take_failures()
+        if count:
+            print(f"{Colors.RED}{count} result(s) could not be saved: {self.last_error}{Colors.RESET}")
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._worker, name="result-writer", daemon=True)
+                self.thread.start()
+                atexit.register(self.close)
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+    def _write(self, batch):
+        rejected = False
+        for attempt in range(self.retries + 1):
+            try:
+                if not self.db.connected and not self.db.connect():
+                    raise ConnectionError("database unavailable")
+                self.db.save_results(batch)
+                RESULTS_SAVED.inc(len(batch))
+                return
+            except Exception as e:
+                self.last_error = e
+                if isinstance(e, self.db.Error) and not self.db._is_transient(e):
+                    rejected = True
+                    break
+                time.sleep(min(0.1 * 2 ** attempt, 5.0))
+        if rejected and len(batch) > 1:
+            # one bad result mustn't sink the rest of its batch
+            for result in batch:
+                self._write([result])
+            return
+        if self.journal is not None:
+            # out of the database's reach or refused by it: keep it for a later sync rather than lose it
+            try:
+                self.journal.append(batch)
+                RESULTS_JOURNALED.inc(len(batch))
+                return
+            except OSError as e:
+                self.last_error = e
+        with self.lock:
+            self.failed.extend(batch)
+        RESULTS_FAILED.inc(len(batch))
+
+Paragraph = collections.namedtuple('Paragraph', 'id difficulty offset length chars text')
+
+def normalize_paragraph(raw):
+    """One paragraph as it is shown and typed: unified line endings, no trailing spaces, no blank edges."""
+    para = raw.strip().replace('\r\n', '\n').replace('\r', '\n')
+    para = para.replace('  \n', '\n')
+    return '\n'.join(line.rstrip() for line in para.split('\n')).strip('\n')
+
+class CorpusIndex:
+    """The typing texts, parsed once and kept in per-difficulty tables.
+
+    Each text_<difficulty>.txt becomes a list of Paragraphs: the normalized
+    text, the byte offset and length of the raw paragraph in the file, its
+    character count and a stable id (a hash of the text, so it survives
+    edits elsewhere in the file). Files of `mmap_threshold` bytes or more
+    are memory-mapped and keep no text in memory; a paragraph is read back
+    from the map when it is picked. A file is re-parsed only when its
+    mtime or size changes.
+    """
+    SEPARATOR = b'###PARA'
+    SEARCH_PATH = ('', 'texts', os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, mmap_threshold=1 << 20):
+        self.mmap_threshold = mmap_threshold
+        self.tables = {}    # difficulty -> (path, (mtime_ns, size), paragraphs, mmap or None)
+        self.decks = {}     # (deck, difficulty) -> [paragraphs, order, seen ids]
+        self.lock = threading.Lock()
+    def find(self, difficulty):
+        filename = f"text_{difficulty}.txt"
+        for directory in self.SEARCH_PATH:
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                return path
+        return None
+    def paragraphs(self, difficulty):
+        """The difficulty's paragraph table, re-parsing the file if it changed. Raises OSError."""
+        return self._table(difficulty)[2]
+    def _table(self, difficulty):
+        path = self.find(difficulty)
+        if path is None:
+            raise FileNotFoundError(f"text_{difficulty}.txt not found")
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            table = self.tables.get(difficulty)
+            if table is None or table[0] != path or table[1] != stamp:
+                if table is not None and table[3] is not None:
+                    table[3].close()
+                table = self.tables[difficulty] = (path, stamp) + self._parse(path, difficulty, st.st_size)
+            return table
+    def _parse(self, path, difficulty, size):
+        import mmap
+        with open(path, 'rb') as f:
+            if size >= self.mmap_threshold:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+        mapped = data if isinstance(data, mmap.mmap) else None
+        paragraphs = []
+        start = 0
+        while start <= len(data):
+            end = data.find(self.SEPARATOR, start)
+            if end < 0:
+                end = len(data)
+            text = normalize_paragraph(data[start:end].decode('utf-8'))
+            if text:
+                paragraphs.append(Paragraph(
+                    hashlib.sha1(text.encode('utf-8')).hexdigest()[:16], difficulty,
+                    start, end - start, len(text), None if mapped is not None else text,
+                ))
+            start = end + len(self.SEPARATOR)
+        return paragraphs, mapped
+    def text(self, paragraph):
+        """A paragraph's normalized text, read back from the file map if it isn't held in memory."""
+        if paragraph.text is not None:
+            return paragraph.text
+        data = self._table(paragraph.difficulty)[3]
+        return normalize_paragraph(data[paragraph.offset:paragraph.offset + paragraph.length].decode('utf-8'))
+    def pick(self, difficulty, deck=None, rng=random):
+        """A random paragraph (with its text), or None if the file has none.
+
+        With a `deck` key (e.g. a username) paragraphs come in a shuffled
+        order that repeats none until all have been seen; decks are kept
+        per difficulty and survive a reload of the file.
+        """
+        paragraphs = self.paragraphs(difficulty)
+        if not paragraphs:
+            return None
+        if deck is None:
+            paragraph = rng.choice(paragraphs)
+        else:
+            key = (deck, difficulty)
+            with self.lock:
+                state = self.decks.get(key)
+                seen = state[2] if state is not None else set()
+                if state is None or state[0] is not paragraphs or not state[1]:
+                    order = [p for p in paragraphs if p.id not in seen]
+                    if not order:   # been through them all: start over
+                        seen = set()
+                        order = list(paragraphs)
+                    rng.shuffle(order)
+                    state = self.decks[key] = [paragraphs, order, seen]
+                paragraph = state[1].pop()
+                seen.add(paragraph.id)
+        return paragraph._replace(text=self.text(paragraph))
+
+class WinsoundSink:
+    """Plays the WAV through winsound (Windows) without waiting for it to finish."""
+    def __init__(self, winsound):
+        self.winsound = winsound
+        self.sound = None
+        self.path = None
+    def play(self, sound):
+        winsound = self.winsound
+        if sound is None:
+            winsound.MessageBeep()
+            return
+        # SND_MEMORY can't be combined with SND_ASYNC, so the sound is played from a file
+        if sound is not self.sound:
+            self._remove()
+            with tempfile.NamedTemporaryFile(prefix='typing-click-', suffix='.wav', delete=False) as f:
+                f.write(sound)
+            self.sound, self.path = sound, f.name
+        winsound.PlaySound(self.path, winsound.SND_FILENAME | winsound.SND_ASYNC | winsound.SND_NODEFAULT)
+    def _remove(self):
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.sound = self.path = None
+    def close(self):
+        if self.path is not None:
+            self.winsound.PlaySound(None, 0)
+        self._remove()
+
+class CommandSink:
+    """Pipes the WAV to a command-line player (aplay, pw-play or paplay on Linux)."""
+    PLAYERS = (('aplay', '-q', '-'), ('pw-play', '-'), ('paplay',))
+
+    def __init__(self, argv):
+        self.argv = list(argv)
+        self.process = None
+    @classmethod
+    def find(cls):
+        """A sink for the first player installed here, or None."""
+        for argv in cls.PLAYERS:
+            if shutil.which(argv[0]):
+                return cls(argv)
+        return None
+    def play(self, sound):
+        if sound is None:
+            return
+        if self.process is not None and self.process.poll() is None:
+            return      # the player is slower to exit than the click is long; skip, don't queue
+        import subprocess
+        self.process = subprocess.Popen(self.argv, stdin=subprocess.PIPE,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.process.stdin.write(sound)
+            self.process.stdin.close()
+        except OSError:
+            pass
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+class BellSink:
+    """Rings the terminal bell, for machines with no way to play the sample."""
+    def play(self, sound):
+        try:
+            os.write(sys.stderr.fileno(), b'\a')
+        except (OSError, ValueError):
+            pass
+    def close(self):
+        pass
+
+class NullSink:
+    """Plays nothing; counts the clicks (for tests and benchmarks)."""
     def __init__(self):
-        self.db = Database()
+        self.played = 0
+    def play(self, sound):
+        self.played += 1
+    def close(self):
+        pass
+
+def audio_sink(name=None):
+    """The sink named by `name` or TYPING_AUDIO (winsound, command, bell, null/off), else the best available."""
+    name = (name or os.environ.get('TYPING_AUDIO') or '').lower()
+    if name in ('null', 'off'):
+        return NullSink()
+    if name in ('', 'winsound'):
+        winsound = optional_import('winsound')
+        if winsound is not None:
+            return WinsoundSink(winsound)
+    if name in ('', 'command'):
+        sink = CommandSink.find()
+        if sink is not None:
+            return sink
+    return BellSink()
+
+class AudioFeedback:
+    """The wrong-key click, played from a worker thread.
+
+    error() only sets an event, so a wrong key never waits on audio. The
+    worker decodes click.wav once with the wave module, trims its
+    near-silent tail and keeps it in memory as a WAV image. It then hands
+    the sound to a sink (see audio_sink) whenever the event is set. Sinks
+    start the sound and return without waiting for it. Errors arriving
+    while a click plays (or within `min_interval` of its start, for a
+    shorter one) are dropped, whatever the sink, so a burst of typos
+    never queues up clicks that would sound after the keys that caused
+    them.
+    """
+    SOUND_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'click.wav')
+    # trailing audio quieter than this fraction of the peak is cut off
+    TAIL_THRESHOLD = 0.01
+
+    def __init__(self, sink=None, sound_file=None, min_interval=0.08):
+        self.sink = sink
+        self.sound_file = sound_file or self.SOUND_FILE
+        self.sound = None
+        self.min_interval = min_interval
+        self.busy_until = 0.0     # monotonic time the click playing now ends
+        self.event = threading.Event()
+        self.thread = None
+        self.closed = False
+        self.lock = threading.Lock()
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.closed = False
+                self.thread = threading.Thread(target=self._worker, name="audio-feedback", daemon=True)
+                self.thread.start()
+    def error(self):
+        if self.thread is None:
+            self.start()
+        self.event.set()
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        self.closed = True
+        self.event.set()
+        thread.join(timeout=1.0)
+        if self.sink is not None:
+            self.sink.close()
+    def _worker(self):
+        if self.sink is None:
+            self.sink = audio_sink()
+        try:
+            self.sound = self.load_sound(self.sound_file)
+        except Exception:
+            self.sound = None   # a malformed WAV mustn't take the worker down with it
+        if self.sound is None and isinstance(self.sink, CommandSink):
+            self.sink = BellSink()  # a player needs a sample; the bell doesn't
+        length = max(self.sound_length(self.sound), self.min_interval)
+        while True:
+            self.event.wait()
+            if self.closed:
+                return
+            self.event.clear()
+            now = time.monotonic()
+            if now < self.busy_until:
+                continue    # the click that is playing already covers this error
+            self.busy_until = now + length
+            try:
+                self.sink.play(self.sound)
+            except Exception:
+                pass    # feedback is best effort; never take the game down over it
+    @staticmethod
+    def sound_length(sound):
+        """Seconds of audio in a WAV image; 0 for None or one that can't be read."""
+        if sound is None:
+            return 0.0
+        import wave
+        try:
+            with wave.open(io.BytesIO(sound), 'rb') as w:
+                return w.getnframes() / w.getframerate()
+        except (EOFError, wave.Error):
+            return 0.0
+    @classmethod
+    def load_sound(cls, path):
+        """click.wav as an in-memory WAV with its silent tail trimmed; None if it can't be read."""
+        import wave
+        try:
+            with wave.open(path, 'rb') as w:
+                params = w.getparams()
+                frames = w.readframes(params.nframes)
+        except (OSError, EOFError, wave.Error):
+            return None
+        if params.sampwidth == 2 and sys.byteorder == 'little':
+            samples = array('h', frames[:len(frames) & ~1])
+            peak = max(map(abs, samples), default=0)
+            end = len(samples)
+            block = params.nchannels * max(1, params.framerate // 100)   # 10 ms, at least one frame
+            while end > 0 and max(map(abs, samples[max(0, end - block):end]), default=0) < peak * cls.TAIL_THRESHOLD:
+                end -= block
+            end = max(0, end) - max(0, end) % params.nchannels
+            frames = samples[:end].tobytes()
+        out = io.BytesIO()
+        with wave.open(out, 'wb') as w:
+            w.setparams(params)
+            w.writeframes(frames)
+        return out.getvalue()
+
+class TypingTest:
+    # deal each user's paragraphs like a shuffled deck instead of independent random picks
+    NO_REPEAT = True
+    MAIN_MENU = [
+        ("🎯 Start Typing Test", Colors.GREEN),
+        ("🏆 View Leaderboard", Colors.YELLOW),
+        ("📊 View Your Statistics", Colors.MAGENTA),
+        ("👤 Change Username", Colors.BLUE),
+        ("🗑️  Clear History", Colors.RED),
+        ("📁 Export Results to CSV", Colors.CYAN),
+        ("🚪 Exit", Colors.RED)
+    ]
+
+    def __init__(self, db=None, corpus=None, writer=None, journal=None):
+        # typing_server passes in the database, corpus, writer and journal its sessions share
+        self.db = db or open_database()
+        self.corpus = corpus or CorpusIndex()
+        self.journal = journal or ResultJournal()
+        self.writer = writer or ResultWriter(self.db, journal=self.journal)
         self.current_user_id = None
         self.username = None
-        self.keyboard = KeyboardInput()
-    def play_error_beep(self):
-        try:
-            sound_file = os.path.join(os.path.dirname(__file__), 'click.wav')
-            if os.path.exists(sound_file):
-                winsound.PlaySound(sound_file, winsound.SND_FILENAME | winsound.SND_ASYNC)
-            else:
-                winsound.Beep(800, 200)  
-        except:
-            print('\a', end='', flush=True)
+        self.terminal = TerminalSession()
+        self.renderer = FrameRenderer()
+        self.audio = AudioFeedback()
+        self.layouts = {}
+        self.profile = None
+        self.max_fps = RenderScheduler.DEFAULT_FPS
+        self.columns = None     # the screen width, when not the local terminal's (see typing_server)
     def clear_screen(self): # ANSI clear screen
         print('\033[H\033[J', end='', flush=True)
     def move_cursor(self, x, y): # ANSI move cursor
@@ -340,39 +2951,29 @@ class TypingTest:
         print('\033[?25l', end='', flush=True)
     def show_cursor(self):
         print('\033[?25h', end='', flush=True)
+    def enable_profile(self, profile):
+        """Time every stage of the typing loop into `profile` (a LatencyProfile)."""
+        self.profile = profile
+        self.audio = ProfiledAudio(self.audio, profile.beep)
+        self.renderer.stream = ProfiledStream(self.renderer.stream, profile.write)
     def load_text(self, difficulty):
-        filename = f"text_{difficulty}.txt"
-        if not os.path.exists(filename):
-            alt = os.path.join("texts", filename)
-            if os.path.exists(alt):
-                filename = alt
-            else:
-                print(f"{Colors.RED}Error: {filename} not found!{Colors.RESET}")
-                return None
+        paragraph = self.pick_paragraph(difficulty)
+        return paragraph.text if paragraph else None
+    def pick_paragraph(self, difficulty):
+        """A paragraph to type from the corpus, not repeating one for this user until they've seen them all."""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                content = f.read()
-            paragraphs = [p for p in content.split('###PARA') if p.strip()]
-            if not paragraphs:
-                print(f"{Colors.RED}Error: No paragraphs found in {filename}!{Colors.RESET}")
-                return None
-            para_raw = random.choice(paragraphs).strip()
-            para = para_raw.replace('\r\n', '\n').replace('\r', '\n')
-            para = para.replace('  \n', '\n')
-            lines = [line.rstrip() for line in para.split('\n')]
-            para = '\n'.join(lines)
-            para = para.strip('\n')
-            return para
+            paragraph = self.corpus.pick(difficulty, deck=self.username if self.NO_REPEAT else None)
+        except FileNotFoundError:
+            print(f"{Colors.RED}Error: text_{difficulty}.txt not found!{Colors.RESET}")
+            return None
         except Exception as e:
             print(f"{Colors.RED}Error loading text: {e}{Colors.RESET}")
             return None
+        if paragraph is None:
+            print(f"{Colors.RED}Error: No paragraphs found in {self.corpus.find(difficulty)}!{Colors.RESET}")
+        return paragraph
     def calculate_wpm(self, chars_typed, time_taken, errors):
-        if time_taken <= 0:
-            return 0, 0
-        minutes = time_taken / 60
-        gross_wpm = (chars_typed / 5) / minutes
-        net_wpm = max(0, ((chars_typed / 5) - errors) / minutes)
-        return round(gross_wpm, 2), round(net_wpm, 2)
+        return calculate_wpm(chars_typed, time_taken, errors)
     def wrap_text(self, text, width=120):  # Increased default width for larger displays
         words = text.split()
         lines = []
@@ -391,17 +2992,58 @@ class TypingTest:
         if current_line:
             lines.append(' '.join(current_line))
         return '\n'.join(lines)
-    def display_typing_interface(self, display_text, typed_text, errors, start_time, current_wpm):
-        self.clear_screen()
-        width = 120  # Increased width for larger displays
-        
-        # Header
-        print(Box.create_box(width, "⌨️  TYPING TEST", 'double', Colors.CYAN))
+    def screen_width(self, limit=120):
+        """Columns a frame may use: the screen's width less one, capped at `limit`."""
+        columns = self.columns or shutil.get_terminal_size((limit + 1, 24)).columns
+        return max(20, min(limit, columns - 1))
+    @staticmethod
+    def break_line(line, width):
+        """Split `line` into rows of at most `width` characters that join back into it.
+
+        Rows break after the last space that fits, so the spaces at each
+        break stay at the end of their row and every typed index keeps a
+        cell on screen; a word longer than `width` is broken where it hits
+        the edge.
+        """
+        rows = []
+        start = 0
+        while len(line) - start > width:
+            end = start + width
+            space = line.rfind(' ', start, end)
+            cut = space + 1 if space > start else end
+            rows.append(line[start:cut])
+            start = cut
+        rows.append(line[start:])
+        return rows
+    def get_layout(self, display_text, width=None):
+        """Return the ParagraphLayout for `display_text`, cached per paragraph and width.
+
+        Lines wider than the terminal are split with break_line.
+        """
+        if width is None:
+            width = self.screen_width()
+        key = (display_text, width)
+        layout = self.layouts.get(key)
+        if layout is not None:
+            layout.reset()
+            return layout
+        rows = []
+        for line in display_text.split('\n'):
+            rows += self.break_line(line, width)
+        # the renderer moves the cursor by absolute row, so a row that wrapped would shift every row below it
+        assert all(len(row) <= width for row in rows)
+        layout = ParagraphLayout(rows)
+        self.layouts[key] = layout
+        return layout
+    def display_typing_interface(self, layout, session, current_wpm):
+        start = time.perf_counter()
+        # the frame is redrawn by absolute row, so no row may be wider than the screen
+        width = self.screen_width()
         
         # Stats bar
-        elapsed = time.time() - start_time if start_time else 0
-        correct_chars = len(typed_text) - errors
-        accuracy = (correct_chars / max(len(typed_text), 1) * 100) if typed_text else 100
+        elapsed = session.elapsed(time.monotonic_ns())
+        errors = session.errors
+        accuracy = session.accuracy()
         
         stats = [
             (f"⚡ WPM: {current_wpm}", Colors.GREEN),
@@ -411,43 +3053,26 @@ class TypingTest:
             (f"⏱️  Time: {elapsed:.1f}s", Colors.CYAN)
         ]
         
-        print(Box.create_bottom(width, 'double', Colors.CYAN))
-        print("\n" + " │ ".join(f"{color}{stat}{Colors.RESET}" for stat, color in stats))
-        print(f"\n{Box.create_box(width, style='single', color=Colors.CYAN)}\n")
-        typed_len = len(typed_text)
-        non_newline_idx = 0
-        out_lines = []
-        current_line = ""
-        for ch in display_text:
-            if ch == '\n':
-                out_lines.append(current_line)
-                current_line = ""
-                continue
-            color_char = None
-            if non_newline_idx < typed_len:
-                typed_char = typed_text[non_newline_idx]
-                if typed_char == ch:
-                    color_char = f"{Colors.GREEN}{ch}{Colors.RESET}"
-                else:
-                    color_char = f"{Colors.RED}{Colors.BOLD}{ch}{Colors.RESET}"
-            elif non_newline_idx == typed_len:
-                color_char = f"{Colors.YELLOW}{Colors.UNDERLINE}{ch}{Colors.RESET}"
-            else:
-                color_char = f"{Colors.GRAY}{ch}{Colors.RESET}"
-            current_line += color_char
-            non_newline_idx += 1
-        out_lines.append(current_line)
-        for ln in out_lines:
-            print(ln)
-        print(f"\n{Box.create_box(width, style='single', color=Colors.CYAN)}")
-        print(f"{Colors.DIM}ESC to quit │ Backspace to correct │ Type to continue{Colors.RESET}")
-        print(Box.create_bottom(width, 'single', Colors.CYAN))
+        # Header
+        rows = Box.create_box(width, "⌨️  TYPING TEST", 'double', Colors.CYAN).split('\n')
+        rows.append(Box.create_bottom(width, 'double', Colors.CYAN))
+        rows += ["", Box.clip(" │ ".join(f"{color}{stat}{Colors.RESET}" for stat, color in stats), width), ""]
+        rows += [Box.create_box(width, style='single', color=Colors.CYAN), ""]
+        # Paragraph rows come straight from the layout; only its dirty rows are diffed
+        top = len(rows)
+        rows += layout.rows
+        dirty = {top + r for r in layout.take_dirty()}
+        rows += ["", Box.create_box(width, style='single', color=Colors.CYAN)]
+        rows.append(Box.clip(f"{Colors.DIM}ESC to quit │ Backspace to correct │ Type to continue{Colors.RESET}", width))
+        rows.append(Box.create_bottom(width, 'single', Colors.CYAN))
+        self.renderer.render(rows, dirty)
+        FRAME_SECONDS.observe(time.perf_counter() - start)
     def run_test_live(self, difficulty):
-        display_text = self.load_text(difficulty)
-        if not display_text:
+        paragraph = self.pick_paragraph(difficulty)
+        if not paragraph:
             return
-        expected_chars = [ch for ch in display_text if ch != '\n']
-        expected_len = len(expected_chars)
+        display_text = paragraph.text
+        self.audio.start()  # loads the click sound while the preview is on screen
         print(f"\n{Colors.GREEN}{Colors.BOLD}Get ready to type!{Colors.RESET}")
         print(f"\n{Colors.CYAN}Difficulty: {difficulty.upper()}{Colors.RESET}")
         print(f"\n{Colors.YELLOW}Paragraph will appear below. Type continuously — you do NOT need to press ENTER at line ends.{Colors.RESET}")
@@ -458,91 +3083,123 @@ class TypingTest:
         for line in display_text.split('\n'):
             print(f"{Colors.GRAY}{line}{Colors.RESET}")
         input(f"\n{Colors.GREEN}Press ENTER when ready...{Colors.RESET}")
-        typed_text = ""
-        errors = 0
-        start_time = None
-        current_wpm = 0
-        last_update = 0
+        session = TypingSession(display_text.replace('\n', ''), log=KeystrokeLog())
+        TESTS_STARTED.inc()
+        layout = self.get_layout(display_text)
+        profile = self.profile
+        if profile is not None:
+            profile.reset()
+            self.terminal.profile = profile
         self.hide_cursor()
+        self.renderer.invalidate()
         try:
-            while len(typed_text) < expected_len:
-                self.display_typing_interface(display_text, typed_text, errors, start_time, current_wpm)
-                char = None
-                while char is None:
-                    char = self.keyboard.get_char()
-                    time.sleep(0.01)
-                    # Only update WPM every second instead of every 0.5 seconds
-                    if start_time and time.time() - last_update > 1.0:
-                        elapsed = time.time() - start_time
-                        _, current_wpm = self.calculate_wpm(len(typed_text), elapsed, errors)
-                        last_update = time.time()
-                        # Only refresh display when WPM updates
-                        self.display_typing_interface(display_text, typed_text, errors, start_time, current_wpm)
-                if start_time is None and char not in ['\b', '\x1b']:
-                    start_time = time.time()
-                    last_update = start_time
-                if char == '\x1b':
-                    self.show_cursor()
-                    print(f"\n\n{Colors.RED}Test cancelled!{Colors.RESET}")
-                    return
-                if char in ('\b', '\x7f'):
-                    if len(typed_text) > 0:
-                        last_index = len(typed_text) - 1
-                        if typed_text[last_index] != expected_chars[last_index]:
-                            errors = max(0, errors - 1)
-                        typed_text = typed_text[:-1]
-                    continue
-                if char == '\r':
-                    char = '\n'
-                if char == '\n':
-                    char = ' '
-                typed_text += char
-                idx = len(typed_text) - 1
-                if idx < expected_len:
-                    expected_char = expected_chars[idx]
-                    if char != expected_char:
-                        self.play_error_beep()
-                        errors += 1
-                else:
-                    pass
-                # Only update display when character is typed, not on a timer
-                self.display_typing_interface(display_text, typed_text, errors, start_time, current_wpm)
-            self.display_typing_interface(display_text, typed_text, errors, start_time, current_wpm)
-            time.sleep(0.6)
-            end_time = time.time()
-            time_taken = end_time - start_time if start_time else 0
-            raw_wpm, net_wpm = self.calculate_wpm(len(expected_chars), time_taken, errors)
-            accuracy = ((len(expected_chars) - errors) / len(expected_chars) * 100) if len(expected_chars) > 0 else 0
+            with self.terminal:
+                # Sleep in select() until keys arrive, the next WPM tick or a held-back frame is due
+                loop = TypingLoop(self, layout, session, self.max_fps, profile)
+                loop.start()
+                while not loop.done:
+                    loop.step(self.terminal.read_keys(loop.timeout()), self.terminal.woke_ns)
+            if session.cancelled:
+                TESTS_CANCELLED.inc()
+                self.show_cursor()
+                print(f"\n\n{Colors.RED}Test cancelled!{Colors.RESET}")
+                return
+            TESTS_COMPLETED.inc()
+            time.sleep(0.6)     # a beat before the results; not counted in the time (see TypingSession.metrics)
+            result = session.metrics()
+            net_wpm, raw_wpm = result['net_wpm'], result['raw_wpm']
+            accuracy, errors, time_taken = result['accuracy'], result['errors'], result['time_taken']
             self.show_cursor()
             self.display_results(net_wpm, raw_wpm, accuracy, errors, time_taken, difficulty)
-            if self.current_user_id and start_time:
-                self.db.save_result(
-                    self.current_user_id,
-                    net_wpm,
-                    accuracy,
-                    raw_wpm,
-                    errors,
-                    difficulty,
-                    int(time_taken)
-                )
+            if profile is not None:
+                for line in profile.lines():
+                    print(line)
+                try:
+                    profile.save(difficulty=difficulty, paragraph_id=paragraph.id, chars=len(session.expected),
+                                 net_wpm=net_wpm, date=datetime.now().isoformat(timespec='seconds'))
+                    print(f"\n{Colors.GRAY}Profile written to {profile.path}{Colors.RESET}")
+                except OSError as e:
+                    print(f"{Colors.RED}Error writing profile: {e}{Colors.RESET}")
+            if self.username and session.start_ns is not None:
+                self.save_result(self.result_record(result, difficulty, paragraph, session.log))
         except Exception as e:
             self.show_cursor()
             print(f"\n{Colors.RED}Error: {e}{Colors.RESET}")
+        finally:
+            self.terminal.profile = None
+    def apply_key(self, layout, session, key, now_ns):
+        """Feed one key to the session and mirror the outcome in the layout; returns the feed result."""
+        result = session.feed(key, now_ns)
+        if result == TypingSession.BACKSPACE:
+            idx = session.typed_count
+            layout.set_state(idx + 1, ParagraphLayout.PENDING)
+            layout.set_state(idx, ParagraphLayout.CURSOR)
+        elif result in (TypingSession.CORRECT, TypingSession.WRONG):
+            idx = session.typed_count - 1
+            if result == TypingSession.WRONG:
+                self.audio.error()
+                layout.set_state(idx, ParagraphLayout.WRONG)
+            else:
+                layout.set_state(idx, ParagraphLayout.CORRECT)
+            layout.set_state(idx + 1, ParagraphLayout.CURSOR)
+        return result
+    def result_record(self, metrics, difficulty, paragraph, log):
+        """The result dict save_result takes, from a finished session's metrics()."""
+        return {
+            'user_id': self.current_user_id,
+            'username': self.username,
+            'wpm': metrics['net_wpm'],
+            'accuracy': metrics['accuracy'],
+            'raw_wpm': metrics['raw_wpm'],
+            'errors': metrics['errors'],
+            'difficulty': difficulty,
+            'time_taken': int(metrics['time_taken']),
+            'paragraph_id': paragraph.id,
+            'keystrokes': log,
+            'test_date': datetime.now(),
+        }
+    def save_result(self, result):
+        """Hand a finished test to the result writer, or to the journal when offline."""
+        failures = self.writer.take_failures()
+        if failures:
+            print(f"{Colors.RED}{failures} earlier result(s) could not be saved: {self.writer.last_error}{Colors.RESET}")
+        if self.current_user_id and self.writer.submit(result):
+            return
+        try:
+            self.journal.append([result])
+        except OSError as e:
+            RESULTS_FAILED.inc()
+            print(f"{Colors.RED}Your result could not be saved: {e}{Colors.RESET}")
+            return
+        RESULTS_JOURNALED.inc()
+        print(f"{Colors.YELLOW}Result saved offline; it will be uploaded once the database is reachable.{Colors.RESET}")
+    def sync_journal(self):
+        """Upload results saved while offline, if there are any."""
+        synced, remaining = self.journal.sync(self.db)
+        if synced:
+            print(f"{Colors.GREEN}Uploaded {synced} result(s) saved while offline.{Colors.RESET}")
+        if remaining:
+            print(f"{Colors.YELLOW}{remaining} offline result(s) are still waiting to be uploaded.{Colors.RESET}")
     def display_results(self, net_wpm, raw_wpm, accuracy, errors, time_taken, difficulty):
         self.clear_screen()
-        print(f"\n{Colors.GREEN}{Colors.BOLD}╔{'═' * 58}╗{Colors.RESET}")
-        print(f"{Colors.GREEN}{Colors.BOLD}║{' ' * 20}TEST COMPLETE!{' ' * 24}║{Colors.RESET}")
-        print(f"{Colors.GREEN}{Colors.BOLD}╚{'═' * 58}╝{Colors.RESET}\n")
-        print(f"{Colors.CYAN}{Colors.BOLD}Performance Metrics:{Colors.RESET}")
-        print(f"{Colors.CYAN}{'─' * 60}{Colors.RESET}")
-        print(f"  {Colors.BOLD}Net WPM:{Colors.RESET}           {Colors.GREEN}{Colors.BOLD}{net_wpm}{Colors.RESET}")
-        print(f"  {Colors.BOLD}Raw WPM:{Colors.RESET}           {raw_wpm}")
-        print(f"  {Colors.BOLD}Accuracy:{Colors.RESET}          {Colors.GREEN if accuracy >= 90 else Colors.YELLOW if accuracy >= 75 else Colors.RED}{accuracy:.2f}%{Colors.RESET}")
-        print(f"  {Colors.BOLD}Errors:{Colors.RESET}            {Colors.RED}{errors}{Colors.RESET}")
-        print(f"  {Colors.BOLD}Time:{Colors.RESET}              {time_taken:.2f} seconds")
-        print(f"  {Colors.BOLD}Difficulty:{Colors.RESET}        {difficulty.upper()}")
+        for line in self.results_lines(net_wpm, raw_wpm, accuracy, errors, time_taken, difficulty):
+            print(line)
+    def results_lines(self, net_wpm, raw_wpm, accuracy, errors, time_taken, difficulty):
         rating = self.get_rating(net_wpm, accuracy)
-        print(f"\n{Colors.YELLOW}{Colors.BOLD}Rating: {rating}{Colors.RESET}\n")
+        return [
+            f"\n{Colors.GREEN}{Colors.BOLD}╔{'═' * 58}╗{Colors.RESET}",
+            f"{Colors.GREEN}{Colors.BOLD}║{' ' * 20}TEST COMPLETE!{' ' * 24}║{Colors.RESET}",
+            f"{Colors.GREEN}{Colors.BOLD}╚{'═' * 58}╝{Colors.RESET}\n",
+            f"{Colors.CYAN}{Colors.BOLD}Performance Metrics:{Colors.RESET}",
+            f"{Colors.CYAN}{'─' * 60}{Colors.RESET}",
+            f"  {Colors.BOLD}Net WPM:{Colors.RESET}           {Colors.GREEN}{Colors.BOLD}{net_wpm}{Colors.RESET}",
+            f"  {Colors.BOLD}Raw WPM:{Colors.RESET}           {raw_wpm}",
+            f"  {Colors.BOLD}Accuracy:{Colors.RESET}          {Colors.GREEN if accuracy >= 90 else Colors.YELLOW if accuracy >= 75 else Colors.RED}{accuracy:.2f}%{Colors.RESET}",
+            f"  {Colors.BOLD}Errors:{Colors.RESET}            {Colors.RED}{errors}{Colors.RESET}",
+            f"  {Colors.BOLD}Time:{Colors.RESET}              {time_taken:.2f} seconds",
+            f"  {Colors.BOLD}Difficulty:{Colors.RESET}        {difficulty.upper()}",
+            f"\n{Colors.YELLOW}{Colors.BOLD}Rating: {rating}{Colors.RESET}\n",
+        ]
     def get_rating(self, wpm, accuracy):
         if wpm >= 80 and accuracy >= 95:
             return "⭐⭐⭐⭐⭐ EXCELLENT!"
@@ -555,19 +3212,44 @@ class TypingTest:
         else:
             return "⭐ NEEDS IMPROVEMENT!"
     def display_leaderboard(self, difficulty=None):
-        self.clear_screen()
+        """Show the leaderboard a page at a time; N/P move between pages, ENTER returns."""
         width = 120  # Increased width for larger displays
+        page_size = 20
         title = f"🏆 {'GLOBAL' if not difficulty else difficulty.upper()} LEADERBOARD 🏆"
-        print(f"\n{Colors.YELLOW}{Colors.BOLD}╔{'═' * (width-2)}╗{Colors.RESET}")
-        print(f"{Colors.YELLOW}{Colors.BOLD}║{title.center(width-2)}║{Colors.RESET}")
-        print(f"{Colors.YELLOW}{Colors.BOLD}╚{'═' * (width-2)}╝{Colors.RESET}\n")
-        leaderboard = self.db.get_leaderboard(difficulty, 20)
-        if not leaderboard:
-            print(f"{Colors.RED}No data available yet. Be the first to take a test!{Colors.RESET}\n")
-            return
-        print(f"{Colors.CYAN}{Colors.BOLD}{'#':<6}{'Username':<30}{'WPM':<15}{'Accuracy':<15}{'Date':<25}{'Difficulty':<15}{Colors.RESET}")
-        print(f"{Colors.CYAN}{'─' * width}{Colors.RESET}")
-        for idx, (username, wpm, accuracy, test_date, diff) in enumerate(leaderboard, 1):
+        self.writer.flush()  # include results still waiting to be written
+        pages = [None]  # the `after` row each visited page starts from
+        while True:
+            self.clear_screen()
+            print(f"\n{Colors.YELLOW}{Colors.BOLD}╔{'═' * (width-2)}╗{Colors.RESET}")
+            print(f"{Colors.YELLOW}{Colors.BOLD}║{title.center(width-2)}║{Colors.RESET}")
+            print(f"{Colors.YELLOW}{Colors.BOLD}╚{'═' * (width-2)}╝{Colors.RESET}\n")
+            leaderboard = self.db.get_leaderboard_page(difficulty, page_size, pages[-1])
+            if not leaderboard and len(pages) == 1:
+                print(f"{Colors.RED}No data available yet. Be the first to take a test!{Colors.RESET}\n")
+                return
+            for line in self.leaderboard_table(leaderboard, (len(pages) - 1) * page_size + 1, width):
+                print(line)
+            if self.current_user_id:
+                # ranks players by their best result, while the board lists results, so it is always shown
+                rank = self.db.get_user_rank(self.current_user_id, difficulty)
+                if rank is not None:
+                    print(f"{Colors.YELLOW}Your best ranks #{rank} among players{Colors.RESET}\n")
+            has_next = len(leaderboard) == page_size
+            choices = (["N = next page"] if has_next else []) + (["P = previous page"] if len(pages) > 1 else [])
+            cmd = input(f"{Colors.YELLOW}{' · '.join(choices + ['ENTER to continue'])}: {Colors.RESET}").strip().lower()
+            if cmd == 'n' and has_next:
+                pages.append(leaderboard[-1])
+            elif cmd == 'p' and len(pages) > 1:
+                pages.pop()
+            elif not cmd:
+                return
+    def leaderboard_table(self, leaderboard, first, width=120):
+        """Lines of the leaderboard table for a page of rows numbered from `first`."""
+        lines = [
+            f"{Colors.CYAN}{Colors.BOLD}{'#':<6}{'Username':<30}{'WPM':<15}{'Accuracy':<15}{'Date':<25}{'Difficulty':<15}{Colors.RESET}",
+            f"{Colors.CYAN}{'─' * width}{Colors.RESET}",
+        ]
+        for idx, (username, wpm, accuracy, test_date, diff, _) in enumerate(leaderboard, first):
             medal = ""
             if idx == 1:
                 medal = "🥇"
@@ -577,34 +3259,43 @@ class TypingTest:
                 medal = "🥉"
             highlight = Colors.GREEN if username == self.username else Colors.WHITE
             date_str = test_date.strftime("%Y-%m-%d %H:%M")
-            print(f"{highlight}{idx:<6}{username:<30}{wpm:<15.2f}{accuracy:<14.2f}%{date_str:<25}{diff:<15}{medal}{Colors.RESET}")
-        print(f"\n{Colors.CYAN}{'─' * width}{Colors.RESET}\n")
-        if self.current_user_id:
-            rank = self.db.get_user_rank(self.current_user_id, difficulty)
-            if rank and rank > 20:
-                print(f"{Colors.YELLOW}Your rank: #{rank}{Colors.RESET}\n")
+            lines.append(f"{highlight}{idx:<6}{username:<30}{wpm:<15.2f}{accuracy:<14.2f}%{date_str:<25}{diff:<15}{medal}{Colors.RESET}")
+        lines.append(f"\n{Colors.CYAN}{'─' * width}{Colors.RESET}\n")
+        return lines
     def display_user_stats(self):
         if not self.current_user_id:
             return
-        stats = self.db.get_user_stats(self.current_user_id)
+        self.writer.flush()
+        detail = self.db.get_user_stats_detail(self.current_user_id)
+        stats = detail.get('all')
         if not stats:
             print(f"{Colors.RED}No statistics available yet. Take a test first!{Colors.RESET}\n")
             return
-        total_tests, avg_wpm, best_wpm, avg_accuracy, best_accuracy = stats
         self.clear_screen()
         print(f"\n{Colors.MAGENTA}{Colors.BOLD}╔{'═' * 58}╗{Colors.RESET}")
         print(f"{Colors.MAGENTA}{Colors.BOLD}║{' ' * 18}YOUR STATISTICS{' ' * 25}║{Colors.RESET}")
         print(f"{Colors.MAGENTA}{Colors.BOLD}╚{'═' * 58}╝{Colors.RESET}\n")
         print(f"{Colors.CYAN}{Colors.BOLD}Username:{Colors.RESET} {self.username}")
         print(f"{Colors.CYAN}{'─' * 60}{Colors.RESET}")
-        print(f"  {Colors.BOLD}Total Tests:{Colors.RESET}       {total_tests}")
-        print(f"  {Colors.BOLD}Average WPM:{Colors.RESET}       {avg_wpm:.2f}")
-        print(f"  {Colors.BOLD}Best WPM:{Colors.RESET}          {Colors.GREEN}{best_wpm:.2f}{Colors.RESET}")
-        print(f"  {Colors.BOLD}Average Accuracy:{Colors.RESET}  {avg_accuracy:.2f}%")
-        print(f"  {Colors.BOLD}Best Accuracy:{Colors.RESET}     {Colors.GREEN}{best_accuracy:.2f}%{Colors.RESET}")
+        print(f"  {Colors.BOLD}Total Tests:{Colors.RESET}       {stats['tests']}")
+        print(f"  {Colors.BOLD}Average WPM:{Colors.RESET}       {stats['avg_wpm']:.2f} (± {stats['stddev_wpm']:.2f})")
+        print(f"  {Colors.BOLD}Best WPM:{Colors.RESET}          {Colors.GREEN}{stats['best_wpm']:.2f}{Colors.RESET}")
+        print(f"  {Colors.BOLD}Average Accuracy:{Colors.RESET}  {stats['avg_accuracy']:.2f}%")
+        print(f"  {Colors.BOLD}Best Accuracy:{Colors.RESET}     {Colors.GREEN}{stats['best_accuracy']:.2f}%{Colors.RESET}")
+        trend = stats['trend']
+        trend_color = Colors.GREEN if trend >= 0 else Colors.RED
+        print(f"  {Colors.BOLD}Recent Trend:{Colors.RESET}      {trend_color}{trend:+.2f} WPM{Colors.RESET} "
+              f"{Colors.DIM}(last {len(stats['recent_wpm'])} tests vs. your average){Colors.RESET}")
         rank = self.db.get_user_rank(self.current_user_id)
         if rank:
             print(f"  {Colors.BOLD}Global Rank:{Colors.RESET}       {Colors.YELLOW}#{rank}{Colors.RESET}")
+        print(f"\n{Colors.CYAN}{Colors.BOLD}{'Difficulty':<12}{'Tests':<8}{'Avg WPM':<10}{'± SD':<8}{'Best WPM':<10}{'Avg Acc':<10}{'Trend':<8}{Colors.RESET}")
+        print(f"{Colors.CYAN}{'─' * 66}{Colors.RESET}")
+        for diff in ('easy', 'medium', 'hard', 'extreme'):
+            d = detail.get(diff)
+            if d:
+                print(f"  {diff.capitalize():<10}{d['tests']:<8}{d['avg_wpm']:<10.2f}{d['stddev_wpm']:<8.2f}"
+                      f"{d['best_wpm']:<10.2f}{d['avg_accuracy']:<9.2f}%{d['trend']:+.2f}")
         print()
     def clear_history(self):
         """Prompt the user to confirm and clear their test history (all test_results rows).
@@ -615,7 +3306,7 @@ class TypingTest:
             print(f"{Colors.RED}No user logged in. Please login first.{Colors.RESET}")
             time.sleep(1)
             return
-        if not self.db.connection:
+        if not self.db.connected:
             if not self.db.connect():
                 print(f"{Colors.RED}Unable to connect to database. Try again later.{Colors.RESET}")
                 time.sleep(1)
@@ -625,6 +3316,7 @@ class TypingTest:
             print(f"{Colors.RED}Confirmation failed — history not cleared.{Colors.RESET}")
             time.sleep(1)
             return
+        self.writer.flush()  # don't let queued results land after the delete
         deleted = self.db.delete_user_results(self.current_user_id)
         if deleted >= 0:
             print(f"{Colors.GREEN}Successfully deleted {deleted} test result(s) from your history.{Colors.RESET}")
@@ -648,15 +3340,7 @@ class TypingTest:
             # Menu options with improved styling
             print(f"\n{Colors.BOLD}📝 Menu Options:{Colors.RESET}\n")
             
-            options = [
-                ("🎯 Start Typing Test", Colors.GREEN),
-                ("🏆 View Leaderboard", Colors.YELLOW),
-                ("📊 View Your Statistics", Colors.MAGENTA),
-                ("👤 Change Username", Colors.BLUE),
-                ("🗑️  Clear History", Colors.RED),
-                ("📁 Export Results to CSV", Colors.CYAN),
-                ("🚪 Exit", Colors.RED)
-            ]
+            options = self.MAIN_MENU
             
             for idx, (option, color) in enumerate(options, 1):
                 print(f"  {color}{Colors.BOLD}{idx}.{Colors.RESET} {option}")
@@ -690,7 +3374,13 @@ class TypingTest:
                     diff = input(f"{Colors.YELLOW}Filter by difficulty (easy/medium/hard/extreme) or leave blank for ALL: {Colors.RESET}").strip() or None
                     if diff == '':
                         diff = None
-                    self.db.export_results_to_csv(path, difficulty=diff)
+                    user = input(f"{Colors.YELLOW}Filter by username or leave blank for ALL: {Colors.RESET}").strip() or None
+                    since = input(f"{Colors.YELLOW}From date (YYYY-MM-DD) or leave blank: {Colors.RESET}").strip() or None
+                    until = input(f"{Colors.YELLOW}To date (YYYY-MM-DD) or leave blank: {Colors.RESET}").strip() or None
+                    incremental = input(f"{Colors.YELLOW}Only results added since the last export to this file? (y/N): {Colors.RESET}").strip().lower() == 'y'
+                    self.writer.flush()
+                    self.db.export_results_to_csv(path, difficulty=diff, username=user, since=since, until=until,
+                                                  incremental=incremental)
                     input(f"\n{Colors.YELLOW}Press ENTER to continue...{Colors.RESET}")
             elif sel == 6:
                 print(f"\n{Colors.GREEN}Thanks for using Speed Typing Test! Goodbye!{Colors.RESET}\n")
@@ -755,7 +3445,6 @@ class TypingTest:
             return
         if sel in difficulties:
             self.display_leaderboard(difficulties[sel])
-            input(f"\n{Colors.YELLOW}Press ENTER to continue...{Colors.RESET}")
         elif sel == 5:
             return
     def login(self):
@@ -768,12 +3457,13 @@ class TypingTest:
             print(f"{Colors.RED}Username cannot be empty!{Colors.RESET}")
             time.sleep(1)
             return
-        if not self.db.connection:
+        if not self.db.connected:
             if not self.db.connect():
                 print(f"{Colors.RED}Unable to connect to database. Starting in offline mode.{Colors.RESET}")
+                print(f"{Colors.YELLOW}Results will be kept on this machine and uploaded later.{Colors.RESET}")
                 time.sleep(1)
                 self.current_user_id = None
-                self.username = "Guest"
+                self.username = username
                 return
         if self.db.create_tables():
             user_id = self.db.get_or_create_user(username)
@@ -781,6 +3471,7 @@ class TypingTest:
                 self.current_user_id = user_id
                 self.username = username
                 print(f"\n{Colors.GREEN}Welcome, {username}!{Colors.RESET}")
+                self.sync_journal()
                 time.sleep(1)
             else:
                 print(f"{Colors.RED}Error creating or fetching user.{Colors.RESET}")
@@ -790,8 +3481,13 @@ class TypingTest:
         print(f"\n{Colors.CYAN}{Colors.BOLD}Welcome to the Ultimate Speed Typing Test!{Colors.RESET}")
         print(f"{Colors.GRAY}-------------------------------------------{Colors.RESET}")
         input(f"\n{Colors.GREEN}Press ENTER to continue...{Colors.RESET}")
-        self.login()
-        self.main_menu()
+        try:
+            self.login()
+            self.main_menu()
+        finally:
+            self.writer.close()
+            self.journal.close()
+            self.audio.close()
 
     def select_menu_interactive(self, options, title=None, footer=None, start_index=0, show_cancel=True):
         """Display a simple interactive menu where user can use Up/Down arrow keys and Enter to select.
@@ -804,79 +3500,143 @@ class TypingTest:
         current = max(0, min(start_index, len(labels)-1))
         try:
             self.hide_cursor()
-            while True:
-                self.clear_screen()
-                width = 100
-                if title:
-                    print(Box.create_box(width, title, 'double', Colors.CYAN))
-                    print(Box.create_bottom(width, 'double', Colors.CYAN))
-                print()
-                for i, lbl in enumerate(labels):
-                    prefix = '  '
-                    if i == current:
-                        # reverse video for highlight
-                        print(f"{prefix}\033[7m{Colors.BOLD}{lbl}{Colors.RESET}\033[0m")
-                    else:
-                        print(f"{prefix}{lbl}")
-                if footer:
-                    print(f"\n{footer}")
-                if show_cancel:
-                    print(f"\n{Colors.DIM}Use ↑/↓ arrows to navigate · Enter to select · Esc to cancel{Colors.RESET}")
-                else:
-                    print(f"\n{Colors.DIM}Use ↑/↓ arrows to navigate · Enter to select{Colors.RESET}")
-
-                # read a key
-                if os.name == 'nt':
-                    key = msvcrt.getch()
-                    if key == b'\xe0':
-                        key2 = msvcrt.getch()
-                        if key2 == b'H':  # up
+            self.renderer.invalidate()
+            with self.terminal:
+                while True:
+                    self.renderer.render(self.menu_frame(labels, current, title, footer, show_cancel))
+                    for key in self.terminal.read_keys():
+                        if key == Keys.UP:
                             current = (current - 1) % len(labels)
-                            continue
-                        elif key2 == b'P':  # down
+                        elif key == Keys.DOWN:
                             current = (current + 1) % len(labels)
-                            continue
-                        else:
-                            continue
-                    elif key == b'\r':
-                        return current
-                    elif key == b'\x1b':
-                        return None
-                    else:
-                        # ignore other keys
-                        continue
-                else:
-                    # Unix-like: read escape sequences
-                    fd = sys.stdin.fileno()
-                    old_settings = termios.tcgetattr(fd)
-                    try:
-                        tty.setraw(fd)
-                        ch = sys.stdin.read(1)
-                        if ch == '\x1b':
-                            # possible arrow
-                            seq = sys.stdin.read(2)
-                            if seq == '[A':
-                                current = (current - 1) % len(labels)
-                                continue
-                            elif seq == '[B':
-                                current = (current + 1) % len(labels)
-                                continue
-                            else:
-                                return None
-                        elif ch == '\r' or ch == '\n':
+                        elif key == Keys.ENTER:
                             return current
-                        else:
-                            continue
-                    finally:
-                        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+                        elif key == Keys.ESCAPE:
+                            return None
         finally:
+            # leave the cursor below the menu for whatever gets printed next
+            print(f"\033[{len(self.renderer.previous or []) + 1};1H", end='')
             self.show_cursor()
+    def menu_frame(self, labels, current, title=None, footer=None, show_cancel=True):
+        """Build the rows of an interactive menu with `current` highlighted."""
+        width = self.screen_width(100)
+        rows = []
+        if title:
+            rows += Box.create_box(width, title, 'double', Colors.CYAN).split('\n')
+            rows.append(Box.create_bottom(width, 'double', Colors.CYAN))
+        rows.append("")
+        for i, lbl in enumerate(labels):
+            prefix = '  '
+            if i == current:
+                # reverse video for highlight
+                rows.append(f"{prefix}\033[7m{Colors.BOLD}{lbl}{Colors.RESET}\033[0m")
+            else:
+                rows.append(f"{prefix}{lbl}")
+        if footer:
+            rows += ["", *footer.split('\n')]
+        rows.append("")
+        if show_cancel:
+            rows.append(f"{Colors.DIM}Use ↑/↓ arrows to navigate · Enter to select · Esc to cancel{Colors.RESET}")
+        else:
+            rows.append(f"{Colors.DIM}Use ↑/↓ arrows to navigate · Enter to select{Colors.RESET}")
+        return [Box.clip(row, width) for row in rows]
 
-if __name__ == "__main__":
+def dump_metrics(path):
+    """Write the current metrics in the Prometheus text format to `path`, or stdout for '-'."""
+    text = METRICS.render()
+    if path == '-':
+        sys.stdout.write(text)
+        return
+    try:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    except OSError as e:
+        print(f"{Colors.RED}Error writing metrics: {e}{Colors.RESET}")
+
+def main(argv=None):
+    enable_ansi_colors()
+    parser = argparse.ArgumentParser(description="Speed typing test")
+    parser.add_argument('--rebuild-user-best', action='store_true',
+                        help="recompute the per-user best scores used for ranking, then exit")
+    parser.add_argument('--verify-stats', action='store_true',
+                        help="check the per-user statistics rollups against test_results, then exit")
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help="recompute the per-user statistics rollups from test_results, then exit")
+    parser.add_argument('--import-csv', metavar='PATH',
+                        help="bulk-load results from a CSV written by the export (may be .gz), then exit")
+    parser.add_argument('--sync-journal', action='store_true',
+                        help="upload results saved while the database was unreachable, then exit")
+    parser.add_argument('--profile', nargs='?', const=LatencyProfile.DEFAULT_PATH, metavar='PATH',
+                        help="time each stage from keypress to frame and write the profile to PATH "
+                             "(also enabled by TYPING_PROFILE)")
+    # a string default goes through type=int too, so a bad TYPING_METRICS_PORT is a usage error
+    parser.add_argument('--metrics-port', type=int, default=os.environ.get('TYPING_METRICS_PORT', '0'),
+                        metavar='PORT', help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics "
+                                             "(default TYPING_METRICS_PORT)")
+    parser.add_argument('--metrics-dump', metavar='PATH',
+                        help="write a snapshot of the metrics to PATH ('-' for stdout) on exit")
+    parser.add_argument('--max-fps', type=float, default=RenderScheduler.DEFAULT_FPS,
+                        help="most typing-test frames drawn per second; 0 draws one per keypress "
+                             f"(default {RenderScheduler.DEFAULT_FPS})")
+    args = parser.parse_args(argv)
+    if not 0 <= args.metrics_port <= 65535:
+        parser.error(f"--metrics-port must be between 0 and 65535, not {args.metrics_port}")
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    if args.metrics_dump:
+        atexit.register(dump_metrics, args.metrics_dump)
+    if args.sync_journal:
+        db = open_database()
+        if not db.connect() or not db.create_tables():
+            return 1
+        journal = ResultJournal()
+        synced, remaining = journal.sync(db)
+        db.close()
+        print(f"{Colors.GREEN}Synced {synced} journaled result(s), {remaining} left{Colors.RESET}")
+        return 0 if remaining == 0 else 1
+    if args.import_csv:
+        db = open_database()
+        if not db.connect() or not db.create_tables():
+            return 1
+        result = db.import_results_from_csv(args.import_csv)
+        db.close()
+        return 0 if result is not None else 1
+    if args.verify_stats or args.rebuild_stats:
+        db = open_database()
+        if not db.connect() or not db.create_tables():
+            return 1
+        mismatched = db.check_user_stats(repair=args.rebuild_stats)
+        db.close()
+        if mismatched < 0:
+            return 1
+        if args.rebuild_stats:
+            print(f"{Colors.GREEN}Rebuilt user_stats: {mismatched} rollup rows corrected{Colors.RESET}")
+            return 0
+        color = Colors.GREEN if mismatched == 0 else Colors.RED
+        print(f"{color}user_stats: {mismatched} rollup rows out of date{Colors.RESET}")
+        return 0 if mismatched == 0 else 1
+    if args.rebuild_user_best:
+        db = open_database()
+        if not db.connect() or not db.create_tables():
+            return 1
+        rows = db.rebuild_user_best()
+        db.close()
+        if rows < 0:
+            return 1
+        print(f"{Colors.GREEN}Rebuilt user_best: {rows} rows{Colors.RESET}")
+        return 0
     try:
         app = TypingTest()
+        app.max_fps = args.max_fps
+        profile = LatencyProfile(args.profile) if args.profile else LatencyProfile.from_env()
+        if profile is not None:
+            app.enable_profile(profile)
         app.start()
     except KeyboardInterrupt:
         print(f"\n{Colors.RED}Program exited by user.{Colors.RESET}")
     except Exception as e:
-        print(f"\n{Colors.RED}Unexpected error: {e}{Colors.RESET}")
\ No newline at end of file
+        print(f"\n{Colors.RED}Unexpected error: {e}{Colors.RESET}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())